@@ -0,0 +1,104 @@
+"""Foydalanuvchilarni ishga tushishda yuklash vaqti: users.json va users.bin (mmap).
+
+Foydalanish (repozitoriya ildizidan):
+    python benchmarks/bench_cold_start.py [foydalanuvchilar_soni ...]   # standart: 100000 1000000 5000000
+
+Har bir o‘lcham uchun maʼlumotlar katalogi bir marta tayyorlanadi: users.json,
+balance_snapshot.json, users.bin (jurnal seq i bilan) va LEDGER_TAIL qatorli
+balans jurnali dumi. So‘ng har bir format alohida jarayonda haqiqiy JsonStore
+sifatida ochiladi (balans jurnalini tiklash ham o‘lchanadi): ochish vaqti, shu
+paytgacha decode qilingan yozuvlar, 1000 ta tasodifiy foydalanuvchini o‘qish va
+kod bo‘yicha qidirish vaqti hamda maksimal RSS (Linux VmHWM). 5M foydalanuvchi
+uchun fayllarni tayyorlash bir necha daqiqa oladi.
+"""
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="winwin-bench-"))
+
+import bot  # noqa: E402
+
+LEDGER_TAIL = 5000  # compaction oralig‘ining (LEDGER_COMPACT_EVERY) yarmi – o‘rtacha holat
+
+PROBE = r"""
+import os, sys, time
+sys.path.insert(0, {root!r})
+import bot
+fmt, data_dir, probe_file = sys.argv[1:4]
+probe_ids = [int(line) for line in open(probe_file)]
+os.chdir(data_dir)
+started = time.perf_counter()
+store = bot.JsonStore(users_format=fmt)
+opened = time.perf_counter()
+decoded = len(store.users.ids)
+for uid in probe_ids:
+    user = store.get_user(uid)
+    store.find_user_by_code(user["withdraw_code"])
+probed = time.perf_counter()
+# VmHWM, ru_maxrss emas: u fork paytidagi ota jarayon RSS ini ham meros qilib oladi
+rss = next(int(line.split()[1]) for line in open("/proc/self/status") if line.startswith("VmHWM")) / 1024
+print(f"{{opened - started:.3f}} {{decoded}} {{probed - opened:.3f}} {{rss:.0f}}")
+"""
+
+
+def make_table(n: int) -> "bot.UserTable":
+    rng = random.Random(1)
+    ids = rng.sample(range(100_000_000, 7_000_000_000), n)
+    codes = rng.sample(range(bot.CODE_SPACE), n)
+    table = bot.UserTable()
+    for i, (uid, code) in enumerate(zip(ids, codes)):
+        table[uid] = {
+            "balance": rng.choice((0, 1000, 3000, 15000)),
+            "referred_by": ids[rng.randrange(i)] if i and rng.random() < 0.3 else None,
+            "referrals": rng.randrange(5),
+            "start_bonus_given": rng.random() < 0.8,
+            "withdraw_code": f"{code:07d}",
+        }
+    return table
+
+
+def write_data_dir(table: "bot.UserTable", data_dir: str):
+    """Barqaror holatdagi maʼlumotlar katalogi: snapshot seq=base, undan keyin LEDGER_TAIL ta yozuv."""
+    base_seq = 100_000
+    table.ledger_seq = base_seq
+    bot.atomic_write_chunks(os.path.join(data_dir, "users.json"), table.iter_json())
+    bot.atomic_write_chunks(os.path.join(data_dir, "users.bin"), table.iter_binary(), binary=True)
+    bot.atomic_write_json(os.path.join(data_dir, "balance_snapshot.json"), {"seq": base_seq, "balances": table.balances()})
+    rng = random.Random(3)
+    with open(os.path.join(data_dir, "balance_ledger.log"), "w", encoding="utf-8") as f:
+        for seq in range(base_seq + 1, base_seq + LEDGER_TAIL + 1):
+            f.write(f'[{seq},{rng.choice(table.ids)},2500,"referral",0]\n')
+
+
+def probe(fmt: str, data_dir: str):
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(root=ROOT), fmt, data_dir, os.path.abspath("probe_ids.txt")],
+        cwd=tempfile.mkdtemp(prefix="winwin-probe-"), check=True, capture_output=True, text=True,
+    ).stdout.split()
+    open_s, decoded, probe_s, rss = out
+    return float(open_s), int(decoded), float(probe_s), float(rss)
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000, 5_000_000]
+    print(f"{'users':>9} {'format':>7} {'fayl MiB':>9} {'ochish s':>9} {'decode':>8} {'1000 so‘rov s':>14} {'max RSS MiB':>12}")
+    for n in sizes:
+        data_dir = tempfile.mkdtemp(prefix="winwin-data-")
+        table = make_table(n)
+        write_data_dir(table, data_dir)
+        with open("probe_ids.txt", "w") as f:
+            f.writelines(f"{uid}\n" for uid in random.Random(7).sample(table.ids, 1000))
+        del table
+        for fmt, name in (("json", "users.json"), ("binary", "users.bin")):
+            open_s, decoded, probe_s, rss = probe(fmt, data_dir)
+            size = os.path.getsize(os.path.join(data_dir, name)) / 2**20
+            print(f"{n:>9} {fmt:>7} {size:>9.1f} {open_s:>9.3f} {decoded:>8} {probe_s:>14.3f} {rss:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Foydalanuvchilar xotirada qancha joy egallashini o‘lchaydi: lug‘atlar va UserTable.
+
+Foydalanish (repozitoriya ildizidan):
+    python benchmarks/bench_memory.py [foydalanuvchilar_soni]
+
+Natija — bitta foydalanuvchiga to‘g‘ri keladigan bayt (tracemalloc bo‘yicha).
+"""
+import gc
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="winwin-bench-"))
+
+import bot  # noqa: E402
+
+
+def make_users(n: int):
+    rng = random.Random(1)
+    ids = rng.sample(range(100_000_000, 7_000_000_000), n)
+    codes = rng.sample(range(bot.CODE_SPACE), n)
+    for i, (uid, code) in enumerate(zip(ids, codes)):
+        yield str(uid), {
+            "balance": rng.choice((0, 1000, 3000, 15000)),
+            "referred_by": ids[rng.randrange(i)] if i and rng.random() < 0.3 else None,
+            "referrals": rng.randrange(5),
+            "start_bonus_given": rng.random() < 0.8,
+            "withdraw_code": f"{code:07d}",
+        }
+
+
+def measure(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del obj
+    return used
+
+
+def build_dicts(n: int):
+    # Avvalgi JsonStore: {str(uid): dict} + withdraw_code -> uid indeksi
+    users = dict(make_users(n))
+    code_index = {u["withdraw_code"]: uid for uid, u in users.items()}
+    return users, code_index
+
+
+def build_table(n: int):
+    table = bot.UserTable()
+    for uid, record in make_users(n):
+        table[uid] = record
+    return table
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    dicts = measure(lambda: build_dicts(n))
+    table = measure(lambda: build_table(n))
+    print(f"{n} ta foydalanuvchi")
+    print(f"lug‘atlar + kod indeksi: {dicts / n:7.1f} bayt/foydalanuvchi ({dicts / 2**20:.1f} MiB)")
+    print(f"UserTable:               {table / n:7.1f} bayt/foydalanuvchi ({table / 2**20:.1f} MiB)")
+    print(f"Tejash: {dicts / table:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
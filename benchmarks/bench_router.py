@@ -0,0 +1,94 @@
+"""Callback yo‘naltirish narxini solishtirish: eski regex handlerlar ro‘yxati va CallbackRouter.
+
+Foydalanish (repozitoriya ildizidan):
+    python benchmarks/bench_router.py [takrorlar_soni]
+
+Bot fayllari vaqtinchalik papkada yaratiladi, ishchi ma'lumotlarga tegilmaydi.
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="winwin-bench-"))
+
+import bot  # noqa: E402
+from telegram import CallbackQuery, Chat, Message, Update, User  # noqa: E402
+from telegram.ext import CallbackQueryHandler  # noqa: E402
+
+# Router kiritilishidan oldingi handlerlar ro‘yxati (tartibi bilan)
+LEGACY_PATTERNS = [
+    r"^(show_games|games_page_\d+)$",
+    "^game_",
+    "^earn$",
+    "^balance$",
+    "^withdraw$",
+    "^main_menu$",
+    "^(admin_remove_list|admin_edit_list|admin_stats|admin_close|admin_back|confirm_remove|broadcast_stop)$"
+    r"|^remove_[0-9a-z]+$|^edit_[0-9a-z]+$|^admin_page_(remove|edit)_\d+$",
+]
+
+SAMPLE = [
+    "show_games", "game_1", "game_2a", "games_page_1", "earn", "balance", "withdraw",
+    "main_menu", "admin_stats", "admin_back", "remove_3", "edit_4", "admin_page_edit_2",
+]
+
+
+async def _noop(update, context):
+    return None
+
+
+def make_update(data: str) -> Update:
+    user = User(id=42, first_name="bench", is_bot=False)
+    chat = Chat(id=42, type="private")
+    message = Message(message_id=1, date=datetime.now(timezone.utc), chat=chat)
+    query = CallbackQuery(id="1", from_user=user, chat_instance="1", data=data, message=message)
+    return Update(update_id=1, callback_query=query)
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    app = bot.build_application()
+    conversations = [h for h in app.handlers[0] if not isinstance(h, CallbackQueryHandler)]
+    legacy = conversations + [CallbackQueryHandler(_noop, pattern=p) for p in LEGACY_PATTERNS]
+    router = bot.build_callback_router()
+    updates = [make_update(d) for d in SAMPLE]
+
+    def legacy_dispatch(update):
+        for handler in legacy:
+            check = handler.check_update(update)
+            if check is not None and check is not False:
+                return handler
+        return None
+
+    def router_dispatch(update):
+        # Konversatsiyalar baribir birinchi tekshiriladi, keyin bitta lug‘at qidiruvi
+        for handler in conversations:
+            check = handler.check_update(update)
+            if check is not None and check is not False:
+                return handler
+        return router.resolve(update.callback_query.data)
+
+    results = {}
+    for name, dispatch in (("regex handlerlar", legacy_dispatch), ("CallbackRouter", router_dispatch)):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for update in updates:
+                dispatch(update)
+        elapsed = time.perf_counter() - started
+        results[name] = elapsed / (rounds * len(updates)) * 1e6
+        print(f"{name:18s} {results[name]:7.2f} µs/callback")
+    print(f"Tezlashish: {results['regex handlerlar'] / results['CallbackRouter']:.2f}x")
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for data in SAMPLE:
+            router.resolve(data)
+    print(f"Faqat router.resolve: {(time.perf_counter() - started) / (rounds * len(SAMPLE)) * 1e6:.2f} µs/callback")
+
+
+if __name__ == "__main__":
+    main()
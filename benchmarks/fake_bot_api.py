@@ -0,0 +1,136 @@
+"""Lokal soxta Bot API: haqiqiy Telegram o‘rniga yuklama sinovlari uchun.
+
+Bot so‘rovlarini (form-urlencoded) qabul qilib, Telegram javobiga o‘xshash JSON
+qaytaradi va har bir metod bo‘yicha chaqiruvlarni sanaydi. Alohida ishga tushirish:
+
+    python benchmarks/fake_bot_api.py --port 8081 [--latency-ms 20]
+    BOT_API_URL=http://127.0.0.1:8081/bot BOT_TOKEN=1:fake python bot.py
+
+Yoki loadtest.py ichida bir xil event loopda ishlatiladi.
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import time
+from urllib.parse import parse_qsl
+
+MESSAGE_METHODS = {
+    "sendMessage", "sendPhoto", "sendDocument", "editMessageText", "editMessageCaption",
+    "editMessageReplyMarkup", "copyMessage", "forwardMessage",
+}
+
+
+class FakeBotApi:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0,
+                 bot_id: int = 1, username: str = "winwin_fake_bot"):
+        self.host = host
+        self.port = port
+        self.latency = latency_ms / 1000
+        self.bot_id = bot_id
+        self.username = username
+        self.calls = collections.Counter()
+        self.bytes_in = 0
+        self._message_ids = itertools.count(1000)
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def reset(self):
+        self.calls.clear()
+        self.bytes_in = 0
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return {"id": self.bot_id, "is_bot": True, "first_name": "WinWin", "username": self.username}
+        if method in MESSAGE_METHODS:
+            chat_id = int(params.get("chat_id", 0) or 0)
+            message = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": self.bot_id, "is_bot": True, "first_name": "WinWin"},
+            }
+            if "text" in params:
+                message["text"] = params["text"]
+            return message
+        if method == "getUpdates":
+            return []
+        return True
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, target, _ = request_line.decode("latin-1").split(" ", 2)
+                length = 0
+                keep_alive = True
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    name = name.strip().lower()
+                    if name == "content-length":
+                        length = int(value.strip())
+                    elif name == "connection" and value.strip().lower() == "close":
+                        keep_alive = False
+                body = await reader.readexactly(length) if length else b""
+                self.bytes_in += len(body)
+                method = target.rsplit("/", 1)[-1].split("?", 1)[0]
+                self.calls[method] += 1
+                params = dict(parse_qsl(body.decode("utf-8", "replace")))
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                payload = json.dumps({"ok": True, "result": self._result(method, params)}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(payload)}\r\n\r\n".encode()
+                    + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _serve(args):
+    api = FakeBotApi(args.host, args.port, args.latency_ms)
+    await api.start()
+    print(f"Soxta Bot API: {api.base_url}  (BOT_API_URL sifatida bering)")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            if api.calls:
+                print(dict(api.calls))
+    finally:
+        await api.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="har bir javobdan oldingi sun’iy kechikish")
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
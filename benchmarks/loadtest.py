@@ -0,0 +1,250 @@
+"""Oflayn yuklama sinovi: haqiqiy Application va handlerlar + lokal soxta Bot API.
+
+build_application() bilan qurilgan botga sintetik yangilanishlar beriladi
+(PerUserUpdateProcessor orqali, xuddi polling/webhookdagidek). Bot API so‘rovlari
+localhost dagi FakeBotApi ga ketadi. Har bir ssenariy uchun o‘tkazuvchanlik,
+kechikish kvantillari, Bot API chaqiruvlari va diskka yozilgan hajm chiqariladi.
+
+Foydalanish (repozitoriya ildizidan):
+    python benchmarks/loadtest.py [--users 2000] [--backend json|sqlite] [--latency-ms 0]
+                                  [--real-limits] [--scenarios start,browse,balance,admin]
+
+Standart holatda chiquvchi xabar limitlari (GLOBAL_SEND_RATE/CHAT_SEND_RATE) va
+flood himoyasi juda baland qo‘yiladi, shunda botning o‘z quvvati o‘lchanadi;
+--real-limits bilan ishlab chiqarishdagi qiymatlar ishlatiladi.
+"""
+import argparse
+import asyncio
+import glob
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotApi  # noqa: E402
+
+GAMES = 20
+REFERRERS = 10
+MAX_IN_FLIGHT = 1000
+PERSIST_FILES = ("users.json", "games.json", "pending_bonuses.json", "counters.json")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="soxta Bot API javob kechikishi")
+    parser.add_argument("--real-limits", action="store_true", help="chiquvchi limit va flood himoyasini o‘zgartirmaslik")
+    parser.add_argument("--admin-edits", type=int, default=50)
+    parser.add_argument("--scenarios", default="start,browse,balance,admin")
+    return parser.parse_args()
+
+
+async def seed_games(bot):
+    """Katalogni admin qo‘shgandek to‘ldiradi (ikkala backend uchun ham)."""
+    for i in range(GAMES):
+        name = f"Game {i}"
+        bot.games_data[name] = {
+            "name": name, "text": f"<b>{name}</b> tavsifi", "photo_id": None,
+            "file_id": f"file-{i}" if i % 3 == 0 else None,
+            "button_text": "O‘ynash", "button_url": "https://example.com", "views": 0,
+        }
+        await bot.register_game(name, bot.games_data[name])
+        await bot.store.save_game(name, bot.games_data[name])
+    bot.invalidate_catalog_cache()
+
+
+class UpdateFactory:
+    def __init__(self, bot_module, app):
+        self.bot_module = bot_module
+        self.app = app
+        self.update_id = 0
+        self.bot_user = {"id": 1, "is_bot": True, "first_name": "WinWin"}
+
+    def _user(self, uid):
+        return {"id": uid, "is_bot": False, "first_name": f"u{uid}", "username": f"user{uid}"}
+
+    def _next_id(self):
+        self.update_id += 1
+        return self.update_id
+
+    def message(self, uid, text):
+        data = {
+            "update_id": self._next_id(),
+            "message": {
+                "message_id": self.update_id, "date": int(time.time()),
+                "chat": {"id": uid, "type": "private"}, "from": self._user(uid), "text": text,
+            },
+        }
+        if text.startswith("/"):
+            command = text.split(" ", 1)[0]
+            data["message"]["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return self.bot_module.Update.de_json(data, self.app.bot)
+
+    def callback(self, uid, callback_data):
+        data = {
+            "update_id": self._next_id(),
+            "callback_query": {
+                "id": str(self.update_id), "from": self._user(uid), "chat_instance": str(uid),
+                "data": callback_data,
+                "message": {
+                    "message_id": 1, "date": int(time.time()), "chat": {"id": uid, "type": "private"},
+                    "from": self.bot_user, "text": "menyu",
+                },
+            },
+        }
+        return self.bot_module.Update.de_json(data, self.app.bot)
+
+
+def scenario_start(f, users):
+    updates = [f.message(uid, "/start") for uid in range(1, REFERRERS + 1)]
+    rng = random.Random(1)
+    for uid in range(REFERRERS + 1, REFERRERS + 1 + users):
+        updates.append(f.message(uid, f"/start ref_{rng.randint(1, REFERRERS)}"))
+    return updates
+
+
+def scenario_browse(f, users, game_ids):
+    rng = random.Random(2)
+    updates = []
+    for uid in range(1, users + 1):
+        updates += [f.callback(uid, "show_games"), f.callback(uid, "games_page_1"),
+                    f.callback(uid, f"game_{rng.choice(game_ids)}")]
+    return updates
+
+
+def scenario_balance(f, users):
+    updates = []
+    for uid in range(1, users + 1):
+        updates += [f.callback(uid, "balance"), f.callback(uid, "earn")]
+    return updates
+
+
+def scenario_admin(f, admin_id, edits, game_ids):
+    updates = []
+    for i in range(edits):
+        game_id = game_ids[i % len(game_ids)]
+        updates += [f.callback(admin_id, f"edit_{game_id}"), f.callback(admin_id, f"edit_text_{game_id}"),
+                    f.message(admin_id, f"Yangi matn #{i}")]
+    return updates
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def persist_snapshot(bot):
+    sizes = {}
+    for pattern in ("*.json", "*.log*", "*.db*"):
+        for path in glob.glob(pattern):
+            sizes[path] = os.path.getsize(path)
+    writes = {name: h.count for (kind, name), h in bot.perf.histograms.items() if kind == "persist"}
+    return sizes, writes
+
+
+def persist_volume(before, after):
+    """Taxminiy yozilgan baytlar: write-behind fayllar (yozuvlar soni × hajm) + jurnal/SQLite o‘sishi."""
+    (sizes0, writes0), (sizes1, writes1) = before, after
+    total = 0
+    for name in PERSIST_FILES:
+        total += (writes1.get(name, 0) - writes0.get(name, 0)) * sizes1.get(name, 0)
+    for path, size in sizes1.items():
+        if path not in PERSIST_FILES and not path.endswith(".tmp"):
+            total += max(0, size - sizes0.get(path, 0))
+    n_writes = sum(writes1.values()) - sum(writes0.values())
+    return total, n_writes
+
+
+async def run_scenario(bot, app, api, name, updates):
+    latencies = []
+    semaphore = asyncio.Semaphore(MAX_IN_FLIGHT)
+
+    async def one(update):
+        async with semaphore:
+            started = time.perf_counter()
+            await app.update_processor.process_update(update, app.process_update(update))
+            latencies.append(time.perf_counter() - started)
+
+    api.reset()
+    before = persist_snapshot(bot)
+    started = time.perf_counter()
+    await asyncio.gather(*(one(u) for u in updates))
+    elapsed = time.perf_counter() - started
+    # Write-behind yozuvlari tugashi uchun bir interval kutiladi (o‘tkazuvchanlikka kirmaydi)
+    await asyncio.sleep(bot.SAVE_INTERVAL_MS / 1000 + bot.LEDGER_FSYNC_MS / 1000 + 0.3)
+    volume, n_writes = persist_volume(before, persist_snapshot(bot))
+    latencies.sort()
+    return {
+        "scenario": name,
+        "updates": len(updates),
+        "seconds": elapsed,
+        "throughput": len(updates) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p95": percentile(latencies, 0.95) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "max": (latencies[-1] if latencies else 0) * 1000,
+        "api_calls": sum(api.calls.values()),
+        "writes": n_writes,
+        "persist_kb": volume / 1024,
+    }
+
+
+def print_report(results):
+    print(f"{'ssenariy':10s} {'upd':>6} {'upd/s':>8} {'p50ms':>7} {'p95ms':>7} {'p99ms':>7} {'maxms':>7} "
+          f"{'api':>6} {'yozuv':>6} {'disk KB':>8}")
+    for r in results:
+        print(f"{r['scenario']:10s} {r['updates']:>6} {r['throughput']:>8.0f} {r['p50']:>7.1f} {r['p95']:>7.1f} "
+              f"{r['p99']:>7.1f} {r['max']:>7.1f} {r['api_calls']:>6} {r['writes']:>6} {r['persist_kb']:>8.1f}")
+
+
+async def main():
+    args = parse_args()
+    os.chdir(tempfile.mkdtemp(prefix="winwin-loadtest-"))
+
+    api = FakeBotApi(latency_ms=args.latency_ms)
+    await api.start()
+    os.environ.update(BOT_TOKEN="1:fake", BOT_API_URL=api.base_url, STORAGE_BACKEND=args.backend)
+    if not args.real_limits:
+        os.environ.update(GLOBAL_SEND_RATE="1000000", CHAT_SEND_RATE="1000000", FLOOD_RATE="1000000",
+                          FLOOD_BURST="1000000", FLOOD_DEDUP_WINDOW="0")
+    import bot  # noqa: E402 – muhit o‘zgaruvchilari o‘rnatilgandan keyin
+    if not args.real_limits:
+        bot.CHAT_SEND_BURST = 1000000
+
+    app = bot.build_application()
+    await app.initialize()
+    await bot.post_init(app)
+    await seed_games(bot)
+    factory = UpdateFactory(bot, app)
+    game_ids = [game["id"] for game in bot.games_data.values()]
+
+    plan = {
+        "start": lambda: scenario_start(factory, args.users),
+        "browse": lambda: scenario_browse(factory, args.users, game_ids),
+        "balance": lambda: scenario_balance(factory, args.users),
+        "admin": lambda: scenario_admin(factory, bot.ADMIN_ID, args.admin_edits, game_ids),
+    }
+    results = []
+    try:
+        for name in args.scenarios.split(","):
+            results.append(await run_scenario(bot, app, api, name, plan[name]()))
+    finally:
+        await bot.post_stop(app)
+        await app.shutdown()
+        await bot.post_shutdown(app)
+        await api.stop()
+
+    print(f"backend={args.backend} users={args.users} api_latency={args.latency_ms}ms "
+          f"concurrency={bot.CONCURRENT_UPDATES} limits={'real' if args.real_limits else 'off'}")
+    print_report(results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
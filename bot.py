@@ -2,20 +2,50 @@ import json
 import logging
 import os
 import asyncio
-import random
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import csv
+import functools
+import gzip
+import hashlib
+import heapq
+import html
+import io
+import itertools
+import mmap
+import multiprocessing
+import queue
+import signal
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
 import traceback
+from array import array
+from collections.abc import MutableMapping
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
 from telegram.ext import (
     Application,
+    ApplicationHandlerStop,
+    BaseRateLimiter,
+    BaseUpdateProcessor,
     CommandHandler,
     CallbackQueryHandler,
     MessageHandler,
     filters,
     ContextTypes,
     ConversationHandler,
+    TypeHandler,
 )
 
 # ------------------- SOZLAMALAR -------------------
@@ -23,12 +53,78 @@ TOKEN = os.environ.get("BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
 ADMIN_ID = 6935090105  # Admin Telegram ID
 DATA_FILE = "games.json"
 USERS_FILE = "users.json"
+USERS_FORMAT = os.environ.get("USERS_FORMAT", "json")  # "binary" – users.bin (mmap, tez ishga tushish)
+USERS_BIN_FILE = "users.bin"
+CLUSTER_WORKERS = int(os.environ.get("CLUSTER_WORKERS", "0"))            # >1 bo‘lsa klaster rejimi (faqat sqlite bilan)
+CLUSTER_WORKER_INDEX = int(os.environ.get("CLUSTER_WORKER_INDEX", "-1"))  # Klaster ichidagi worker raqami (-1 – oddiy jarayon)
+CLUSTER_LEASE_TTL = 15          # Lider lizingi muddati (soniya); har TTL/3 da yangilanadi
+CLUSTER_SYNC_INTERVAL = 1.0     # Lider katalog versiyasini tekshirish oralig‘i (soniya)
+CLUSTER_QUEUE_SIZE = 10000      # Har bir worker navbatidagi maksimal yangilanishlar
+BONUS_POLL_INTERVAL = 5         # Klasterda lider kutilayotgan bonuslarni bazadan o‘qish oralig‘i (soniya)
+# Hali games.json ga yozilmagan ko‘rishlar (sidecar jurnal); klasterda har bir worker uchun alohida
+VIEWS_LOG_FILE = "views.log" if CLUSTER_WORKER_INDEX < 0 else f"views.{CLUSTER_WORKER_INDEX}.log"
+PENDING_BONUS_FILE = "pending_bonuses.json"
+COUNTERS_FILE = "counters.json"  # JSON ombor hisoblagichlari (withdraw kodlari)
 
 REFERRAL_BONUS = 2500        # Har bir taklif uchun bonus
 START_BONUS = 15000          # Startdan keyin beriladigan bonus
+START_BONUS_DELAY = 90       # Start bonusi necha soniyadan keyin beriladi
+BONUS_BATCH_SIZE = 100       # Bir partiyada beriladigan bonuslar soni
+BONUS_RETRY_DELAY = 30       # Bonus berilmasa (store xatosi) birinchi qayta urinishgacha (soniya), keyin ikki barobar
+BONUS_RETRY_MAX_DELAY = 3600 # Qayta urinishlar orasidagi maksimal oraliq (soniya)
+REFERRAL_NOTIFY_WINDOW = float(os.environ.get("REFERRAL_NOTIFY_WINDOW", "5"))  # Shu oraliqdagi takliflar bitta xabarga birlashadi (soniya)
+REFERRAL_NOTIFY_WORKERS = 4  # Taklif bildirishnomalarini yuboruvchi fon vazifalari
+LEADERBOARD_SIZE = 10        # "Top taklifchilar" ro‘yxatidagi o‘rinlar
+LEADERBOARD_REFRESH = 5      # Klasterda boshqa workerlardagi takliflarni bazadan olish oralig‘i (soniya)
+REFERRAL_SYNC_BATCH = 1000   # Bir so‘rovda olinadigan taklif o‘zgarishlari
+REFERRAL_LEVELS = 3          # Daraxtda alohida sanaladigan darajalar (1 – bevosita takliflar)
+REFERRAL_BURST_COUNT = int(os.environ.get("REFERRAL_BURST_COUNT", "10"))        # Shuncha taklif...
+REFERRAL_BURST_WINDOW = float(os.environ.get("REFERRAL_BURST_WINDOW", "30"))    # ...shu soniya ichida – shubhali
+REFERRAL_FLAGS_KEEP = 200    # Xotirada saqlanadigan oxirgi shubhali holatlar
+REFERRAL_SUBTREE_LIMIT = 50  # /subtree da ko‘rsatiladigan maksimal tugunlar
+VIEWS_FLUSH_INTERVAL = int(os.environ.get("VIEWS_FLUSH_INTERVAL", "30"))     # Ko‘rishlar hisoblagichini saqlash oralig‘i (soniya)
+VIEWS_FLUSH_THRESHOLD = int(os.environ.get("VIEWS_FLUSH_THRESHOLD", "500"))  # Shuncha ko‘rish to‘planganda darhol saqlash
+CONCURRENT_UPDATES = int(os.environ.get("CONCURRENT_UPDATES", "16"))  # Parallel ishlanadigan yangilanishlar soni
+GLOBAL_SEND_RATE = float(os.environ.get("GLOBAL_SEND_RATE", "30"))   # Bot bo‘yicha xabar/soniya (Telegram limiti ~30)
+CHAT_SEND_RATE = float(os.environ.get("CHAT_SEND_RATE", "1"))        # Bitta chatga xabar/soniya
+CHAT_SEND_BURST = 3                                                  # Bitta chatga ketma-ket yuborish mumkin bo‘lgan xabarlar
+SEND_MAX_RETRIES = 3                                                 # 429 (RetryAfter) dan keyin qayta urinishlar
+OUTBOX_MAX_DEPTH = int(os.environ.get("OUTBOX_MAX_DEPTH", "5000"))   # Navbat shundan oshsa bildirishnomalar tashlab yuboriladi
+FLOOD_RATE = float(os.environ.get("FLOOD_RATE", "2"))                # Bitta foydalanuvchidan qabul qilinadigan so‘rov/soniya
+FLOOD_BURST = int(os.environ.get("FLOOD_BURST", "5"))                # Ketma-ket ruxsat etilgan so‘rovlar
+FLOOD_DEDUP_WINDOW = float(os.environ.get("FLOOD_DEDUP_WINDOW", "1.0"))  # Bir xil tugma shu oraliqda qayta bosilsa o‘tkazib yuboriladi (soniya)
+GAMES_PAGE_SIZE = 8                      # Katalog klaviaturasidagi bir sahifadagi o‘yinlar
+BROADCAST_FILE = "broadcast.json"        # Ommaviy xabar jarayoni (checkpoint)
+BROADCAST_CHUNK = 500                    # Store'dan bir martada olinadigan qabul qiluvchilar
+BROADCAST_WORKERS = int(os.environ.get("BROADCAST_WORKERS", "20"))  # Parallel yuboruvchilar
+BROADCAST_PROGRESS_INTERVAL = 5          # Admin panelidagi holatni yangilash oralig‘i (soniya)
+EXPORT_CHUNK = 5000                      # Eksportda store'dan bir martada olinadigan foydalanuvchilar
+EXPORT_PART_BYTES = 45 * 1024 * 1024     # Bitta hujjat hajmi (Telegram bot yuklash limiti 50 MB)
+EXPORT_UPLOAD_TIMEOUT = 120              # Hujjatni yuklash uchun write_timeout (soniya)
 MIN_WITHDRAW = 25000         # Minimal yechish summasi
+WITHDRAW_CODE_KEY = os.environ.get("WITHDRAW_CODE_KEY", TOKEN)  # Kodlar permutatsiyasi kaliti (kodlarni taxmin qilib bo‘lmasligi uchun)
 BOT_USERNAME = "Winwin_premium_bonusbot"  # Botning @username (havola yaratish uchun, @ belgisisiz)
 WITHDRAW_SITE_URL = "https://futbolinsidepulyechish.netlify.app/"  # Pul yechish sayti
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json")  # "json" yoki "sqlite"
+SQLITE_FILE = os.environ.get("SQLITE_FILE", "winwin.db")
+SAVE_INTERVAL_MS = int(os.environ.get("SAVE_INTERVAL_MS", "1000"))  # JSON fayl yozuvlari orasidagi minimal oraliq (ms)
+LEDGER_FILE = "balance_ledger.log"            # Balans o‘zgarishlari jurnali (append-only)
+BALANCE_SNAPSHOT_FILE = "balance_snapshot.json"
+LEDGER_FSYNC_MS = int(os.environ.get("LEDGER_FSYNC_MS", "200"))            # Jurnal fsync oralig‘i (ms)
+LEDGER_COMPACT_EVERY = int(os.environ.get("LEDGER_COMPACT_EVERY", "10000"))  # Shuncha yozuvdan keyin snapshot
+VERIFY_API_HOST = os.environ.get("VERIFY_API_HOST", "127.0.0.1")
+VERIFY_API_PORT = int(os.environ.get("VERIFY_API_PORT", "0"))   # 0 – kod tekshirish API o‘chirilgan
+VERIFY_API_TOKEN = os.environ.get("VERIFY_API_TOKEN")           # Berilsa, "Authorization: Bearer <token>" talab qilinadi
+RUN_MODE = os.environ.get("RUN_MODE", "polling")               # "polling" yoki "webhook"
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", os.environ.get("PORT", "8443")))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram")
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")                     # Tashqi manzil (https://...); berilmasa setWebhook chaqirilmaydi
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")               # X-Telegram-Bot-Api-Secret-Token qiymati
+BOT_API_URL = os.environ.get("BOT_API_URL")                     # Masalan, lokal soxta Bot API: http://127.0.0.1:8081/bot
+VERIFY_BATCH_LIMIT = 1000                                       # Bitta so‘rovdagi maksimal kodlar soni
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))         # 0 – Prometheus /metrics o‘chirilgan
 
 # ------------------- LOGLASH -------------------
 logging.basicConfig(
@@ -36,81 +132,2577 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ------------------- UNUMDORLIK O‘LCHOVLARI -------------------
+# Gistogramma chegaralari: 0.1 ms dan ~160 s gacha, har biri oldingisidan 1.25 marta katta
+PERF_BOUNDS = tuple(0.0001 * 1.25 ** i for i in range(64))
+
+class LatencyHistogram:
+    """Qat’iy logarifmik chegarali gistogramma: yozish – bitta bisect va ikki qo‘shish."""
+
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = [0] * (len(PERF_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(PERF_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, q: float) -> float:
+        """q-kvantil (0..1) joylashgan bucketning yuqori chegarasi."""
+        target = q * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            cumulative += n
+            if n and cumulative >= target:
+                return PERF_BOUNDS[min(i, len(PERF_BOUNDS) - 1)]
+        return 0.0
+
+class PerfRegistry:
+    """Barcha gistogrammalar: (tur, nom) -> LatencyHistogram.
+
+    Turlar: "handler" (handler umumiy vaqti), "api" (Bot API chaqiruvi, endpoint
+    bo‘yicha), "store" (handler ichidagi ombor chaqiruvlari) va "persist" (fonda
+    faylga yozish / fsync). Har bir handler uchun uning ichida API va omborga
+    ketgan vaqt yig‘indisi ham saqlanadi.
+    """
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self.breakdown: Dict[str, list] = {}  # handler -> [api soniya, store soniya]
+
+    def record(self, kind: str, name: str, seconds: float):
+        histogram = self.histograms.get((kind, name))
+        if histogram is None:
+            histogram = self.histograms[(kind, name)] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def record_handler(self, name: str, seconds: float, span: list):
+        self.record("handler", name, seconds)
+        totals = self.breakdown.setdefault(name, [0.0, 0.0])
+        totals[0] += span[0]
+        totals[1] += span[1]
+
+    def by_kind(self, kind: str):
+        items = [(name, h) for (k, name), h in self.histograms.items() if k == kind]
+        return sorted(items, key=lambda item: item[1].total, reverse=True)
+
+perf = PerfRegistry()
+
+# Joriy handler uchun [API vaqti, ombor vaqti]; timed() o‘rnatadi, ichki qatlamlar qo‘shadi
+_handler_span: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("handler_span", default=None)
+_SPAN_API, _SPAN_STORE = 0, 1
+
+def timed(callback: Callable[..., Awaitable[Any]], name: Optional[str] = None):
+    """Handler vaqtini perf ga yozadigan o‘ram (dekorator sifatida ham ishlatiladi)."""
+    name = name or callback.__qualname__
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        span = [0.0, 0.0]
+        token = _handler_span.set(span)
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        finally:
+            perf.record_handler(name, time.perf_counter() - started, span)
+            _handler_span.reset(token)
+
+    return wrapper
+
+@contextlib.contextmanager
+def perf_span(kind: str, name: str, slot: Optional[int] = None):
+    """Blok vaqtini (kind, name) gistogrammasiga va joriy handlerning slot ulushiga yozadi."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        perf.record(kind, name, elapsed)
+        span = _handler_span.get()
+        if span is not None and slot is not None:
+            span[slot] += elapsed
+
 # ------------------- MAʼLUMOTLAR SAQLASH -------------------
-def load_games() -> Dict:
-    if Path(DATA_FILE).exists():
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
+def atomic_write_json(path: str, data):
+    """JSON faylni vaqtinchalik faylga yozib, so‘ng rename orqali almashtiradi."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def atomic_write_chunks(path: str, chunks: Iterable, binary: bool = False):
+    """atomic_write_json kabi, lekin matnni (yoki baytlarni) bo‘laklab yozadi (butun hujjat xotirada yig‘ilmaydi)."""
+    tmp_path = f"{path}.tmp"
+    with (open(tmp_path, "wb") if binary else open(tmp_path, "w", encoding="utf-8")) as f:
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+# games.json dagi xizmat kaliti: oxirgi berilgan o‘yin id si (o‘yinlar bilan birga saqlanadi)
+GAMES_SEQ_KEY = "__game_seq__"
+
+def load_games(path: str = DATA_FILE) -> Dict:
+    if Path(path).exists():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+def save_games(games: Dict, path: str = DATA_FILE):
+    atomic_write_json(path, games)
+
+def load_users(path: str = USERS_FILE) -> Dict:
+    if Path(path).exists():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+def save_users(users: Dict, path: str = USERS_FILE):
+    atomic_write_json(path, users)
+
+def load_pending_bonuses(path: str = PENDING_BONUS_FILE) -> Dict[str, float]:
+    """Kutilayotgan start bonuslari: {str(user_id): muddat (unix vaqt)}."""
+    if Path(path).exists():
+        with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
     return {}
 
-def save_games(games: Dict):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(games, f, ensure_ascii=False, indent=4)
+def load_counters(path: str = COUNTERS_FILE) -> Dict[str, int]:
+    """JSON ombor hisoblagichlari: {"code_seq": keyingi band qilinadigan kod hisoblagichi}."""
+    if Path(path).exists():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+class WriteBehindSaver:
+    """Maʼlumotlarni kechiktirib (write-behind) saqlaydi.
+
+    mark_dirty() faqat belgi qo‘yadi. Fon vazifasi eng ko‘pi bilan har
+    interval_ms da bir marta faylni event loopdan tashqarida (thread'da) yozadi,
+    shuning uchun bitta oynada tushgan barcha o‘zgarishlar bitta yozuvga birlashadi.
+    """
+
+    def __init__(self, name: str, snapshot: Callable[[], object], write: Callable[[object], None], interval_ms: int,
+                 before_write: Optional[Callable[[], Awaitable[None]]] = None):
+        self.name = name
+        self._snapshot = snapshot
+        self._write = write
+        # Nusxa olingandan keyin, yozishdan oldin kutiladi (masalan, balans jurnalini diskka tushirish)
+        self._before_write = before_write
+        self.interval = interval_ms / 1000
+        self._dirty = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # Fon yozuvi va flush()/close() bir vaqtda bitta .tmp faylga yozmasligi uchun
+        self._write_lock = threading.Lock()
+        # Nusxalar tartib raqami: kechikkan eski nusxa yangisining ustidan yozilmaydi
+        self._generation = 0
+        self._written = 0
+
+    def _take_snapshot(self):
+        self._generation += 1
+        return self._generation, self._snapshot()
+
+    def _locked_write(self, taken):
+        generation, snapshot = taken
+        with self._write_lock, perf_span("persist", self.name):
+            if generation < self._written:
+                return
+            self._write(snapshot)
+            self._written = generation
+
+    def mark_dirty(self):
+        self._dirty.set()
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty.is_set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            if not self._dirty.is_set():
+                # flush() shu orada hammasini yozib ulgurgan
+                continue
+            self._dirty.clear()
+            # Nusxa event loop ichida olinadi (handlerlar bilan poyga bo‘lmasligi uchun),
+            # serializatsiya va disk yozuvi esa alohida thread'da bajariladi.
+            taken = self._take_snapshot()
+            try:
+                if self._before_write is not None:
+                    await self._before_write()
+                await asyncio.to_thread(self._locked_write, taken)
+            except Exception:
+                logger.error(f"{self.name} saqlashda xatolik: {traceback.format_exc()}")
+                self._dirty.set()
+            await asyncio.sleep(self.interval)
+
+    async def flush(self):
+        """Kutilayotgan o‘zgarishlarni darhol (interval kutmasdan) diskka yozadi."""
+        if not self._dirty.is_set():
+            return
+        self._dirty.clear()
+        try:
+            taken = self._take_snapshot()
+            if self._before_write is not None:
+                await self._before_write()
+            await asyncio.to_thread(self._locked_write, taken)
+        except Exception:
+            self._dirty.set()
+            raise
+
+    async def close(self):
+        """Fon vazifasini to‘xtatadi va yozilmagan o‘zgarishlarni oxirgi marta saqlaydi."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Bekor qilingan fon yozuvi thread'da davom etayotgan bo‘lsa, tugashi kutiladi
+        with self._write_lock:
+            if self._dirty.is_set():
+                self._dirty.clear()
+                self._write(self._snapshot())
+
+class BalanceLedger:
+    """Balans o‘zgarishlarining append-only jurnali.
+
+    Har bir kredit/debet bitta qisqa qator: [seq, user_id, delta, sabab, vaqt] va
+    kerak bo‘lsa shu o‘zgarish bilan birga yoziladigan maydonlar ({"start_bonus_given": true}).
+    Yozuv faqat faylga qo‘shiladi (doimiy narx), fsync esa fon vazifasida
+    partiyalab bajariladi. Har LEDGER_COMPACT_EVERY yozuvdan keyin jurnal
+    aylantiriladi va balanslar snapshoti fonda yoziladi. Ishga tushishda oxirgi
+    snapshot o‘qiladi va undan keyingi jurnal qatorlari qayta qo‘llanadi.
+
+    checkpoint() foydalanuvchilar faylini joriy holat bilan yozadi: jurnal
+    segmentlari (ulardagi maydonlar bilan) faqat undan keyin o‘chiriladi.
+    users_hold_balances bo‘lsa (users.bin), alohida snapshot fayli yozilmaydi:
+    balanslar foydalanuvchilar faylining o‘zida saqlanadi va fayl qaysi seq gacha
+    bo‘lgan yozuvlarni o‘z ichiga olganini biladi. Ishga tushishda faqat jurnal
+    dumi qo‘llanadi – barcha foydalanuvchilarni o‘qish shart emas.
+    """
+
+    def __init__(self, log_path: str, snapshot_path: str, users_snapshot: Callable[[], Any],
+                 checkpoint: Callable[[], Awaitable[None]], users_hold_balances: bool = False):
+        self.log_path = log_path
+        self.snapshot_path = snapshot_path
+        # Arzon nusxa (UserTable.snapshot – massivlar memcpy); balances() undan thread'da olinadi
+        self._users_snapshot = users_snapshot
+        self._checkpoint = checkpoint
+        self._users_hold_balances = users_hold_balances
+        self.seq = 0
+        self.snapshot_seq = 0
+        self._file = None
+        self._unsynced = False
+        self._task: Optional[asyncio.Task] = None
+        self._compacting = False
+
+    def _segments(self):
+        """Hali snapshotga kirmagan aylantirilgan jurnal fayllari (seq bo‘yicha tartiblangan)."""
+        prefix = os.path.basename(self.log_path) + "."
+        directory = os.path.dirname(self.log_path) or "."
+        segments = []
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name[len(prefix):].isdigit():
+                segments.append((int(name[len(prefix):]), os.path.join(directory, name)))
+        return [path for _, path in sorted(segments)]
+
+    def _drop_torn_tail(self):
+        """Joriy jurnal oxiridagi yarim yozilgan qatorni kesadi: keyingi yozuv unga qo‘shilib yo‘qolmasin."""
+        if not Path(self.log_path).exists():
+            return
+        with open(self.log_path, "rb+") as f:
+            end = pos = f.seek(0, os.SEEK_END)
+            while pos > 0:
+                step = min(4096, pos)
+                f.seek(pos - step)
+                newline = f.read(step).rfind(b"\n")
+                if newline != -1:
+                    pos += newline + 1 - step
+                    break
+                pos -= step
+            if pos < end:
+                logger.warning(f"Balans jurnali oxirida yarim qator ({end - pos} bayt) kesib tashlandi.")
+                f.truncate(pos)
+
+    def recover(self, restore_balance: Callable[[str, int], None], replay: Callable[[str, int], None],
+                restore_fields: Callable[[str, dict], None], checkpoint_seq: Optional[int] = None):
+        """Balanslarni tiklaydi: snapshot (yoki checkpoint_seq dagi foydalanuvchilar fayli) + jurnal dumi.
+
+        Snapshotdan: restore_balance(user_id, balance) – snapshotdagi va jurnaldagi har bir
+        foydalanuvchining yakuniy balansi. Checkpointdan: replay(user_id, delta) – faqat
+        jurnal dumida uchragan foydalanuvchilar uchun (checkpointdan keyingi jami o‘zgarish).
+        Jurnal dumidagi maydonlar restore_fields(user_id, maydonlar) bilan qo‘llanadi.
+        """
+        balances: Optional[Dict[str, int]] = None
+        if checkpoint_seq is not None:
+            self.snapshot_seq = self.seq = checkpoint_seq
+        elif not Path(self.snapshot_path).exists():
+            # Birinchi ishga tushish: joriy balanslardan boshlang‘ich snapshot yaratiladi.
+            for path in self._segments() + [self.log_path]:
+                if Path(path).exists():
+                    logger.warning(f"Snapshotsiz jurnal topildi, eʼtiborsiz qoldirildi: {path}")
+                    os.replace(path, path + ".orphan")
+            atomic_write_json(self.snapshot_path, {"seq": 0, "balances": self._users_snapshot().balances()})
+        else:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self.snapshot_seq = self.seq = snapshot["seq"]
+            balances = snapshot["balances"]
+        self._drop_torn_tail()
+        deltas: Dict[str, int] = {}
+        fields: Dict[str, dict] = {}
+        replayed = 0
+        for path in self._segments() + [self.log_path]:
+            if not Path(path).exists():
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        seq, user_id, delta = entry[:3]
+                    except (ValueError, TypeError):
+                        # Yarim yozilgan oxirgi qator (crash) – o‘tkazib yuboriladi
+                        continue
+                    if seq <= self.snapshot_seq:
+                        continue
+                    key = str(user_id)
+                    deltas[key] = deltas.get(key, 0) + delta
+                    if len(entry) > 5:
+                        fields.setdefault(key, {}).update(entry[5])
+                    self.seq = max(self.seq, seq)
+                    replayed += 1
+        if balances is None:
+            for key, delta in deltas.items():
+                replay(key, delta)
+        else:
+            for key, delta in deltas.items():
+                balances[key] = balances.get(key, 0) + delta
+            for key, balance in balances.items():
+                restore_balance(key, balance)
+        for key, values in fields.items():
+            restore_fields(key, values)
+        if replayed:
+            logger.info(f"Balans jurnalidan {replayed} ta yozuv qayta qo‘llandi.")
+        self._file = open(self.log_path, "a", encoding="utf-8")
+
+    def append(self, user_id: int, delta: int, reason: str, fields: Optional[dict] = None):
+        self.seq += 1
+        record = [self.seq, user_id, delta, reason, round(time.time(), 3)]
+        if fields:
+            record.append(fields)
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._unsynced = True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def sync(self):
+        """Hozirgacha qo‘shilgan yozuvlarni diskka tushiradi (fsync thread'da)."""
+        if not self._unsynced or self._file is None:
+            return
+        self._unsynced = False
+        self._file.flush()
+        # dup: fsync paytida jurnal aylantirilsa ham deskriptor ochiq qoladi
+        fd = os.dup(self._file.fileno())
+        try:
+            with perf_span("persist", "ledger fsync"):
+                await asyncio.to_thread(os.fsync, fd)
+        finally:
+            os.close(fd)
+
+    async def _run(self):
+        interval = LEDGER_FSYNC_MS / 1000
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync()
+                if self.seq - self.snapshot_seq >= LEDGER_COMPACT_EVERY and not self._compacting:
+                    await self.compact()
+            except Exception:
+                logger.error(f"Balans jurnalida xatolik: {traceback.format_exc()}")
+
+    def _rotate(self):
+        """Joriy jurnalni yopib, ledger.log.<seq> nomi bilan chetga oladi; yangi fayl ochiladi."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        segment = f"{self.log_path}.{self.seq}"
+        os.replace(self.log_path, segment)
+        self._file = open(self.log_path, "a", encoding="utf-8")
+        return segment
+
+    def _write_snapshot(self, seq: int, users, segments):
+        atomic_write_json(self.snapshot_path, {"seq": seq, "balances": users.balances()})
+        for path in segments:
+            os.remove(path)
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    async def _save(self, seq: int, segments):
+        """seq gacha bo‘lgan balanslarni saqlaydi va shu yozuvlarni o‘z ichiga olgan segmentlarni o‘chiradi.
+
+        Aylantirishdan keyin, birinchi await dan oldin chaqiriladi: nusxa aynan seq holatida olinadi.
+        """
+        users = None if self._users_hold_balances else self._users_snapshot()
+        # Segmentlardagi maydonlar (start_bonus_given) foydalanuvchilar fayliga tushmaguncha ular o‘chirilmaydi
+        await self._checkpoint()
+        if users is None:
+            # Eski snapshot endi ishlatilmaydi (checkpoint undan yangiroq)
+            await asyncio.to_thread(self._remove, segments + [self.snapshot_path])
+        else:
+            await asyncio.to_thread(self._write_snapshot, seq, users, segments)
+        self.snapshot_seq = seq
+
+    async def compact(self):
+        """Jurnalni aylantiradi va balanslar snapshotini fonda (thread'da) yozadi."""
+        self._compacting = True
+        try:
+            self._rotate()
+            seq = self.seq
+            segments = [path for path in self._segments() if int(path.rsplit(".", 1)[1]) <= seq]
+            await self._save(seq, segments)
+            logger.info(f"Balans snapshoti yozildi (seq={seq}).")
+        finally:
+            self._compacting = False
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._file is not None:
+            if self.seq > self.snapshot_seq:
+                segment = self._rotate()
+                await self._save(self.seq, [segment])
+            self._file.close()
+            self._file = None
+
+# ------------------- MAʼLUMOTLAR OMBORI (STORE) -------------------
+USER_FIELDS = ("balance", "referred_by", "referrals", "start_bonus_given", "withdraw_code", "blocked")
+
+class BaseStore:
+    """Foydalanuvchi va o‘yin maʼlumotlari uchun umumiy interfeys.
+
+    Handlerlar maʼlumotlarga faqat shu interfeys orqali murojaat qiladi.
+    get_user() qaytargan lug‘at o‘qish uchun; o‘zgartirishlar update_user()
+    yoki increment_user() orqali yoziladi. O‘qish metodlari sinxron, o‘zgartiruvchi
+    metodlar esa await qilinadi: SQLite ularni event loopdan tashqarida bajaradi.
+    """
+
+    def get_user(self, user_id: int) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def create_user(self, user_id: int, record: dict) -> dict:
+        raise NotImplementedError
+
+    async def update_user(self, user_id: int, **fields) -> None:
+        raise NotImplementedError
+
+    async def increment_user(self, user_id: int, **deltas) -> dict:
+        """Sonli maydonlarni oshiradi va yangilangan yozuvni qaytaradi."""
+        raise NotImplementedError
+
+    async def credit(self, user_id: int, amount: int, reason: str, **fields) -> dict:
+        """Balansni o‘zgartiradi (manfiy amount – debet) va jurnalga yozadi.
+
+        fields (masalan, start_bonus_given=True) balans bilan birga, bitta yozuvda saqlanadi:
+        biri saqlanib, ikkinchisi yo‘qolishi mumkin emas.
+        """
+        raise NotImplementedError
+
+    async def add_referral(self, user_id: int, referred_by: int) -> dict:
+        """user_id ni referred_by taklifi deb belgilaydi; taklifchining yangilangan yozuvini qaytaradi."""
+        raise NotImplementedError
+
+    def code_exists(self, code: str) -> bool:
+        raise NotImplementedError
+
+    async def reserve_code_seq(self, count: int) -> int:
+        """Withdraw kodlari hisoblagichidan count ta ketma-ket qiymatni band qiladi va birinchisini qaytaradi."""
+        raise NotImplementedError
+
+    def find_user_by_code(self, code: str) -> Optional[int]:
+        raise NotImplementedError
+
+    def user_count(self) -> int:
+        raise NotImplementedError
+
+    def iter_user_ids(self, after: int, limit: int):
+        """id bo‘yicha o‘sish tartibida, after dan keyingi limit ta (bloklamagan) foydalanuvchi id si."""
+        raise NotImplementedError
+
+    def iter_user_records(self, after: int, limit: int) -> List[Tuple[int, dict]]:
+        """iter_user_ids kabi, lekin barcha (bloklaganlar ham) foydalanuvchilar yozuvlari nusxasi bilan."""
+        raise NotImplementedError
+
+    async def prepare_user_scan(self):
+        """iter_user_ids/iter_user_records bilan o‘tish (broadcast, eksport) boshida chaqiriladi.
+
+        Kerak bo‘lsa, o‘tish uchun indeksni event loopdan tashqarida tayyorlaydi.
+        """
+
+    def iter_referrers(self) -> Iterable[Tuple[int, int]]:
+        """Kamida bitta taklifi bor foydalanuvchilar: (user_id, referrals)."""
+        raise NotImplementedError
+
+    def iter_referral_edges(self) -> Iterable[Tuple[int, int]]:
+        """Taklif bilan kelgan foydalanuvchilar: (user_id, referred_by)."""
+        raise NotImplementedError
+
+    def referral_seq(self) -> int:
+        """Oxirgi taklif o‘zgarishining tartib raqami (klasterda boshqa jarayonlar takliflarini kuzatish uchun)."""
+        return 0
+
+    def referral_changes(self, after: int, limit: int) -> List[Tuple[int, int, int, int]]:
+        """after dan keyingi takliflar: (seq, user_id, referred_by, taklifchining yangi referrals soni)."""
+        return []
+
+    def load_pending_bonuses(self) -> Dict[int, float]:
+        """Berilishi kutilayotgan start bonuslari: user_id -> muddat (unix vaqt)."""
+        raise NotImplementedError
+
+    async def set_pending_bonus(self, user_id: int, due: float, replace: bool = False) -> None:
+        """Bonusni navbatga yozadi; foydalanuvchi allaqachon navbatda bo‘lsa, muddat faqat replace bilan o‘zgaradi."""
+        raise NotImplementedError
+
+    async def remove_pending_bonuses(self, user_ids) -> None:
+        raise NotImplementedError
+
+    def load_games(self) -> Dict:
+        raise NotImplementedError
+
+    async def save_game(self, name: str, game: dict) -> None:
+        raise NotImplementedError
+
+    async def delete_game(self, name: str) -> None:
+        raise NotImplementedError
+
+    async def next_game_seq(self, floor: int = 0) -> int:
+        """Yangi o‘yin id si: hisoblagichni max(saqlangan, floor) + 1 ga o‘rnatadi, saqlaydi va qaytaradi.
+
+        Hisoblagich faqat o‘sadi – o‘chirilgan o‘yinning id si qayta berilmaydi.
+        """
+        raise NotImplementedError
+
+    async def add_game_views(self, name: str, delta: int) -> Optional[int]:
+        """Saqlangan ko‘rishlar soniga delta qo‘shadi va yangi jami qiymatni qaytaradi (o‘yin bo‘lmasa None)."""
+        raise NotImplementedError
+
+    def catalog_version(self) -> int:
+        """O‘yinlar katalogi har o‘zgarganda oshadigan son (klaster keshlarini bekor qilish uchun)."""
+        return 0
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """name lizingini owner uchun oladi yoki uzaytiradi; boshqa jarayonda amal qilayotgan bo‘lsa False."""
+        return True
+
+    async def release_lease(self, name: str, owner: str) -> None:
+        pass
+
+    async def flush_games(self):
+        """O‘yinlarga kiritilgan o‘zgarishlar diskka yozilguncha kutadi."""
+
+    def start(self):
+        """Event loop ishga tushgach chaqiriladi (fon vazifalari uchun)."""
+
+    async def close(self):
+        """Bot to‘xtaganda chaqiriladi."""
+
+class IntIndex:
+    """Manfiy bo‘lmagan int -> int xesh-jadval (ochiq adreslash, ikki array ichida).
+
+    Oddiy dict har bir yozuv uchun kalit va qiymat int obyektlarini saqlaydi
+    (~100 bayt); bu yerda bitta yozuv ~23-46 bayt (to‘lish 0.35–0.7).
+    """
+
+    _EMPTY = -1
+    _DELETED = -2
+    _MIX = 0x9E3779B97F4A7C15
+
+    def __init__(self, capacity: int = 1024):
+        self._bits = max(capacity - 1, 1).bit_length()
+        self._keys = array("q", [self._EMPTY]) * (1 << self._bits)
+        self._values = array("q", [0]) * (1 << self._bits)
+        self._size = 0
+        self._used = 0  # band + o‘chirilgan slotlar
+
+    def __len__(self):
+        return self._size
+
+    def _slot(self, key: int) -> int:
+        """key ning sloti yoki (topilmasa) birinchi bo‘sh/o‘chirilgan slot."""
+        mask = (1 << self._bits) - 1
+        i = ((key * self._MIX) & 0xFFFFFFFFFFFFFFFF) >> (64 - self._bits)
+        free = -1
+        keys = self._keys
+        while True:
+            k = keys[i]
+            if k == key:
+                return i
+            if k == self._EMPTY:
+                return i if free < 0 else free
+            if k == self._DELETED and free < 0:
+                free = i
+            i = (i + 1) & mask
+
+    def get(self, key: int, default=None):
+        i = self._slot(key)
+        return self._values[i] if self._keys[i] == key else default
+
+    def __contains__(self, key: int) -> bool:
+        return self._keys[self._slot(key)] == key
+
+    def __getitem__(self, key: int) -> int:
+        i = self._slot(key)
+        if self._keys[i] != key:
+            raise KeyError(key)
+        return self._values[i]
+
+    def __setitem__(self, key: int, value: int):
+        i = self._slot(key)
+        if self._keys[i] != key:
+            if self._keys[i] == self._EMPTY:
+                self._used += 1
+            self._keys[i] = key
+            self._size += 1
+        self._values[i] = value
+        if self._used * 10 > len(self._keys) * 7:
+            self._resize()
+
+    def pop(self, key: int, default=None):
+        i = self._slot(key)
+        if self._keys[i] != key:
+            return default
+        self._keys[i] = self._DELETED
+        self._size -= 1
+        return self._values[i]
+
+    def _resize(self):
+        keys, values = self._keys, self._values
+        self.__init__(max(self._size * 2, 1024))
+        for k, v in zip(keys, values):
+            if k >= 0:
+                self[k] = v
+
+# Handlerlar chaqiradigan ombor metodlari – vaqti "store" gistogrammasiga yoziladi
+STORE_TIMED_METHODS = (
+    "get_user", "create_user", "update_user", "increment_user", "credit", "add_referral", "code_exists",
+    "find_user_by_code", "user_count", "iter_user_ids", "set_pending_bonus",
+    "remove_pending_bonuses", "save_game", "delete_game", "reserve_code_seq",
+)
+_in_store: contextvars.ContextVar[bool] = contextvars.ContextVar("in_store", default=False)
+
+def instrument_store(cls):
+    """Ombor klassining STORE_TIMED_METHODS metodlarini perf_span bilan o‘raydi (ichma-ich chaqiruvlar bir marta hisoblanadi)."""
+    def wrap(method):
+        name = method.__name__
+
+        if asyncio.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(*args, **kwargs):
+                if _in_store.get():
+                    return await method(*args, **kwargs)
+                token = _in_store.set(True)
+                try:
+                    with perf_span("store", name, _SPAN_STORE):
+                        return await method(*args, **kwargs)
+                finally:
+                    _in_store.reset(token)
+
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            if _in_store.get():
+                return method(*args, **kwargs)
+            token = _in_store.set(True)
+            try:
+                with perf_span("store", name, _SPAN_STORE):
+                    return method(*args, **kwargs)
+            finally:
+                _in_store.reset(token)
+
+        return wrapper
+
+    for name in STORE_TIMED_METHODS:
+        if name in cls.__dict__:
+            setattr(cls, name, wrap(cls.__dict__[name]))
+    return cls
+
+class UserSnapshot:
+    """users.bin – mmap orqali o‘qiladigan ikkilik foydalanuvchilar snapshoti.
+
+    Tuzilishi (little-endian): sarlavha, saralangan id lar + ularning qatorlari,
+    saralangan 7 xonali kodlar + qatorlari, RECORD o‘lchamli yozuvlar va oxirida
+    JSON (eski kodlar, noma'lum maydonlar va balanslar qaysi jurnal seq gacha
+    kiritilgani). Ochishda hech narsa decode qilinmaydi: qidiruv bisect bilan
+    mmap ustida, yozuv esa so‘ralganda o‘qiladi.
+    """
+
+    MAGIC = b"WWUSERS1"
+    HEADER = struct.Struct("<8sqqq")       # magic, yozuvlar, kodlar, JSON qism uzunligi
+    RECORD = struct.Struct("<qqqiiB")      # id, balance, referred_by, referrals, kod, bayroqlar
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, n_codes, trailer_len = self.HEADER.unpack_from(self._mm, 0)
+        if magic != self.MAGIC:
+            raise ValueError(f"{path}: users.bin formati emas")
+        view = memoryview(self._mm)
+        offset = self.HEADER.size
+        sections = []
+        for typecode, count in (("q", n), ("i", n), ("i", n_codes), ("i", n_codes)):
+            size = count * struct.calcsize(typecode)
+            sections.append(view[offset:offset + size].cast(typecode))
+            offset += size
+        self.ids, self.id_rows, self.codes, self.code_rows = sections
+        self._records_offset = offset
+        offset += n * self.RECORD.size
+        trailer = json.loads(bytes(view[offset:offset + trailer_len]))
+        self.odd_codes = {int(row): code for row, code in trailer["odd_codes"].items()}
+        self.odd_code_rows = {code: row for row, code in self.odd_codes.items()}
+        self.extra = {int(row): fields for row, fields in trailer["extra"].items()}
+        self.ledger_seq: Optional[int] = trailer.get("ledger_seq")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row_of(self, user_id: int) -> Optional[int]:
+        i = bisect.bisect_left(self.ids, user_id)
+        if i < len(self.ids) and self.ids[i] == user_id:
+            return self.id_rows[i]
+        return None
+
+    def record(self, row: int) -> tuple:
+        return self.RECORD.unpack_from(self._mm, self._records_offset + row * self.RECORD.size)
+
+    def records(self) -> memoryview:
+        """Barcha yozuvlar (xom baytlar, fayldagi tartibda)."""
+        start = self._records_offset
+        return memoryview(self._mm)[start:start + len(self.ids) * self.RECORD.size]
+
+    def find_code(self, code: str) -> Optional[int]:
+        """Kod egasining qatori (indeksdagi eskirgan yozuvlar yozuvning o‘zi bilan tekshiriladi)."""
+        if len(code) == 7 and code.isdigit():
+            value = int(code)
+            i = bisect.bisect_left(self.codes, value)
+            while i < len(self.codes) and self.codes[i] == value:
+                row = self.code_rows[i]
+                if self.record(row)[4] == value:
+                    return row
+                i += 1
+            return None
+        return self.odd_code_rows.get(code)
+
+def _insert_sorted(keys: memoryview, values: memoryview, inserts) -> Tuple[array, array]:
+    """Saralangan (keys, values) juftligiga saralangan inserts ni qo‘shadi; oraliqlar bloklab ko‘chiriladi."""
+    out_keys, out_values = array(keys.format), array(values.format)
+    start = 0
+    for key, value in inserts:
+        pos = bisect.bisect_left(keys, key, start)
+        out_keys.frombytes(keys[start:pos].cast("B"))
+        out_values.frombytes(values[start:pos].cast("B"))
+        out_keys.append(key)
+        out_values.append(value)
+        start = pos
+    out_keys.frombytes(keys[start:].cast("B"))
+    out_values.frombytes(values[start:].cast("B"))
+    return out_keys, out_values
+
+class UserView(MutableMapping):
+    """UserTable dagi bitta qatorga lug‘at ko‘rinishidagi (jonli) murojaat."""
+
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table: "UserTable", row: int):
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, field: str):
+        return self._table.get_field(self._row, field)
+
+    def __setitem__(self, field: str, value):
+        self._table.set_field(self._row, field, value)
+
+    def __delitem__(self, field: str):
+        extra = self._table.extra.get(self._row)
+        if extra is None or field not in extra:
+            raise KeyError(field)
+        del extra[field]
+
+    def __iter__(self):
+        yield from USER_FIELDS
+        yield from self._table.extra.get(self._row, ())
+
+    def __len__(self):
+        return len(USER_FIELDS) + len(self._table.extra.get(self._row, ()))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class UserTable:
+    """Foydalanuvchilarni ustunli massivlarda saqlaydi (har biri uchun lug‘at o‘rniga bitta qator).
+
+    Tashqaridan users.json dagi kabi {str(user_id): {maydon: qiymat}} xaritasi
+    ko‘rinadi: table[uid] UserView qaytaradi. Asosiy maydonlar array/bytearray
+    da, 7 xonali bo‘lmagan eski kodlar va noma'lum maydonlar alohida lug‘atlarda.
+
+    users.bin dan ochilganda (from_snapshot) snapshot faqat o‘qish uchun asos
+    bo‘lib qoladi: foydalanuvchi birinchi marta so‘ralganda uning yozuvi
+    ustunlarga ko‘chiriladi, qolganlari mmap da turaveradi.
+    """
+
+    _START_BONUS = 1
+    _BLOCKED = 2
+    _NO_CODE = -1
+    _ODD_CODE = -2
+
+    def __init__(self):
+        self.rows = IntIndex()                    # user_id -> qator raqami
+        self.ids = array("q")
+        self.balance = array("q")
+        self.referred_by = array("q")             # 0 – taklif qilmagan
+        self.referrals = array("i")
+        self.codes = array("i")                   # 7 xonali kod son sifatida
+        self.flags = bytearray()
+        self.odd_codes: Dict[int, str] = {}       # qator -> kod
+        self.extra: Dict[int, dict] = {}          # qator -> qo‘shimcha maydonlar
+        self.code_rows = IntIndex()               # kod -> qator
+        self.odd_code_rows: Dict[str, int] = {}
+        self.base: Optional[UserSnapshot] = None
+        self.base_rows = array("i")               # qatorning snapshotdagi raqami (-1 – yangi)
+        self._from_base = 0
+        self.ledger_seq: Optional[int] = None     # balanslar shu jurnal seq gacha kiritilgan (users.bin)
+
+    @classmethod
+    def from_dict(cls, users: Dict[str, dict]) -> "UserTable":
+        table = cls()
+        for uid, record in users.items():
+            table[uid] = record
+        return table
+
+    @classmethod
+    def from_snapshot(cls, path: str) -> "UserTable":
+        table = cls()
+        table.base = UserSnapshot(path)
+        table.ledger_seq = table.base.ledger_seq
+        return table
+
+    # --- xarita interfeysi (kalit – str(user_id)) ---
+    def __len__(self):
+        return len(self.ids) + (len(self.base) - self._from_base if self.base is not None else 0)
+
+    def __contains__(self, uid) -> bool:
+        user_id = int(uid)
+        return user_id in self.rows or (self.base is not None and self.base.row_of(user_id) is not None)
+
+    def __iter__(self):
+        yield from map(str, self.ids)
+        if self.base is not None:
+            for user_id in self.base.ids:
+                if user_id not in self.rows:
+                    yield str(user_id)
+
+    def _row(self, user_id: int) -> Optional[int]:
+        row = self.rows.get(user_id)
+        if row is None and self.base is not None:
+            base_row = self.base.row_of(user_id)
+            if base_row is not None:
+                row = self._materialize(base_row)
+        return row
+
+    def _append_row(self, user_id: int, base_row: int = -1) -> int:
+        row = len(self.ids)
+        self.rows[user_id] = row
+        self.ids.append(user_id)
+        self.balance.append(0)
+        self.referred_by.append(0)
+        self.referrals.append(0)
+        self.codes.append(self._NO_CODE)
+        self.flags.append(0)
+        self.base_rows.append(base_row)
+        return row
+
+    def _materialize(self, base_row: int) -> int:
+        """Snapshotdagi yozuvni decode qilib, ustunlarga ko‘chiradi."""
+        user_id, balance, referred_by, referrals, code, flags = self.base.record(base_row)
+        row = self._append_row(user_id, base_row)
+        self.balance[row] = balance
+        self.referred_by[row] = referred_by
+        self.referrals[row] = referrals
+        self.flags[row] = flags
+        self.codes[row] = code
+        if code >= 0:
+            self.code_rows[code] = row
+        elif code == self._ODD_CODE:
+            self.odd_codes[row] = self.base.odd_codes[base_row]
+            self.odd_code_rows[self.odd_codes[row]] = row
+        if base_row in self.base.extra:
+            self.extra[row] = dict(self.base.extra[base_row])
+        self._from_base += 1
+        return row
+
+    def __getitem__(self, uid) -> UserView:
+        row = self._row(int(uid))
+        if row is None:
+            raise KeyError(uid)
+        return UserView(self, row)
+
+    def get(self, uid, default=None):
+        row = self._row(int(uid))
+        return default if row is None else UserView(self, row)
+
+    def __setitem__(self, uid, record: dict):
+        user_id = int(uid)
+        row = self._row(user_id)
+        if row is None:
+            row = self._append_row(user_id)
+        else:
+            self.extra.pop(row, None)
+        for field in USER_FIELDS:
+            self.set_field(row, field, record.get(field))
+        for field, value in record.items():
+            if field not in USER_FIELDS:
+                self.set_field(row, field, value)
+
+    # --- maydonlar ---
+    def get_field(self, row: int, field: str):
+        if field == "balance":
+            return self.balance[row]
+        if field == "referred_by":
+            return self.referred_by[row] or None
+        if field == "referrals":
+            return self.referrals[row]
+        if field == "start_bonus_given":
+            return bool(self.flags[row] & self._START_BONUS)
+        if field == "blocked":
+            return bool(self.flags[row] & self._BLOCKED)
+        if field == "withdraw_code":
+            code = self.codes[row]
+            if code == self._NO_CODE:
+                return None
+            if code == self._ODD_CODE:
+                return self.odd_codes[row]
+            return f"{code:07d}"
+        extra = self.extra.get(row)
+        if extra is None or field not in extra:
+            raise KeyError(field)
+        return extra[field]
+
+    def set_field(self, row: int, field: str, value):
+        if field == "balance":
+            self.balance[row] = int(value or 0)
+        elif field == "referred_by":
+            self.referred_by[row] = int(value) if value is not None else 0
+        elif field == "referrals":
+            self.referrals[row] = int(value or 0)
+        elif field == "start_bonus_given":
+            self._set_flag(row, self._START_BONUS, value)
+        elif field == "blocked":
+            self._set_flag(row, self._BLOCKED, value)
+        elif field == "withdraw_code":
+            self._set_code(row, value)
+        else:
+            self.extra.setdefault(row, {})[field] = value
+
+    def _set_flag(self, row: int, bit: int, value):
+        if value:
+            self.flags[row] |= bit
+        else:
+            self.flags[row] &= ~bit & 0xFF
+
+    def _set_code(self, row: int, code: Optional[str]):
+        old = self.codes[row]
+        if old == self._ODD_CODE:
+            self.odd_code_rows.pop(self.odd_codes.pop(row), None)
+        elif old != self._NO_CODE:
+            self.code_rows.pop(old, None)
+        if not code:
+            self.codes[row] = self._NO_CODE
+        elif len(code) == 7 and code.isdigit():
+            self.codes[row] = int(code)
+            self.code_rows[int(code)] = row
+        else:
+            self.codes[row] = self._ODD_CODE
+            self.odd_codes[row] = code
+            self.odd_code_rows[code] = row
+
+    # --- indekslar ---
+    def record(self, user_id: int) -> dict:
+        """Foydalanuvchi yozuvining nusxasi; snapshotdagi yozuv ustunlarga ko‘chirilmaydi."""
+        row = self.rows.get(user_id)
+        if row is None:
+            return self._base_dict(self.base.row_of(user_id))
+        return dict(UserView(self, row))
+
+    def find_code(self, code: str) -> Optional[int]:
+        """withdraw_code bo‘yicha user_id (O(1); snapshotda – O(log n))."""
+        if len(code) == 7 and code.isdigit():
+            row = self.code_rows.get(int(code))
+        else:
+            row = self.odd_code_rows.get(code)
+        if row is not None:
+            return self.ids[row]
+        if self.base is not None:
+            base_row = self.base.find_code(code)
+            if base_row is not None:
+                user_id = self.base.record(base_row)[0]
+                # Ustunlarga ko‘chirilgan bo‘lsa, kod o‘shandan beri o‘zgargan
+                if user_id not in self.rows:
+                    return user_id
+        return None
+
+    def is_blocked(self, user_id: int) -> bool:
+        row = self.rows.get(user_id)
+        if row is None:
+            return bool(self.base.record(self.base.row_of(user_id))[5] & self._BLOCKED)
+        return bool(self.flags[row] & self._BLOCKED)
+
+    def balances(self) -> Dict[str, int]:
+        balances = {}
+        if self.base is not None:
+            for user_id, balance, *_ in self.base.RECORD.iter_unpack(self.base.records()):
+                balances[str(user_id)] = balance
+        balances.update(zip(map(str, self.ids), self.balance))
+        return balances
+
+    def referrers(self) -> Iterator[Tuple[int, int]]:
+        """(user_id, referrals) – faqat referrals > 0 bo‘lganlar (snapshotdagilar decode qilinmaydi)."""
+        for user_id, referrals in zip(self.ids, self.referrals):
+            if referrals > 0:
+                yield user_id, referrals
+        if self.base is not None:
+            materialized = {base_row for base_row in self.base_rows if base_row >= 0}
+            for row, (user_id, _, _, referrals, _, _) in enumerate(self.base.RECORD.iter_unpack(self.base.records())):
+                if referrals > 0 and row not in materialized:
+                    yield user_id, referrals
+
+    def referral_edges(self) -> Iterator[Tuple[int, int]]:
+        """(user_id, referred_by) – faqat taklif bilan kelganlar."""
+        for user_id, referred_by in zip(self.ids, self.referred_by):
+            if referred_by:
+                yield user_id, referred_by
+        if self.base is not None:
+            materialized = {base_row for base_row in self.base_rows if base_row >= 0}
+            for row, (user_id, _, referred_by, _, _, _) in enumerate(self.base.RECORD.iter_unpack(self.base.records())):
+                if referred_by and row not in materialized:
+                    yield user_id, referred_by
+
+    def sorted_ids(self) -> array:
+        """Barcha user_id lar o‘sish tartibida (snapshotdagilar tayyor saralangan)."""
+        return self.sort_ids(self.ids, self.base_rows, self.base)
+
+    @staticmethod
+    def sort_ids(ids: array, base_rows: array, base: Optional[UserSnapshot]) -> array:
+        """sorted_ids() ning o‘zi, ustunlar nusxasi ustida (thread'da chaqirish uchun)."""
+        new_ids = sorted(user_id for user_id, base_row in zip(ids, base_rows) if base_row < 0)
+        if base is None:
+            return array("q", new_ids)
+        sorted_ids, _ = _insert_sorted(base.ids, base.id_rows, ((user_id, 0) for user_id in new_ids))
+        return sorted_ids
+
+    # --- saqlash ---
+    def snapshot(self) -> "UserTable":
+        """Ustunlarning nusxasi (memcpy) – faylga thread'da yozish uchun."""
+        copy = UserTable()
+        copy.ids = array("q", self.ids)
+        copy.balance = array("q", self.balance)
+        copy.referred_by = array("q", self.referred_by)
+        copy.referrals = array("i", self.referrals)
+        copy.codes = array("i", self.codes)
+        copy.flags = bytearray(self.flags)
+        copy.odd_codes = dict(self.odd_codes)
+        copy.extra = {row: dict(fields) for row, fields in self.extra.items()}
+        copy.base = self.base
+        copy.base_rows = array("i", self.base_rows)
+        copy.ledger_seq = self.ledger_seq
+        return copy
+
+    def _base_dict(self, base_row: int) -> dict:
+        _, balance, referred_by, referrals, code, flags = self.base.record(base_row)
+        if code == self._NO_CODE:
+            code = None
+        elif code == self._ODD_CODE:
+            code = self.base.odd_codes[base_row]
+        else:
+            code = f"{code:07d}"
+        record = {
+            "balance": balance,
+            "referred_by": referred_by or None,
+            "referrals": referrals,
+            "start_bonus_given": bool(flags & self._START_BONUS),
+            "withdraw_code": code,
+            "blocked": bool(flags & self._BLOCKED),
+        }
+        record.update(self.base.extra.get(base_row, ()))
+        return record
+
+    def _iter_records(self):
+        for row in range(len(self.ids)):
+            yield self.ids[row], dict(UserView(self, row))
+        if self.base is not None:
+            # snapshot() nusxasida rows indeksi yo‘q – ko‘chirilganlar base_rows bo‘yicha aniqlanadi
+            materialized = {base_row for base_row in self.base_rows if base_row >= 0}
+            for user_id, base_row in zip(self.base.ids, self.base.id_rows):
+                if base_row not in materialized:
+                    yield user_id, self._base_dict(base_row)
+
+    def iter_json(self, batch: int = 10000):
+        """users.json formatidagi matnni bo‘laklab qaytaradi."""
+        yield "{"
+        parts = []
+        separator = ""
+        for user_id, record in self._iter_records():
+            parts.append(f'{separator}"{user_id}":{json.dumps(record, ensure_ascii=False, separators=(",", ":"))}')
+            separator = ","
+            if len(parts) >= batch:
+                yield "".join(parts)
+                parts = []
+        yield "".join(parts)
+        yield "}"
+
+    def iter_binary(self):
+        """users.bin formatidagi baytlarni bo‘laklab qaytaradi.
+
+        Snapshotdagi yozuvlar qator raqamlarini saqlaydi: ko‘chirilganlari joyida
+        yangilanadi, yangi foydalanuvchilar oxiriga qo‘shiladi. Shuning uchun
+        indekslarga faqat yangi kalitlar bisect bilan qo‘yiladi, qolgan qismi
+        bloklab ko‘chiriladi.
+        """
+        record = UserSnapshot.RECORD
+        base = self.base
+        n_base = len(base) if base is not None else 0
+        records = bytearray(base.records()) if base is not None else bytearray()
+        odd_codes = dict(base.odd_codes) if base is not None else {}
+        extra = dict(base.extra) if base is not None else {}
+        new_ids, new_codes = [], []
+        next_row = n_base
+        for row in range(len(self.ids)):
+            base_row = self.base_rows[row]
+            values = (self.ids[row], self.balance[row], self.referred_by[row], self.referrals[row],
+                      self.codes[row], self.flags[row])
+            if base_row < 0:
+                file_row = next_row
+                next_row += 1
+                records += record.pack(*values)
+                new_ids.append((values[0], file_row))
+                code_changed = True
+            else:
+                file_row = base_row
+                code_changed = values[4] != base.record(base_row)[4]
+                record.pack_into(records, file_row * record.size, *values)
+            if values[4] >= 0 and code_changed:
+                # Eski kod indeksda qolsa ham find_code uni yozuv bilan tekshiradi
+                new_codes.append((values[4], file_row))
+            odd_codes.pop(file_row, None)
+            extra.pop(file_row, None)
+            if row in self.odd_codes:
+                odd_codes[file_row] = self.odd_codes[row]
+            if self.extra.get(row):
+                extra[file_row] = self.extra[row]
+        empty_q, empty_i = memoryview(array("q")), memoryview(array("i"))
+        ids, id_rows = _insert_sorted(base.ids if base is not None else empty_q,
+                                      base.id_rows if base is not None else empty_i, sorted(new_ids))
+        codes, code_rows = _insert_sorted(base.codes if base is not None else empty_i,
+                                          base.code_rows if base is not None else empty_i, sorted(new_codes))
+        trailer = json.dumps({"odd_codes": odd_codes, "extra": extra, "ledger_seq": self.ledger_seq},
+                             ensure_ascii=False).encode()
+        yield UserSnapshot.HEADER.pack(UserSnapshot.MAGIC, len(ids), len(codes), len(trailer))
+        yield from (ids, id_rows, codes, code_rows, records, trailer)
+
+@instrument_store
+class JsonStore(BaseStore):
+    """users.json / games.json fayllariga asoslangan ombor (xotirada UserTable + write-behind)."""
+
+    def __init__(self, users_file: str = USERS_FILE, games_file: str = DATA_FILE,
+                 users_format: str = USERS_FORMAT, users_bin_file: str = USERS_BIN_FILE):
+        self.users_file = users_bin_file if users_format == "binary" else users_file
+        self.games_file = games_file
+        # withdraw_code -> user_id teskari indeksi ham UserTable ichida
+        if users_format == "binary" and Path(users_bin_file).exists():
+            self.users = UserTable.from_snapshot(users_bin_file)
+        else:
+            # users.bin hali yo‘q bo‘lsa users.json dan o‘qiladi, keyingi saqlash users.bin ga yoziladi
+            self.users = UserTable.from_dict(load_users(users_file))
+        self.games: Dict[str, dict] = load_games(games_file)
+        self.game_seq = int(self.games.pop(GAMES_SEQ_KEY, 0))
+        # Saralangan id lar – birinchi o‘tishda (prepare_user_scan, thread'da) quriladi. Keyin qo‘shilganlar
+        # _new_ids ga (append-only) yoziladi va yangi o‘tish (after=0: broadcast/eksport boshi) boshida qo‘shiladi.
+        self._sorted_ids: Optional[array] = None
+        self._new_ids: List[int] = []
+        self._track_new_ids = False
+        self._scan_lock = asyncio.Lock()
+        if users_format == "binary":
+            write_users = lambda table: atomic_write_chunks(self.users_file, table.iter_binary(), binary=True)
+        else:
+            write_users = lambda table: atomic_write_chunks(self.users_file, table.iter_json())
+        self.users_saver = WriteBehindSaver(
+            os.path.basename(self.users_file),
+            snapshot=self._users_snapshot,
+            write=write_users,
+            interval_ms=SAVE_INTERVAL_MS,
+            # Jurnal fayldan oldin diskda bo‘ladi: credit() maydonlari (start_bonus_given) faylda
+            # bo‘lsa, ularning balans yozuvi ham jurnalda bo‘ladi
+            before_write=lambda: self.ledger.sync(),
+        )
+        self.games_saver = WriteBehindSaver(
+            "games.json",
+            snapshot=lambda: {GAMES_SEQ_KEY: self.game_seq, **{name: dict(g) for name, g in self.games.items()}},
+            write=lambda data: save_games(data, self.games_file),
+            interval_ms=SAVE_INTERVAL_MS,
+        )
+        self.pending_bonuses: Dict[str, float] = load_pending_bonuses(PENDING_BONUS_FILE)
+        self.pending_saver = WriteBehindSaver(
+            "pending_bonuses.json",
+            snapshot=lambda: dict(self.pending_bonuses),
+            write=lambda data: atomic_write_json(PENDING_BONUS_FILE, data),
+            interval_ms=SAVE_INTERVAL_MS,
+        )
+        self.counters: Dict[str, int] = load_counters(COUNTERS_FILE)
+        self.counters_saver = WriteBehindSaver(
+            "counters.json",
+            snapshot=lambda: dict(self.counters),
+            write=lambda data: atomic_write_json(COUNTERS_FILE, data),
+            interval_ms=SAVE_INTERVAL_MS,
+        )
+        # users.bin balanslarni o‘zi saqlaydi (ledger_seq bilan): ishga tushishda faqat jurnal dumi
+        # qo‘llanadi, shuning uchun snapshotdagi yozuvlar decode qilinmaydi.
+        binary = users_format == "binary"
+        self.ledger = BalanceLedger(
+            LEDGER_FILE,
+            BALANCE_SNAPSHOT_FILE,
+            users_snapshot=self.users.snapshot,
+            checkpoint=self._checkpoint_users,
+            users_hold_balances=binary,
+        )
+        self.ledger.recover(self._restore_balance, self._replay_balance, self._restore_fields,
+                            checkpoint_seq=self.users.ledger_seq if binary else None)
+
+    def _ledger_user(self, user_id_str: str):
+        user = self.users.get(user_id_str)
+        if user is None:
+            # users.json yozilishidan oldin to‘xtab qolgan bo‘lsa – yozuv tiklanadi
+            logger.warning(f"{user_id_str} foydalanuvchisi faqat balans jurnalida bor, yozuv tiklandi.")
+            self.users[user_id_str] = {
+                "balance": 0,
+                "referred_by": None,
+                "referrals": 0,
+                "start_bonus_given": False,
+                "withdraw_code": None,
+            }
+            user = self.users[user_id_str]
+            self.users_saver.mark_dirty()
+        return user
+
+    def _restore_balance(self, user_id_str: str, balance: int):
+        self._ledger_user(user_id_str)["balance"] = balance
+
+    def _replay_balance(self, user_id_str: str, delta: int):
+        user = self._ledger_user(user_id_str)
+        user["balance"] += delta
+
+    def _restore_fields(self, user_id_str: str, fields: dict):
+        self._ledger_user(user_id_str).update(fields)
+        self.users_saver.mark_dirty()
+
+    def _users_snapshot(self) -> UserTable:
+        table = self.users.snapshot()
+        # Nusxa event loopda olinadi: undagi balanslar aynan shu seq gacha bo‘lgan yozuvlarni o‘z ichiga oladi
+        table.ledger_seq = self.ledger.seq
+        return table
+
+    async def _checkpoint_users(self):
+        """Balans jurnali uchun checkpoint: foydalanuvchilar fayli joriy holat bilan darhol yoziladi."""
+        self.users_saver.mark_dirty()
+        await self.users_saver.flush()
+
+    def get_user(self, user_id: int) -> Optional[dict]:
+        return self.users.get(user_id)
+
+    async def create_user(self, user_id: int, record: dict) -> dict:
+        if self._track_new_ids and user_id not in self.users:
+            self._new_ids.append(user_id)
+        self.users[user_id] = record
+        self.users_saver.mark_dirty()
+        return self.users[user_id]
+
+    async def update_user(self, user_id: int, **fields) -> None:
+        self.users[user_id].update(fields)
+        self.users_saver.mark_dirty()
+
+    async def increment_user(self, user_id: int, **deltas) -> dict:
+        user = self.users[user_id]
+        for field, delta in deltas.items():
+            user[field] = user.get(field, 0) + delta
+        self.users_saver.mark_dirty()
+        return user
+
+    async def credit(self, user_id: int, amount: int, reason: str, **fields) -> dict:
+        user = self.users[user_id]
+        self.ledger.append(user_id, amount, reason, fields)
+        # users.json qayta yozilmaydi: balansning ishonchli manbasi – jurnal va snapshot.
+        user["balance"] = user.get("balance", 0) + amount
+        if fields:
+            user.update(fields)
+            self.users_saver.mark_dirty()
+        return user
+
+    async def add_referral(self, user_id: int, referred_by: int) -> dict:
+        await self.update_user(user_id, referred_by=referred_by)
+        return await self.increment_user(referred_by, referrals=1)
+
+    def code_exists(self, code: str) -> bool:
+        return self.users.find_code(code) is not None
+
+    async def reserve_code_seq(self, count: int) -> int:
+        start = self.counters.get("code_seq", 0)
+        self.counters["code_seq"] = start + count
+        self.counters_saver.mark_dirty()
+        return start
+
+    def find_user_by_code(self, code: str) -> Optional[int]:
+        return self.users.find_code(code)
+
+    def user_count(self) -> int:
+        return len(self.users)
+
+    def _sorted_from(self, after: int) -> int:
+        """_sorted_ids dagi after dan keyingi birinchi o‘rin.
+
+        O‘tish davomida qo‘shilgan foydalanuvchilar shu o‘tishga kirmaydi (tartib
+        o‘zgarmaydi, cursor barqaror) – ular keyingi broadcast/eksportda bo‘ladi.
+        """
+        if self._sorted_ids is None:
+            # prepare_user_scan() chaqirilmagan bo‘lsa – shu yerda (sinxron) quriladi
+            self._track_new_ids = True
+            self._new_ids = []
+            self._sorted_ids = self.users.sorted_ids()
+        elif after == 0 and self._new_ids:
+            ids = memoryview(self._sorted_ids)
+            self._sorted_ids, _ = _insert_sorted(ids, ids, ((user_id, 0) for user_id in sorted(self._new_ids)))
+            self._new_ids = []
+        return bisect.bisect_right(self._sorted_ids, after)
+
+    async def prepare_user_scan(self):
+        """Saralangan id larni birinchi o‘tishdan oldin thread'da quradi (1M foydalanuvchida ~1 s saralash)."""
+        async with self._scan_lock:
+            if self._sorted_ids is not None:
+                return
+            # Ustunlar nusxasi loopda (memcpy); shu paytdan keyin qo‘shilganlar _new_ids ga tushadi
+            ids, base_rows = array("q", self.users.ids), array("i", self.users.base_rows)
+            self._track_new_ids = True
+            self._new_ids = []
+            sorted_ids = await asyncio.to_thread(UserTable.sort_ids, ids, base_rows, self.users.base)
+            if self._sorted_ids is None:
+                self._sorted_ids = sorted_ids
+
+    def iter_user_ids(self, after: int, limit: int):
+        ids = []
+        start = self._sorted_from(after)
+        for user_id in itertools.islice(self._sorted_ids, start, None):
+            if not self.users.is_blocked(user_id):
+                ids.append(user_id)
+                if len(ids) >= limit:
+                    break
+        return ids
+
+    def iter_referrers(self) -> Iterable[Tuple[int, int]]:
+        return self.users.referrers()
+
+    def iter_referral_edges(self) -> Iterable[Tuple[int, int]]:
+        return self.users.referral_edges()
+
+    def iter_user_records(self, after: int, limit: int) -> List[Tuple[int, dict]]:
+        start = self._sorted_from(after)
+        return [(user_id, self.users.record(user_id)) for user_id in self._sorted_ids[start:start + limit]]
+
+    def load_pending_bonuses(self) -> Dict[int, float]:
+        return {int(uid): due for uid, due in self.pending_bonuses.items()}
+
+    async def set_pending_bonus(self, user_id: int, due: float, replace: bool = False) -> None:
+        if replace or str(user_id) not in self.pending_bonuses:
+            self.pending_bonuses[str(user_id)] = due
+            self.pending_saver.mark_dirty()
+
+    async def remove_pending_bonuses(self, user_ids) -> None:
+        for user_id in user_ids:
+            self.pending_bonuses.pop(str(user_id), None)
+        self.pending_saver.mark_dirty()
+
+    def load_games(self) -> Dict:
+        return self.games
+
+    async def save_game(self, name: str, game: dict) -> None:
+        self.games[name] = game
+        self.games_saver.mark_dirty()
+
+    async def delete_game(self, name: str) -> None:
+        self.games.pop(name, None)
+        self.games_saver.mark_dirty()
+
+    async def next_game_seq(self, floor: int = 0) -> int:
+        self.game_seq = max(self.game_seq, floor) + 1
+        self.games_saver.mark_dirty()
+        return self.game_seq
+
+    async def add_game_views(self, name: str, delta: int) -> Optional[int]:
+        game = self.games.get(name)
+        if game is None:
+            return None
+        game["views"] = game.get("views", 0) + delta
+        self.games_saver.mark_dirty()
+        return game["views"]
+
+    async def flush_games(self):
+        await self.games_saver.flush()
+
+    def start(self):
+        self.users_saver.start()
+        self.games_saver.start()
+        self.pending_saver.start()
+        self.counters_saver.start()
+        self.ledger.start()
+
+    async def close(self):
+        if self.ledger.seq > self.ledger.snapshot_seq:
+            # To‘xtashda users.json ham joriy balanslar bilan yangilanadi
+            self.users_saver.mark_dirty()
+        await self.ledger.close()
+        await self.users_saver.close()
+        await self.games_saver.close()
+        await self.pending_saver.close()
+        await self.counters_saver.close()
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    balance INTEGER NOT NULL DEFAULT 0,
+    referred_by INTEGER,
+    referrals INTEGER NOT NULL DEFAULT 0,
+    start_bonus_given INTEGER NOT NULL DEFAULT 0,
+    withdraw_code TEXT,
+    blocked INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_withdraw_code ON users(withdraw_code);
+CREATE INDEX IF NOT EXISTS idx_users_referred_by ON users(referred_by);
+CREATE INDEX IF NOT EXISTS idx_users_referrals ON users(referrals);
+CREATE TABLE IF NOT EXISTS games (
+    name TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pending_bonuses (
+    user_id INTEGER PRIMARY KEY,
+    due REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pending_bonuses_due ON pending_bonuses(due);
+CREATE TABLE IF NOT EXISTS ledger (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    delta INTEGER NOT NULL,
+    reason TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS referral_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    referred_by INTEGER NOT NULL,
+    referrals INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('catalog_version', 0);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('game_seq', 0);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('code_seq', 0);
+"""
+
+@instrument_store
+class SqliteStore(BaseStore):
+    """SQLite (WAL rejimi) ombori: har bir o‘zgarish faqat bitta qatorni yangilaydi.
+
+    O‘qishlar event loopda, asosiy ulanish orqali (WAL da o‘quvchi yozuvchini kutmaydi).
+    Barcha o‘zgarishlar bitta yozuvchi thread'da, o‘z ulanishi bilan bajariladi: boshqa
+    jarayon (klaster worker) bazani band qilib turganda kutish event loopni to‘xtatmaydi.
+    """
+
+    def __init__(self, path: str = SQLITE_FILE):
+        self.path = path
+        # timeout – boshqa jarayon yozayotganda kutish vaqti (bu ulanishda faqat ishga tushishdagi sxema)
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=10)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SQLITE_SCHEMA)
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(users)")}
+        if "blocked" not in columns:
+            self.conn.execute("ALTER TABLE users ADD COLUMN blocked INTEGER NOT NULL DEFAULT 0")
+        self._writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self._write_conn: Optional[sqlite3.Connection] = None  # birinchi yozuvda, yozuvchi thread'da ochiladi
+
+    def _writer_conn(self) -> sqlite3.Connection:
+        if self._write_conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._write_conn = conn
+        return self._write_conn
+
+    async def _write(self, fn: Callable[[sqlite3.Connection], Any]):
+        """fn(ulanish) ni yozuvchi thread'da bajaradi; yozuvlar shu jarayonda navbat bilan ketadi."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, lambda: fn(self._writer_conn()))
+
+    async def _execute(self, statement: str, params: tuple = ()):
+        await self._write(lambda conn: conn.execute(statement, params))
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _immediate(conn: sqlite3.Connection):
+        """BEGIN IMMEDIATE ... COMMIT (xatoda ROLLBACK)."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _row_to_user(row: sqlite3.Row) -> dict:
+        return {
+            "balance": row["balance"],
+            "referred_by": row["referred_by"],
+            "referrals": row["referrals"],
+            "start_bonus_given": bool(row["start_bonus_given"]),
+            "withdraw_code": row["withdraw_code"],
+            "blocked": bool(row["blocked"]),
+        }
+
+    @classmethod
+    def _fetch_user(cls, conn: sqlite3.Connection, user_id: int) -> Optional[dict]:
+        row = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+        return cls._row_to_user(row) if row else None
+
+    def get_user(self, user_id: int) -> Optional[dict]:
+        return self._fetch_user(self.conn, user_id)
+
+    async def create_user(self, user_id: int, record: dict) -> dict:
+        await self._execute(
+            "INSERT INTO users (id, balance, referred_by, referrals, start_bonus_given, withdraw_code) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                user_id,
+                record.get("balance", 0),
+                record.get("referred_by"),
+                record.get("referrals", 0),
+                int(bool(record.get("start_bonus_given", False))),
+                record.get("withdraw_code"),
+            ),
+        )
+        return dict(record)
+
+    async def update_user(self, user_id: int, **fields) -> None:
+        if not fields:
+            return
+        for field in fields:
+            if field not in USER_FIELDS:
+                raise KeyError(field)
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        await self._execute(f"UPDATE users SET {assignments} WHERE id = ?", (*fields.values(), user_id))
+
+    async def increment_user(self, user_id: int, **deltas) -> dict:
+        for field in deltas:
+            if field not in USER_FIELDS:
+                raise KeyError(field)
+        assignments = ", ".join(f"{field} = {field} + ?" for field in deltas)
+
+        def write(conn):
+            conn.execute(f"UPDATE users SET {assignments} WHERE id = ?", (*deltas.values(), user_id))
+            return self._fetch_user(conn, user_id)
+
+        return await self._write(write)
+
+    async def credit(self, user_id: int, amount: int, reason: str, **fields) -> dict:
+        for field in fields:
+            if field not in USER_FIELDS:
+                raise KeyError(field)
+        assignments = "".join(f", {field} = ?" for field in fields)
+
+        def write(conn):
+            # Jurnal qatori, balans va maydonlar bitta tranzaksiyada yoziladi
+            with self._immediate(conn):
+                conn.execute(
+                    "INSERT INTO ledger (user_id, delta, reason, ts) VALUES (?, ?, ?, ?)",
+                    (user_id, amount, reason, time.time()),
+                )
+                conn.execute(f"UPDATE users SET balance = balance + ?{assignments} WHERE id = ?",
+                             (amount, *fields.values(), user_id))
+            return self._fetch_user(conn, user_id)
+
+        return await self._write(write)
+
+    async def add_referral(self, user_id: int, referred_by: int) -> dict:
+        def write(conn):
+            # Bog‘lanish, hisoblagich va referral_log qatori bitta tranzaksiyada: boshqa workerlar
+            # reyting va daraxtni shu jurnaldan yangilaydi
+            with self._immediate(conn):
+                conn.execute("UPDATE users SET referred_by = ? WHERE id = ?", (referred_by, user_id))
+                referrals = conn.execute(
+                    "UPDATE users SET referrals = referrals + 1 WHERE id = ? RETURNING referrals", (referred_by,)
+                ).fetchone()[0]
+                conn.execute(
+                    "INSERT INTO referral_log (user_id, referred_by, referrals) VALUES (?, ?, ?)",
+                    (user_id, referred_by, referrals),
+                )
+            return self._fetch_user(conn, referred_by)
+
+        return await self._write(write)
+
+    def code_exists(self, code: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM users WHERE withdraw_code = ?", (code,)).fetchone() is not None
+
+    async def reserve_code_seq(self, count: int) -> int:
+        row = await self._write(lambda conn: conn.execute(
+            "UPDATE meta SET value = value + ? WHERE key = 'code_seq' RETURNING value", (count,)
+        ).fetchone())
+        return row[0] - count
+
+    def find_user_by_code(self, code: str) -> Optional[int]:
+        row = self.conn.execute("SELECT id FROM users WHERE withdraw_code = ?", (code,)).fetchone()
+        return row["id"] if row else None
+
+    def user_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def iter_user_ids(self, after: int, limit: int):
+        rows = self.conn.execute(
+            "SELECT id FROM users WHERE id > ? AND blocked = 0 ORDER BY id LIMIT ?", (after, limit)
+        )
+        return [row["id"] for row in rows]
+
+    def iter_referrers(self) -> Iterable[Tuple[int, int]]:
+        return self.conn.execute("SELECT id, referrals FROM users WHERE referrals > 0").fetchall()
+
+    def iter_referral_edges(self) -> Iterable[Tuple[int, int]]:
+        return self.conn.execute("SELECT id, referred_by FROM users WHERE referred_by IS NOT NULL").fetchall()
+
+    def referral_seq(self) -> int:
+        return self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM referral_log").fetchone()[0]
+
+    def referral_changes(self, after: int, limit: int) -> List[Tuple[int, int, int, int]]:
+        return self.conn.execute(
+            "SELECT seq, user_id, referred_by, referrals FROM referral_log WHERE seq > ? ORDER BY seq LIMIT ?",
+            (after, limit),
+        ).fetchall()
+
+    def iter_user_records(self, after: int, limit: int) -> List[Tuple[int, dict]]:
+        rows = self.conn.execute("SELECT * FROM users WHERE id > ? ORDER BY id LIMIT ?", (after, limit))
+        return [(row["id"], self._row_to_user(row)) for row in rows]
+
+    def load_pending_bonuses(self) -> Dict[int, float]:
+        return {row["user_id"]: row["due"] for row in self.conn.execute("SELECT user_id, due FROM pending_bonuses")}
+
+    async def set_pending_bonus(self, user_id: int, due: float, replace: bool = False) -> None:
+        conflict = "DO UPDATE SET due = excluded.due" if replace else "DO NOTHING"
+        await self._execute(
+            f"INSERT INTO pending_bonuses (user_id, due) VALUES (?, ?) ON CONFLICT(user_id) {conflict}", (user_id, due)
+        )
+
+    async def remove_pending_bonuses(self, user_ids) -> None:
+        params = [(uid,) for uid in user_ids]
+        await self._write(lambda conn: conn.executemany("DELETE FROM pending_bonuses WHERE user_id = ?", params))
+
+    def load_games(self) -> Dict:
+        rows = self.conn.execute("SELECT name, data FROM games ORDER BY rowid").fetchall()
+        return {row["name"]: json.loads(row["data"]) for row in rows}
+
+    async def _catalog_changed(self, statement: str, params: tuple):
+        """Katalogni o‘zgartiruvchi so‘rov va catalog_version oshirilishi – bitta tranzaksiyada."""
+        def write(conn):
+            with self._immediate(conn):
+                conn.execute(statement, params)
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'catalog_version'")
+
+        await self._write(write)
+
+    async def save_game(self, name: str, game: dict) -> None:
+        # Mavjud o‘yinning ko‘rishlar soni saqlanadi: u faqat add_game_views() orqali o‘zgaradi,
+        # shuning uchun boshqa jarayondagi eski nusxa hisoblagichni orqaga qaytarmaydi.
+        await self._catalog_changed(
+            "INSERT INTO games (name, data) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET data = json_set(excluded.data, '$.views', "
+            "COALESCE(json_extract(games.data, '$.views'), 0))",
+            (name, json.dumps(game, ensure_ascii=False)),
+        )
+
+    async def delete_game(self, name: str) -> None:
+        await self._catalog_changed("DELETE FROM games WHERE name = ?", (name,))
+
+    async def next_game_seq(self, floor: int = 0) -> int:
+        row = await self._write(lambda conn: conn.execute(
+            "UPDATE meta SET value = MAX(value, ?) + 1 WHERE key = 'game_seq' RETURNING value", (floor,)
+        ).fetchone())
+        return row[0]
 
-games_data = load_games()
+    async def add_game_views(self, name: str, delta: int) -> Optional[int]:
+        row = await self._write(lambda conn: conn.execute(
+            "UPDATE games SET data = json_set(data, '$.views', COALESCE(json_extract(data, '$.views'), 0) + ?) "
+            "WHERE name = ? RETURNING json_extract(data, '$.views')",
+            (delta, name),
+        ).fetchone())
+        return row[0] if row else None
 
-def load_users() -> Dict:
-    if Path(USERS_FILE).exists():
-        with open(USERS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
+    def catalog_version(self) -> int:
+        return self.conn.execute("SELECT value FROM meta WHERE key = 'catalog_version'").fetchone()[0]
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        def write(conn):
+            now = time.time()
+            conn.execute(
+                "INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE leases.owner = excluded.owner OR leases.expires < ?",
+                (name, owner, now + ttl, now),
+            )
+            return conn.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()
+
+        row = await self._write(write)
+        return row is not None and row["owner"] == owner
+
+    async def release_lease(self, name: str, owner: str) -> None:
+        await self._execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    async def close(self):
+        await asyncio.to_thread(self._writer.shutdown)
+        if self._write_conn is not None:
+            self._write_conn.close()
+        self.conn.close()
+
+def import_json_to_sqlite(db_path: str = SQLITE_FILE, users_file: str = USERS_FILE, games_file: str = DATA_FILE):
+    """users.json va games.json ni SQLite bazaga ko‘chiradi (bir martalik import).
+
+    Import upsert orqali ishlaydi, shuning uchun uni eski bot ishlab turgan paytda
+    bir necha marta ishga tushirish mumkin: avval asosiy hajm ko‘chiriladi, so‘ng
+    botni to‘xtatib, oxirgi o‘zgarishlar tezda qayta import qilinadi va bot
+    STORAGE_BACKEND=sqlite bilan ishga tushiriladi.
+    """
+    users = load_users(users_file)
+    games = load_games(games_file)
+    game_seq = games.pop(GAMES_SEQ_KEY, 0)
+    code_seq = load_counters(COUNTERS_FILE).get("code_seq", 0)
+    sqlite_store = SqliteStore(db_path)
+    conn = sqlite_store.conn
+    conn.execute("BEGIN")
+    try:
+        conn.executemany(
+            "INSERT INTO users (id, balance, referred_by, referrals, start_bonus_given, withdraw_code) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET balance = excluded.balance, referred_by = excluded.referred_by, "
+            "referrals = excluded.referrals, start_bonus_given = excluded.start_bonus_given, "
+            "withdraw_code = excluded.withdraw_code",
+            (
+                (
+                    int(uid),
+                    u.get("balance", 0),
+                    u.get("referred_by"),
+                    u.get("referrals", 0),
+                    int(bool(u.get("start_bonus_given", False))),
+                    u.get("withdraw_code"),
+                )
+                for uid, u in users.items()
+            ),
+        )
+        # O‘yinlar to‘g‘ridan-to‘g‘ri shu tranzaksiyada yoziladi (save_game o‘z tranzaksiyasini ochadi).
+        # Qayta importda ko‘rishlar soni ham games.json dagi yangi qiymat bilan almashtiriladi.
+        conn.executemany(
+            "INSERT INTO games (name, data) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET data = excluded.data",
+            ((name, json.dumps(game, ensure_ascii=False)) for name, game in games.items()),
+        )
+        if games:
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'catalog_version'")
+        conn.execute("UPDATE meta SET value = MAX(value, ?) WHERE key = 'game_seq'", (game_seq,))
+        conn.execute("UPDATE meta SET value = MAX(value, ?) WHERE key = 'code_seq'", (code_seq,))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return len(users), len(games)
+
+def convert_users(to_format: str = "binary", users_file: str = USERS_FILE, bin_file: str = USERS_BIN_FILE) -> int:
+    """users.json <-> users.bin konvertori (bot to‘xtatilgan holda ishga tushiriladi).
+
+    Manba odatdagidek ochiladi (balanslar jurnali qo‘llanadi), natija esa
+    jurnalning joriy seq i bilan yoziladi: users.bin da u faylning o‘zida,
+    users.json uchun balance_snapshot.json da saqlanadi.
+    """
+    if to_format not in ("binary", "json"):
+        raise ValueError(f"Noma'lum format: {to_format}")
+    source = JsonStore(users_file, DATA_FILE, "json" if to_format == "binary" else "binary", bin_file)
+    # Jurnal dumi manbaning o‘z formatida saqlanadi (snapshot/checkpoint), so‘ng natija yoziladi
+    asyncio.run(source.ledger.close())
+    table = source.users
+    table.ledger_seq = source.ledger.seq
+    if to_format == "binary":
+        atomic_write_chunks(bin_file, table.iter_binary(), binary=True)
+    else:
+        atomic_write_chunks(users_file, table.iter_json())
+        atomic_write_json(BALANCE_SNAPSHOT_FILE, {"seq": source.ledger.seq, "balances": table.balances()})
+    return len(table)
+
+def create_store() -> BaseStore:
+    if STORAGE_BACKEND == "sqlite":
+        return SqliteStore(SQLITE_FILE)
+    return JsonStore(USERS_FILE, DATA_FILE)
+
+# Ombor import paytida emas, bot ishga tushganda (open_store) ochiladi: CLI buyruqlari
+# (import-json, convert-users) jonli ombor bilan bitta jurnal/bazani bo‘lishmaydi
+store: Optional[BaseStore] = None
+games_data: Dict[str, dict] = {}
+
+# ------------------- O‘YIN ID LARI -------------------
+# callback_data da o‘yin nomi o‘rniga qisqa, o‘zgarmas base-36 id ishlatiladi
+# (Telegram callback_data 64 bayt bilan cheklangan).
+# Yangi id lar ombordagi hisoblagichdan olinadi (next_game_seq); bu yerda faqat jarayon ko‘rgan eng katta
+# id saqlanadi – hisoblagich undan past bo‘lsa (hisoblagichsiz eski games.json), undan davom etadi.
+games_by_id: Dict[str, str] = {}
+_max_game_id = 0
+BASE36_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+def to_base36(n: int) -> str:
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = BASE36_DIGITS[r] + out
+        if n == 0:
+            return out
+
+def is_base36(token: str) -> bool:
+    return bool(token) and all(c in BASE36_DIGITS for c in token)
+
+async def register_game(name: str, game: dict) -> str:
+    """O‘yinni id indeksiga qo‘shadi (id bo‘lmasa yangisini beradi) va id ni qaytaradi."""
+    global _max_game_id
+    if not game.get("id"):
+        game["id"] = to_base36(await store.next_game_seq(_max_game_id))
+    _max_game_id = max(_max_game_id, int(game["id"], 36))
+    games_by_id[game["id"]] = name
+    return game["id"]
+
+def unregister_game(name: str):
+    game = games_data.get(name)
+    if game is not None:
+        games_by_id.pop(game.get("id"), None)
+
+def resolve_game_name(token: str) -> Optional[str]:
+    """callback_data dagi id bo‘yicha o‘yin nomini topadi (eski, nom yozilgan tugmalar ham ishlaydi).
+
+    id ko‘rinishidagi token nom sifatida qidirilmaydi: o‘chirilgan o‘yinning id si "5" nomli o‘yinni ochmaydi.
+    """
+    name = games_by_id.get(token)
+    if name is None and not is_base36(token) and token in games_data:
+        return token
+    return name
+
+async def index_games():
+    # Avval mavjud id lar, keyin id siz (eski) o‘yinlarga yangi id beriladi
+    for name, game in games_data.items():
+        if game.get("id"):
+            await register_game(name, game)
+    for name, game in games_data.items():
+        had_id = bool(game.get("id"))
+        await register_game(name, game)
+        if not had_id:
+            await store.save_game(name, game)
+
+async def open_store():
+    """Omborni ochadi va o‘yinlar katalogini indekslaydi (jarayonda bir marta, post_init dan)."""
+    global store, games_data
+    if store is not None:
+        return
+    store = create_store()
+    games_data = store.load_games()
+    await index_games()
+
+class ViewCounter:
+    """O‘yin ko‘rishlarini xotirada to‘playdi va jamlangan holda saqlaydi.
+
+    Har bir bosish faqat hisoblagichni oshiradi va views.log ga bitta qator
+    qo‘shadi (crash bo‘lsa, qayta ishga tushganda shu jurnaldan tiklanadi).
+    Har VIEWS_FLUSH_INTERVAL soniyada yoki VIEWS_FLUSH_THRESHOLD ko‘rish
+    to‘planganda deltalar games_data ga qo‘shilib, bitta yozuv bilan saqlanadi.
+    Saqlash va jurnalni o‘chirish orasida crash bo‘lsa, oxirgi partiya ikki
+    marta hisoblanishi mumkin (ko‘rishlar uchun maqbul). Ombor faqat deltani
+    qo‘shadi, shuning uchun bir nechta jarayon bitta bazaga yozishi mumkin.
+    """
+
+    def __init__(self, log_path: str = VIEWS_LOG_FILE):
+        self.log_path = log_path
+        self.flushing_path = f"{log_path}.flushing"
+        self._pending: Dict[str, int] = {}
+        self._pending_total = 0
+        self._file = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def recover(self):
+        """Oldingi ishga tushishdan qolgan (saqlanmagan) ko‘rishlarni games_data ga qo‘shadi."""
+        counts: Dict[str, int] = {}
+        for path in (self.flushing_path, self.log_path):
+            if not Path(path).exists():
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        name = json.loads(line)
+                    except ValueError:
+                        continue
+                    if name in games_data:
+                        counts[name] = counts.get(name, 0) + 1
+        await self._apply(counts)
+        recovered = sum(counts.values())
+        if recovered:
+            logger.info(f"views.log dan {recovered} ta ko‘rish tiklandi.")
+        return recovered
+
+    def incr(self, name: str):
+        self._pending[name] = self._pending.get(name, 0) + 1
+        self._pending_total += 1
+        self._file.write(json.dumps(name, ensure_ascii=False) + "\n")
+        if self._pending_total >= VIEWS_FLUSH_THRESHOLD:
+            self._wakeup.set()
+
+    def live(self, name: str) -> int:
+        """Saqlangan va hali saqlanmagan ko‘rishlar yig‘indisi."""
+        return games_data.get(name, {}).get("views", 0) + self._pending.get(name, 0)
+
+    def discard(self, name: str):
+        self._pending_total -= self._pending.pop(name, 0)
+
+    async def start(self):
+        if await self.recover():
+            await store.flush_games()
+        for path in (self.flushing_path, self.log_path):
+            if Path(path).exists():
+                os.remove(path)
+        self._file = open(self.log_path, "a", encoding="utf-8", buffering=1)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), VIEWS_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.error(f"Ko‘rishlarni saqlashda xatolik: {traceback.format_exc()}")
+
+    async def flush(self):
+        if not self._pending:
+            return
+        deltas, self._pending, self._pending_total = self._pending, {}, 0
+        # Jurnal chetga olinadi: shu paytdan keyingi bosishlar yangi faylga yoziladi
+        self._file.close()
+        os.replace(self.log_path, self.flushing_path)
+        self._file = open(self.log_path, "a", encoding="utf-8", buffering=1)
+        await self._apply(deltas)
+        await store.flush_games()
+        os.remove(self.flushing_path)
+
+    @staticmethod
+    async def _apply(deltas: Dict[str, int]):
+        """Deltalarni omborga qo‘shadi; games_data dagi qiymat ombordagi jami bilan yangilanadi."""
+        for name, delta in deltas.items():
+            total = await store.add_game_views(name, delta)
+            if total is not None and name in games_data:
+                games_data[name]["views"] = total
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._file is not None:
+            await self.flush()
+            self._file.close()
+            self._file = None
+
+views_counter = ViewCounter()
+
+# ------------------- ANALITIKA (VAQT BO‘YICHA HISOBLAGICHLAR) -------------------
+class RingCounter:
+    """Belgilangan sondagi vaqt bo‘laklaridan (bucket) iborat halqa.
+
+    Eski bo‘laklar yangi vaqt kelganda nolga tushiriladi va oyna yig‘indisi
+    (total) shu yerda kamaytiriladi, shuning uchun xotira va o‘qish narxi
+    tarix uzunligiga bog‘liq emas.
+    """
+
+    __slots__ = ("bucket_seconds", "size", "counts", "total", "head")
+
+    def __init__(self, bucket_seconds: int, size: int):
+        self.bucket_seconds = bucket_seconds
+        self.size = size
+        self.counts = [0] * size
+        self.total = 0
+        self.head = int(time.time() // bucket_seconds)
+
+    def _advance(self, now: float):
+        bucket = int(now // self.bucket_seconds)
+        if bucket <= self.head:
+            return
+        for step in range(1, min(bucket - self.head, self.size) + 1):
+            idx = (self.head + step) % self.size
+            self.total -= self.counts[idx]
+            self.counts[idx] = 0
+        self.head = bucket
+
+    def add(self, n: int = 1, now: Optional[float] = None):
+        self._advance(time.time() if now is None else now)
+        self.counts[self.head % self.size] += n
+        self.total += n
+
+    def window_total(self, now: Optional[float] = None) -> int:
+        self._advance(time.time() if now is None else now)
+        return self.total
+
+    def series(self, now: Optional[float] = None):
+        """Bo‘laklar qiymatlari – eskisidan yangisigacha."""
+        self._advance(time.time() if now is None else now)
+        start = (self.head + 1) % self.size
+        return self.counts[start:] + self.counts[:start]
+
+class TimeSeriesMetric:
+    """Bitta ko‘rsatkich uchun daqiqalik, soatlik va kunlik halqalar."""
+
+    def __init__(self, title: str):
+        self.title = title
+        self.minutes = RingCounter(60, 60)       # so‘nggi 60 daqiqa
+        self.hours = RingCounter(3600, 24)       # so‘nggi 24 soat
+        self.days = RingCounter(86400, 30)       # so‘nggi 30 kun
+
+    def add(self, n: int = 1):
+        now = time.time()
+        self.minutes.add(n, now)
+        self.hours.add(n, now)
+        self.days.add(n, now)
+
+analytics: Dict[str, TimeSeriesMetric] = {
+    "game_views": TimeSeriesMetric("O‘yin ko‘rishlari"),
+    "new_users": TimeSeriesMetric("Yangi foydalanuvchilar"),
+    "referrals": TimeSeriesMetric("Takliflar"),
+    "withdraw_attempts": TimeSeriesMetric("Pul yechish urinishlari"),
+}
+
+def track(metric: str, n: int = 1):
+    analytics[metric].add(n)
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+def sparkline(values) -> str:
+    peak = max(values)
+    if not peak:
+        return SPARK_CHARS[0] * len(values)
+    return "".join(SPARK_CHARS[min(len(SPARK_CHARS) - 1, v * len(SPARK_CHARS) // (peak + 1))] for v in values)
 
-def save_users(users: Dict):
-    with open(USERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(users, f, ensure_ascii=False, indent=4)
+def render_analytics() -> str:
+    """Admin statistikasi uchun analitika bloki (tarix uzunligidan qat’i nazar doimiy vaqt)."""
+    now = time.time()
+    lines = ["📈 Faollik (60 daqiqa / 24 soat / 30 kun):"]
+    for metric in analytics.values():
+        lines.append(
+            f"• {metric.title}: {metric.minutes.window_total(now)} / "
+            f"{metric.hours.window_total(now)} / {metric.days.window_total(now)}"
+        )
+        lines.append(f"  24 soat: {sparkline(metric.hours.series(now))}")
+    return "\n".join(lines)
+
+# ------------------- PARALLEL ISHLOV BERISH -------------------
+class KeyedLocks:
+    """Kalit (masalan, user_id) bo‘yicha asyncio qulflari.
+
+    Qulf faqat kimdir kutayotgan yoki ushlab turgan paytda mavjud bo‘ladi,
+    shuning uchun lug‘at hajmi faol foydalanuvchilar soni bilan cheklanadi.
+    """
+
+    def __init__(self):
+        self._locks: Dict[int, list] = {}
+
+    @contextlib.asynccontextmanager
+    async def hold(self, key: int):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+user_locks = KeyedLocks()
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Turli foydalanuvchilarning yangilanishlarini parallel, bitta foydalanuvchinikini esa
+    kelish tartibida ketma-ket ishlaydi.
+
+    Asosiy semafor faqat qabul qilingan (kutayotgan) yangilanishlar sonini cheklaydi;
+    haqiqiy parallel ishlov berish foydalanuvchi qulfi olingandan keyin concurrency
+    bilan cheklanadi. Shu sababli bitta foydalanuvchining navbati boshqalarning
+    slotlarini band qilmaydi. Balans va referral o‘zgarishlari ham shu qulf ostida
+    bajarilgani uchun /start ni ketma-ket bosish poygaga olib kelmaydi.
+    """
+
+    def __init__(self, concurrency: int = CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates=concurrency * 8)
+        self._running = asyncio.Semaphore(concurrency)
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            async with self._running:
+                await coroutine
+            return
+        async with user_locks.hold(user.id):
+            async with self._running:
+                await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+# ------------------- CHIQUVCHI XABARLAR NAVBATI -------------------
+PRIORITY_INTERACTIVE = 0   # Foydalanuvchi harakatiga javob (standart)
+PRIORITY_NOTIFICATION = 1  # Bildirishnomalar (referral, bonus)
+PRIORITY_BULK = 2          # Ommaviy xabarlar (broadcast) – tashlab yuborilmaydi, faqat kutadi
+
+NOTIFICATION = {"priority": PRIORITY_NOTIFICATION}
+BULK = {"priority": PRIORITY_BULK}
+
+class OutboxFullError(TelegramError):
+    """Chiquvchi navbat to‘lganda past ustuvorlikdagi xabar tashlab yuboriladi."""
+
+class TokenBucket:
+    """Oddiy token bucket: rate – soniyadagi token, capacity – maksimal zaxira."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now: Optional[float] = None) -> float:
+        """Token oladi va 0 qaytaradi; token bo‘lmasa, qancha kutish kerakligini qaytaradi."""
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def block(self, seconds: float):
+        """Telegram RetryAfter qaytarganda bucketni shuncha vaqtga bo‘shatadi."""
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 1.0) - seconds * self.rate
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class OutboundRateLimiter(BaseRateLimiter[Dict[str, Any]]):
+    """Bot API ga chiquvchi barcha so‘rovlar uchun markaziy navbat.
+
+    chat_id bo‘lgan har bir so‘rov (send_message, reply_*, edit_* ...) avval chat
+    bo‘yicha, so‘ng umumiy token bucketdan o‘tadi. Umumiy bucket oldida kutayotganlar
+    ustuvorlik bo‘yicha navbatda turadi: foydalanuvchiga javoblar bildirishnomalardan
+    oldin yuboriladi. Ustuvorlik rate_limit_args={"priority": ...} orqali beriladi.
+    RetryAfter kelsa, chat va umumiy bucket retry_after soniyaga to‘xtatiladi (Telegram
+    flood limiti butun botga tegishli – boshqa chatlarga yuborish ham shu payt kutadi)
+    va so‘rov qayta yuboriladi.
+    """
+
+    def __init__(self):
+        self._global = TokenBucket(GLOBAL_SEND_RATE, GLOBAL_SEND_RATE)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._waiters = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._pump_task: Optional[asyncio.Task] = None
+        self._chat_waiting = 0
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._waiters) + self._chat_waiting
 
-users_data = load_users()
+    def stats(self) -> Dict[str, int]:
+        return {"depth": self.depth, "sent": self.sent, "retried": self.retried, "dropped": self.dropped}
+
+    async def initialize(self) -> None:
+        if self._pump_task is None:
+            self._pump_task = asyncio.create_task(self._pump())
+
+    async def shutdown(self) -> None:
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            try:
+                await self._pump_task
+            except asyncio.CancelledError:
+                pass
+            self._pump_task = None
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= 10000:
+                now = time.monotonic()
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.idle(now)}
+            bucket = self._chats[chat_id] = TokenBucket(CHAT_SEND_RATE, CHAT_SEND_BURST)
+        return bucket
+
+    async def _pump(self):
+        """Umumiy bucketdan tokenlarni ustuvorlik tartibida kutayotganlarga tarqatadi."""
+        while True:
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            wait = self._global.take()
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+
+    async def _acquire(self, chat_id: int, priority: int):
+        bucket = self._chat_bucket(chat_id)
+        while True:
+            wait = bucket.take()
+            if not wait:
+                break
+            self._chat_waiting += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._chat_waiting -= 1
+        if not self._waiters and not self._global.take():
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._wakeup.set()
+        await future
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            # answerCallbackQuery, getUpdates va h.k. cheklanmaydi
+            if endpoint == "getUpdates":
+                # Long polling – kutish vaqti API kechikishi emas
+                return await callback(*args, **kwargs)
+            with perf_span("api", endpoint, _SPAN_API):
+                return await callback(*args, **kwargs)
+        priority = (rate_limit_args or {}).get("priority", PRIORITY_INTERACTIVE)
+        if priority == PRIORITY_NOTIFICATION and self.depth >= OUTBOX_MAX_DEPTH:
+            self.dropped += 1
+            raise OutboxFullError(f"Chiquvchi navbat to‘la ({self.depth}), {endpoint} tashlab yuborildi")
+        for attempt in range(SEND_MAX_RETRIES + 1):
+            await self._acquire(chat_id, priority)
+            try:
+                with perf_span("api", endpoint, _SPAN_API):
+                    result = await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                if attempt == SEND_MAX_RETRIES:
+                    self.dropped += 1
+                    raise
+                self.retried += 1
+                self._chat_bucket(chat_id).block(exc.retry_after)
+                self._global.block(exc.retry_after)
+                logger.warning(f"{endpoint}: RetryAfter {exc.retry_after}s (chat {chat_id}), qayta urinish")
+                continue
+            self.sent += 1
+            return result
+
+rate_limiter = OutboundRateLimiter()
+
+# ------------------- FLOOD HIMOYASI -------------------
+class FloodGuard:
+    """Barcha handlerlardan oldin (group -1) ishlaydigan himoya.
+
+    Har bir foydalanuvchi uchun token bucket: limitdan oshgan yangilanishlar
+    handlerlarga yetib bormaydi. Bir xil callback_data dedup_window ichida qayta
+    kelsa ham o‘tkazib yuboriladi. Ikkala holatda ham callback so‘roviga faqat
+    query.answer() bilan javob beriladi. Adminlar cheklanmaydi.
+    """
+
+    def __init__(self, rate: float = FLOOD_RATE, burst: int = FLOOD_BURST, dedup_window: float = FLOOD_DEDUP_WINDOW):
+        self.rate = rate
+        self.burst = burst
+        self.dedup_window = dedup_window
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._last_callback: Dict[int, Tuple[str, float]] = {}
+        self.duplicates = 0
+        self.throttled = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"duplicates": self.duplicates, "throttled": self.throttled}
+
+    def _bucket(self, user_id: int, now: float) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= 10000:
+                self._buckets = {uid: b for uid, b in self._buckets.items() if not b.idle(now)}
+                self._last_callback = {
+                    uid: last for uid, last in self._last_callback.items() if now - last[1] < self.dedup_window
+                }
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    async def check(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user = update.effective_user
+        if user is None or is_admin(user.id):
+            return
+        now = time.monotonic()
+        query = update.callback_query
+        if query is not None:
+            last = self._last_callback.get(user.id)
+            if last is not None and last[0] == query.data and now - last[1] < self.dedup_window:
+                self.duplicates += 1
+                await self._skip(query)
+        if self._bucket(user.id, now).take(now) > 0:
+            self.throttled += 1
+            await self._skip(query, "⏳ Juda tez! Biroz kuting.")
+        if query is not None:
+            self._last_callback[user.id] = (query.data, now)
+
+    @staticmethod
+    async def _skip(query, text: Optional[str] = None):
+        if query is not None:
+            try:
+                await query.answer(text)
+            except TelegramError:
+                pass
+        raise ApplicationHandlerStop
+
+flood_guard = FloodGuard()
 
 # ------------------- YORDAMCHI FUNKSIYALAR -------------------
+CODE_SPACE = 10 ** 7       # 7 xonali kodlar soni
+CODE_SEQ_BLOCK = 64        # Ombordan bir yozuvda band qilinadigan kod hisoblagichi qiymatlari
+_CODE_KEY = hashlib.sha256(WITHDRAW_CODE_KEY.encode()).digest()
+_code_block = [0, 0]       # [keyingi, chegara) – band qilingan, hali ishlatilmagan hisoblagich qiymatlari
+
 def is_admin(user_id: int) -> bool:
     return user_id == ADMIN_ID
 
-def generate_unique_code() -> str:
-    """7 xonali unikal kod generatsiya qiladi (mavjud kodlar bilan solishtiradi)."""
+def code_permute(n: int) -> int:
+    """[0, CODE_SPACE) dagi kalitli biyeksiya: 24 bitli 4 raundli Feistel + cycle-walking."""
     while True:
-        code = f"{random.randint(0, 9999999):07d}"  # 7 xonali, yetakchi nol bilan
-        existing_codes = [u.get("withdraw_code") for u in users_data.values() if u.get("withdraw_code")]
-        if code not in existing_codes:
+        left, right = n >> 12, n & 0xFFF
+        for rnd in range(4):
+            digest = hashlib.blake2b(struct.pack("<BH", rnd, right), digest_size=2, key=_CODE_KEY).digest()
+            left, right = right, left ^ (int.from_bytes(digest, "little") & 0xFFF)
+        n = (left << 12) | right
+        if n < CODE_SPACE:
+            return n
+
+async def generate_unique_code() -> str:
+    """7 xonali unikal kod: ombordagi o‘sib boruvchi hisoblagichning kalitli permutatsiyasi.
+
+    Hisoblagich CODE_SEQ_BLOCK lik bloklar bilan band qilinadi (64 kodga bitta yozuv), har bir
+    qiymat code_permute() bilan boshqa kodga o‘tadi: bitta aylanishda kod takrorlanmaydi va
+    ketma-ket kodlarni taxmin qilib bo‘lmaydi. code_exists() faqat eski (tasodifiy) kodlar bilan
+    to‘qnashuvni o‘tkazib yuborish uchun – odatda bitta tekshiruv.
+    """
+    for _ in range(CODE_SPACE):
+        if _code_block[0] == _code_block[1]:
+            start = await store.reserve_code_seq(CODE_SEQ_BLOCK)
+            _code_block[:] = [start, start + CODE_SEQ_BLOCK]
+        seq = _code_block[0]
+        _code_block[0] += 1
+        code = f"{code_permute(seq % CODE_SPACE):07d}"  # 7 xonali, yetakchi nol bilan
+        if not store.code_exists(code):
             return code
+    raise RuntimeError("7 xonali kodlar tugadi")
+
+# O‘yinlar katalogi faqat admin qo‘shganda/tahrirlaganda/o‘chirganda o‘zgaradi, shuning uchun
+# klaviaturalar va o‘yin xabarlari bir marta quriladi va shu handlerlarda bekor qilinadi.
+BACK_TO_MAIN_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Bosh menyu", callback_data="main_menu")]])
+
+class GamePayload(NamedTuple):
+    """O‘yin sahifasi uchun tayyor xabar: matn, tugmalar va media id lari."""
+    text: str
+    photo_id: Optional[str]
+    file_id: Optional[str]
+    reply_markup: InlineKeyboardMarkup
+
+_keyboard_cache: Dict[str, InlineKeyboardMarkup] = {}
+_game_payloads: Dict[str, GamePayload] = {}
+_catalog_names: list = []
+
+def invalidate_catalog_cache(game_name: Optional[str] = None):
+    """Katalog o‘zgarganda keshlangan klaviaturalar va o‘yin xabarini bekor qiladi."""
+    _keyboard_cache.clear()
+    _catalog_names.clear()
+    if game_name is None:
+        _game_payloads.clear()
+    else:
+        _game_payloads.pop(game_name, None)
+
+def _build_game_payload(game: dict) -> GamePayload:
+    button_text = game.get("button_text")
+    button_url = game.get("button_url")
+    # Agar tashqi havola tugmasi bo‘lsa, uni ham qo‘shamiz (faqat rasm/matn xabariga)
+    if button_text and button_url:
+        reply_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton(button_text, url=button_url)],
+            [InlineKeyboardButton("◀️ Bosh menyu", callback_data="main_menu")]
+        ])
+    else:
+        reply_markup = BACK_TO_MAIN_MARKUP
+    return GamePayload(
+        text=game.get("text", "Maʼlumot hozircha kiritilmagan."),
+        photo_id=game.get("photo_id"),
+        file_id=game.get("file_id"),
+        reply_markup=reply_markup,
+    )
+
+def get_game_payload(game_name: str) -> Optional[GamePayload]:
+    payload = _game_payloads.get(game_name)
+    if payload is None:
+        game = games_data.get(game_name)
+        if game is None:
+            return None
+        payload = _game_payloads[game_name] = _build_game_payload(game)
+    return payload
+
+def catalog_page(page: int):
+    """Sahifadagi o‘yin nomlari va sahifalar soni."""
+    if not _catalog_names and games_data:
+        _catalog_names.extend(games_data.keys())
+    pages = max(1, -(-len(_catalog_names) // GAMES_PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+    return _catalog_names[page * GAMES_PAGE_SIZE:(page + 1) * GAMES_PAGE_SIZE], page, pages
 
-def get_game_keyboard() -> InlineKeyboardMarkup:
-    """O‘yinlar ro‘yxati + bosh menyu tugmasi."""
-    keyboard = []
-    for game in games_data.keys():
-        keyboard.append([InlineKeyboardButton(game, callback_data=f"game_{game}")])
-    keyboard.append([InlineKeyboardButton("◀️ Bosh menyu", callback_data="main_menu")])
-    return InlineKeyboardMarkup(keyboard)
+def _page_nav_row(page: int, pages: int, callback_prefix: str):
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("⬅️ Oldingi", callback_data=f"{callback_prefix}{page - 1}"))
+    if page < pages - 1:
+        row.append(InlineKeyboardButton(f"Keyingi ➡️ ({page + 2}/{pages})", callback_data=f"{callback_prefix}{page + 1}"))
+    return row
+
+def get_game_keyboard(page: int = 0) -> InlineKeyboardMarkup:
+    """O‘yinlar ro‘yxati (sahifalab) + bosh menyu tugmasi."""
+    cache_key = f"games:{page}"
+    markup = _keyboard_cache.get(cache_key)
+    if markup is None:
+        names, page, pages = catalog_page(page)
+        keyboard = []
+        for game in names:
+            keyboard.append([InlineKeyboardButton(game, callback_data=f"game_{games_data[game]['id']}")])
+        nav = _page_nav_row(page, pages, "games_page_")
+        if nav:
+            keyboard.append(nav)
+        keyboard.append([InlineKeyboardButton("◀️ Bosh menyu", callback_data="main_menu")])
+        markup = _keyboard_cache[cache_key] = InlineKeyboardMarkup(keyboard)
+    return markup
+
+ADMIN_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("➕ Add Game", callback_data="admin_add")],
+    [InlineKeyboardButton("➖ Remove Game", callback_data="admin_remove_list")],
+    [InlineKeyboardButton("✏️ Edit Game", callback_data="admin_edit_list")],
+    [InlineKeyboardButton("📊 Statistics", callback_data="admin_stats")],
+    [InlineKeyboardButton("📢 Broadcast", callback_data="admin_broadcast")],
+    [InlineKeyboardButton("📥 Export users", callback_data="admin_export")],
+    [InlineKeyboardButton("🚩 Referral flags", callback_data="admin_ref_flags")],
+    [InlineKeyboardButton("❌ Close", callback_data="admin_close")]
+])
 
 def get_admin_keyboard() -> InlineKeyboardMarkup:
-    keyboard = [
-        [InlineKeyboardButton("➕ Add Game", callback_data="admin_add")],
-        [InlineKeyboardButton("➖ Remove Game", callback_data="admin_remove_list")],
-        [InlineKeyboardButton("✏️ Edit Game", callback_data="admin_edit_list")],
-        [InlineKeyboardButton("📊 Statistics", callback_data="admin_stats")],
-        [InlineKeyboardButton("❌ Close", callback_data="admin_close")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return ADMIN_KEYBOARD
 
-def get_games_list_keyboard(action_prefix: str) -> InlineKeyboardMarkup:
-    keyboard = []
-    for game in games_data.keys():
-        keyboard.append([InlineKeyboardButton(game, callback_data=f"{action_prefix}{game}")])
-    keyboard.append([InlineKeyboardButton("◀️ Back", callback_data="admin_back")])
-    return InlineKeyboardMarkup(keyboard)
+def get_games_list_keyboard(action_prefix: str, page: int = 0) -> InlineKeyboardMarkup:
+    cache_key = f"list:{action_prefix}:{page}"
+    markup = _keyboard_cache.get(cache_key)
+    if markup is None:
+        names, page, pages = catalog_page(page)
+        keyboard = []
+        for game in names:
+            keyboard.append([InlineKeyboardButton(game, callback_data=f"{action_prefix}{games_data[game]['id']}")])
+        nav = _page_nav_row(page, pages, f"admin_page_{action_prefix}")
+        if nav:
+            keyboard.append(nav)
+        keyboard.append([InlineKeyboardButton("◀️ Back", callback_data="admin_back")])
+        markup = _keyboard_cache[cache_key] = InlineKeyboardMarkup(keyboard)
+    return markup
+
+# Asosiy menyu tugmalari:
+#   - 1-qator: O‘yinlar ro‘yxati
+#   - 2-qator: Pul ishlash | Balans (yonma-yon)
+#   - 3-qator: Top taklifchilar
+MAIN_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🎮 O‘yinlar ro‘yxati", callback_data="show_games")],
+    [
+        InlineKeyboardButton("💰 Pul ishlash", callback_data="earn"),
+        InlineKeyboardButton("💵 Balans", callback_data="balance")
+    ],
+    [InlineKeyboardButton("🏆 Top taklifchilar", callback_data="leaderboard")]
+])
 
 def get_main_keyboard() -> InlineKeyboardMarkup:
-    """Asosiy menyu tugmalari:
-       - 1-qator: O‘yinlar ro‘yxati
-       - 2-qator: Pul ishlash | Balans (yonma-yon)
-    """
-    keyboard = [
-        [InlineKeyboardButton("🎮 O‘yinlar ro‘yxati", callback_data="show_games")],
-        [
-            InlineKeyboardButton("💰 Pul ishlash", callback_data="earn"),
-            InlineKeyboardButton("💵 Balans", callback_data="balance")
-        ]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    """Asosiy menyu tugmalari (bir marta quriladi)."""
+    return MAIN_KEYBOARD
 
 def get_referral_link(user_id: int) -> str:
     """Foydalanuvchi uchun referral havola yaratish."""
@@ -118,36 +2710,620 @@ def get_referral_link(user_id: int) -> str:
 
 async def ensure_user(user_id: int) -> dict:
     """Foydalanuvchi maʼlumotlarini yaratish yoki olish (referralni hisobga olmagan holda)."""
-    user_id_str = str(user_id)
-    if user_id_str not in users_data:
+    user = store.get_user(user_id)
+    if user is not None and not user.get("withdraw_code"):
+        await store.update_user(user_id, withdraw_code=await generate_unique_code())
+        user = store.get_user(user_id)
+    if user is not None and user.get("blocked"):
+        # Broadcastda bloklangan deb belgilangan, lekin botga qaytdi – keyingi xabarlarni yana oladi
+        await store.update_user(user_id, blocked=False)
+        user = store.get_user(user_id)
+    if user is None:
         # Yangi foydalanuvchi: unikal kod yaratish, referred_by = None
-        new_code = generate_unique_code()
-        users_data[user_id_str] = {
+        new_code = await generate_unique_code()
+        user = await store.create_user(user_id, {
             "balance": 0,
             "referred_by": None,
             "referrals": 0,
             "start_bonus_given": False,
             "withdraw_code": new_code
-        }
-        save_users(users_data)
-    return users_data[user_id_str]
-
-async def give_start_bonus(user_id: int, context: ContextTypes.DEFAULT_TYPE):
-    """1-2 daqiqadan so‘ng start bonusini berish."""
-    await asyncio.sleep(90)  # 1.5 daqiqa
-    user_id_str = str(user_id)
-    if user_id_str in users_data and not users_data[user_id_str].get("start_bonus_given", False):
-        users_data[user_id_str]["balance"] += START_BONUS
-        users_data[user_id_str]["start_bonus_given"] = True
-        save_users(users_data)
+        })
+        track("new_users")
+    return user
+
+async def give_start_bonus(user_id: int, bot: Bot):
+    """Start bonusini berish (BonusScheduler muddati kelganda chaqiradi)."""
+    user = store.get_user(user_id)
+    if user is not None and not user.get("start_bonus_given", False):
+        # Belgi va bonus bitta jurnal yozuvida: crashdan keyin ikkalasi ham bor yoki ikkalasi ham yo‘q
+        user = await store.credit(user_id, START_BONUS, "start_bonus", start_bonus_given=True)
         try:
-            await context.bot.send_message(
+            await bot.send_message(
                 chat_id=user_id,
-                text=f"🎉 Tabriklaymiz! Sizga start bonusi sifatida {START_BONUS} so‘m berildi. Endi balansingiz: {users_data[user_id_str]['balance']} so‘m."
+                text=f"🎉 Tabriklaymiz! Sizga start bonusi sifatida {START_BONUS} so‘m berildi. Endi balansingiz: {user['balance']} so‘m.",
+                rate_limit_args=NOTIFICATION
             )
         except Exception as e:
             logger.error(f"Bonus xabarini yuborishda xatolik: {e}")
 
+class BonusScheduler:
+    """Start bonuslari uchun yagona rejalashtiruvchi.
+
+    Har bir foydalanuvchi uchun alohida sleep vazifasi o‘rniga muddatlar
+    min-heap'da saqlanadi va store orqali diskka yoziladi. Bitta fon vazifasi
+    muddati kelgan bonuslarni partiyalab beradi; qayta ishga tushganda kutilayotgan
+    bonuslar store'dan tiklanadi. Bir foydalanuvchi faqat bir marta navbatga qo‘yiladi.
+    Berib bo‘lmagan bonus (store xatosi) navbatdan o‘chirilmaydi: u ortib boruvchi
+    kechikish bilan qayta rejalashtiriladi.
+    """
+
+    def __init__(self, delay: float = START_BONUS_DELAY, batch_size: int = BONUS_BATCH_SIZE):
+        self.delay = delay
+        self.batch_size = batch_size
+        # Klaster rejimi: schedule() faqat omborga yozadi, lider esa bazani poll_interval da o‘qiydi
+        self.persist_only = False
+        self.poll_interval: Optional[float] = None
+        self._heap = []
+        self._pending: Dict[int, float] = {}
+        self._attempts: Dict[int, int] = {}  # user_id -> ketma-ket muvaffaqiyatsiz urinishlar
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def load(self):
+        self._pending = store.load_pending_bonuses()
+        self._heap = [(due, user_id) for user_id, due in self._pending.items()]
+        heapq.heapify(self._heap)
+
+    async def schedule(self, user_id: int) -> bool:
+        """Bonusni navbatga qo‘yadi; foydalanuvchi allaqachon navbatda bo‘lsa False."""
+        if self.persist_only:
+            await store.set_pending_bonus(user_id, time.time() + self.delay)
+            return True
+        if user_id in self._pending:
+            return False
+        due = time.time() + self.delay
+        self._pending[user_id] = due
+        heapq.heappush(self._heap, (due, user_id))
+        await store.set_pending_bonus(user_id, due)
+        if self._heap[0][1] == user_id:
+            self._wakeup.set()
+        return True
+
+    def start(self, bot: Bot):
+        self.load()
+        if self._pending:
+            logger.info(f"{len(self._pending)} ta kutilayotgan start bonusi tiklandi.")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(bot))
+
+    def _pop_due(self, now: float):
+        batch = []
+        while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+            _, user_id = heapq.heappop(self._heap)
+            batch.append(user_id)
+        return batch
+
+    async def _run(self, bot: Bot):
+        while True:
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            if timeout is None or timeout > 0:
+                if self.poll_interval is not None:
+                    timeout = self.poll_interval if timeout is None else min(timeout, self.poll_interval)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    if self.poll_interval is not None:
+                        # Boshqa workerlar rejalashtirgan bonuslar
+                        self.load()
+                continue
+            batch = self._pop_due(time.time())
+            results = await asyncio.gather(
+                *(self._pay(user_id, bot) for user_id in batch), return_exceptions=True
+            )
+            paid = []
+            for user_id, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    await self._retry(user_id, result)
+                else:
+                    self._pending.pop(user_id, None)
+                    self._attempts.pop(user_id, None)
+                    paid.append(user_id)
+            if paid:
+                try:
+                    await store.remove_pending_bonuses(paid)
+                except Exception:
+                    # Yozuvlar omborda qoladi; qayta ishga tushganda give_start_bonus ularni o‘tkazib yuboradi
+                    logger.error(f"Berilgan bonuslarni navbatdan o‘chirishda xatolik: {traceback.format_exc()}")
+
+    async def _retry(self, user_id: int, error: BaseException):
+        """Berib bo‘lmagan bonusni kechikish bilan navbatga qaytaradi."""
+        attempt = self._attempts.get(user_id, 0) + 1
+        self._attempts[user_id] = attempt
+        delay = min(BONUS_RETRY_DELAY * 2 ** (attempt - 1), BONUS_RETRY_MAX_DELAY)
+        logger.error(f"Start bonusini berishda xatolik ({user_id}, {attempt}-urinish, {delay} s dan keyin qayta): {error}")
+        due = time.time() + delay
+        self._pending[user_id] = due
+        heapq.heappush(self._heap, (due, user_id))
+        try:
+            # Klasterda lider navbatni bazadan qayta o‘qiydi – yangi muddat saqlanmasa kechikish yo‘qoladi
+            await store.set_pending_bonus(user_id, due, replace=True)
+        except Exception:
+            # Omborda eski muddat qoladi – qayta ishga tushganda bonus darhol beriladi
+            logger.error(f"Bonus muddatini saqlashda xatolik ({user_id}): {traceback.format_exc()}")
+
+    @staticmethod
+    async def _pay(user_id: int, bot: Bot):
+        # Shu foydalanuvchining /start yangilanishlari bilan bir vaqtda ishlamasligi uchun
+        async with user_locks.hold(user_id):
+            await give_start_bonus(user_id, bot)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+bonus_scheduler = BonusScheduler()
+
+class ReferralNotifier:
+    """Taklif qiluvchilarga bonus haqidagi xabarlarni fonda yuboradi.
+
+    /start handleri faqat hodisani navbatga qo‘yadi. Taklif qiluvchining birinchi
+    hodisasidan keyin window soniya kutiladi va shu oraliqda to‘plangan barcha
+    takliflar bitta xabarga birlashtiriladi. Xabarlarni bir nechta worker yuboradi,
+    shuning uchun sekin yoki bloklangan chat boshqalarni ushlab turmaydi.
+    """
+
+    def __init__(self, window: float = REFERRAL_NOTIFY_WINDOW, workers: int = REFERRAL_NOTIFY_WORKERS):
+        self.window = window
+        self.workers = workers
+        self._batches: Dict[int, list] = {}   # referer -> yangi foydalanuvchilar nomlari
+        self._due = collections.deque()       # (muddat, referer); window o‘zgarmas, shuning uchun tartiblangan
+        self._wakeup = asyncio.Event()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+
+    def push(self, referrer_id: int, new_user_name: str):
+        names = self._batches.get(referrer_id)
+        if names is not None:
+            names.append(new_user_name)
+            return
+        self._batches[referrer_id] = [new_user_name]
+        self._due.append((time.monotonic() + self.window, referrer_id))
+        self._wakeup.set()
+
+    def start(self, bot: Bot):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks.append(asyncio.create_task(self._dispatch()))
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(bot)))
+
+    async def _dispatch(self):
+        while True:
+            if not self._due:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            due, referrer_id = self._due[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            self._due.popleft()
+            self._queue.put_nowait(referrer_id)
+
+    async def _worker(self, bot: Bot):
+        while True:
+            referrer_id = await self._queue.get()
+            try:
+                await self._send(bot, referrer_id)
+            except Exception as e:
+                logger.error(f"Refererga xabar yuborishda xatolik: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, bot: Bot, referrer_id: int):
+        names = self._batches.pop(referrer_id, None)
+        referrer = store.get_user(referrer_id)
+        if not names or referrer is None:
+            return
+        if len(names) == 1:
+            text = (
+                f"🎉 Sizning taklifingiz orqali yangi foydalanuvchi (@{names[0]}) qo‘shildi! "
+                f"Balansingizga {REFERRAL_BONUS} so‘m qo‘shildi. Hozirgi balans: {referrer['balance']} so‘m."
+            )
+        else:
+            shown = ", ".join(f"@{name}" for name in names[:5])
+            if len(names) > 5:
+                shown += f" va yana {len(names) - 5} kishi"
+            text = (
+                f"🎉 Sizning taklifingiz orqali {len(names)} ta yangi foydalanuvchi ({shown}) qo‘shildi! "
+                f"Balansingizga {REFERRAL_BONUS * len(names)} so‘m qo‘shildi. Hozirgi balans: {referrer['balance']} so‘m."
+            )
+        await bot.send_message(chat_id=referrer_id, text=text, rate_limit_args=NOTIFICATION)
+
+    async def close(self, timeout: float = 5.0):
+        """Kutayotgan xabarlarni darhol yuborib (ko‘pi bilan timeout soniya), vazifalarni to‘xtatadi."""
+        if not self._tasks:
+            return
+        self._tasks[0].cancel()
+        while self._due:
+            self._queue.put_nowait(self._due.popleft()[1])
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{len(self._batches)} ta taklif bildirishnomasi yuborilmay qoldi.")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+referral_notifier = ReferralNotifier()
+
+class FenwickTree:
+    """Prefiks yig‘indilar daraxti: add va prefix O(log n); kerak bo‘lsa hajmi ikki barobar oshadi."""
+
+    def __init__(self, size: int = 64):
+        self._values = array("q", [0]) * size
+        self._tree = array("q", [0]) * (size + 1)
+        self.total = 0
+
+    def add(self, i: int, delta: int):
+        if i >= len(self._values):
+            self._grow(i + 1)
+        self._values[i] += delta
+        self.total += delta
+        i += 1
+        tree = self._tree
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i: int) -> int:
+        """[0, i] oralig‘idagi qiymatlar yig‘indisi."""
+        i = min(i + 1, len(self._values))
+        total = 0
+        tree = self._tree
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _grow(self, needed: int):
+        size = len(self._values)
+        while size < needed:
+            size *= 2
+        values = self._values + array("q", [0]) * (size - len(self._values))
+        # O(n) qurish: har bir tugun o‘z qiymatini ota tuguniga qo‘shadi
+        tree = array("q", [0]) + values
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self._values, self._tree = values, tree
+
+class ReferralLeaderboard:
+    """Taklif qilganlar reytingi: top-K ro‘yxati va har bir foydalanuvchi o‘rni.
+
+    FenwickTree da "c ta taklifi bor foydalanuvchilar soni" saqlanadi (c-1 indeksda),
+    shuning uchun o‘rin = 1 + (ko‘proq taklif qilganlar soni) O(log C) da topiladi.
+    Top-K (-referrals, user_id) saralangan ro‘yxat; taklif soni faqat oshadi,
+    shuning uchun ro‘yxatdan tashqaridagi foydalanuvchi faqat eng kichigidan
+    oshganda kiradi. Boshlang‘ich holat ishga tushishda bir marta quriladi,
+    keyin faqat update() orqali o‘zgaradi (klasterda – bazadagi referral_log dan).
+    """
+
+    def __init__(self, size: int = LEADERBOARD_SIZE):
+        self.size = size
+        self._counts = FenwickTree()
+        self._known = IntIndex()      # user_id -> reytingdagi referrals
+        self._top: list = []
+
+    def load(self, referrers: Iterable[Tuple[int, int]]):
+        counts = FenwickTree()
+        known = IntIndex()
+        top = []
+        for user_id, referrals in referrers:
+            counts.add(referrals - 1, 1)
+            known[user_id] = referrals
+            if len(top) < self.size:
+                heapq.heappush(top, (referrals, -user_id))
+            elif (referrals, -user_id) > top[0]:
+                heapq.heapreplace(top, (referrals, -user_id))
+        self._counts, self._known = counts, known
+        self._top = sorted((-referrals, -neg_id) for referrals, neg_id in top)
+
+    def update(self, user_id: int, referrals: int):
+        """Foydalanuvchining taklif soni referrals ga yetdi.
+
+        Eski yoki takroriy qiymat (masalan, shu workerning o‘zi allaqachon qo‘llagan
+        o‘zgarish referral_log dan qayta kelsa) eʼtiborsiz qoldiriladi.
+        """
+        previous = self._known.get(user_id, 0)
+        if referrals <= previous:
+            return
+        self._known[user_id] = referrals
+        if previous > 0:
+            self._counts.add(previous - 1, -1)
+        self._counts.add(referrals - 1, 1)
+        for i, (_, top_id) in enumerate(self._top):
+            if top_id == user_id:
+                del self._top[i]
+                break
+        else:
+            if len(self._top) >= self.size and (-referrals, user_id) >= self._top[-1]:
+                return
+        bisect.insort(self._top, (-referrals, user_id))
+        del self._top[self.size:]
+
+    def top(self) -> List[Tuple[int, int]]:
+        """(user_id, referrals) – eng ko‘p taklif qilganlar, O(K)."""
+        return [(user_id, -neg) for neg, user_id in self._top]
+
+    def rank(self, referrals: int) -> int:
+        """Shuncha taklifi bor foydalanuvchining o‘rni (teng bo‘lganlar bir o‘rinda)."""
+        above = self._counts.total - (self._counts.prefix(referrals - 1) if referrals > 0 else 0)
+        return above + 1
+
+    @property
+    def referrers(self) -> int:
+        return self._counts.total
+
+referral_leaderboard = ReferralLeaderboard()
+
+class ReferralGraph:
+    """Taklif daraxti indeksi: ota -> bolalar, har bir tugun ostidagi (downline) soni va darajalari.
+
+    parent (IntIndex) – user_id -> referred_by; children – faqat taklif qilganlar
+    uchun array. Yangi bog‘lanish qo‘shilganda faqat yuqoridagi tugunlar (chuqurlik
+    bo‘yicha) yangilanadi: jami downline va 1..REFERRAL_LEVELS darajadagi sonlar.
+    Halqa (foydalanuvchi o‘z daraxtidagi kishi orqali kelishi) va bir taklifchiga
+    qisqa vaqtda ko‘p taklif kelishi admin uchun flags da belgilanadi (bir xil
+    (taklifchi, foydalanuvchi) halqasi bir marta). Taklifning o‘zi store'da odatdagidek
+    saqlanadi; halqa bog‘lanishi faqat daraxt indeksiga qo‘shilmaydi.
+    """
+
+    MAX_DEPTH = 100000  # eski maʼlumotdagi halqalarda cheksiz aylanmaslik uchun
+
+    def __init__(self, levels: int = REFERRAL_LEVELS):
+        self.levels = levels
+        self.parent = IntIndex()
+        self.children: Dict[int, array] = {}
+        self.downline = IntIndex()
+        self.level_counts: Dict[int, array] = {}
+        self.flags: collections.deque = collections.deque(maxlen=REFERRAL_FLAGS_KEEP)
+        self.rings = 0
+        self.bursts = 0
+        self._ring_pairs: set = set()  # belgilangan (taklifchi, foydalanuvchi) halqalari
+        self._recent: Dict[int, collections.deque] = {}
+        self._burst_flagged: Dict[int, float] = {}
+
+    def load(self, edges: Iterable[Tuple[int, int]]):
+        """Daraxtni noldan quradi (ishga tushishda): O(N), post-order bilan yuqoriga yig‘iladi."""
+        user_ids, referrers = array("q"), array("q")
+        for user_id, referred_by in edges:
+            user_ids.append(user_id)
+            referrers.append(referred_by)
+        # Oldindan o‘lchangan jadval – qurish paytida qayta xeshlash bo‘lmaydi
+        parent, children = IntIndex(len(user_ids) * 3 // 2 + 1024), {}
+        for user_id, referred_by in zip(user_ids, referrers):
+            parent[user_id] = referred_by
+            children.setdefault(referred_by, array("q")).append(user_id)
+        self.parent, self.children = parent, children
+        self.downline, self.level_counts = IntIndex(len(children) * 3 // 2 + 1024), {}
+        done = set()
+        roots = [user_id for user_id in children if user_id not in parent]
+        for root in roots:
+            stack = [(root, False)]
+            while stack:
+                node, expanded = stack.pop()
+                if expanded:
+                    self._aggregate(node)
+                    done.add(node)
+                    continue
+                stack.append((node, True))
+                stack.extend((child, False) for child in children[node] if child in children)
+        # Ildizga yetib bo‘lmaydigan taklifchilar – mavjud halqa ichida
+        for user_id in children:
+            if user_id not in done:
+                self._flag_ring(parent[user_id], user_id, "maʼlumotlarda mavjud halqa")
+
+    def _aggregate(self, node: int):
+        total = 0
+        counts = array("q", [0]) * self.levels
+        for child in self.children[node]:
+            total += 1 + self.downline.get(child, 0)
+            counts[0] += 1
+            child_counts = self.level_counts.get(child)
+            if child_counts is not None:
+                for depth in range(1, self.levels):
+                    counts[depth] += child_counts[depth - 1]
+        self.downline[node] = total
+        self.level_counts[node] = counts
+
+    def ancestors(self, user_id: int) -> Iterator[int]:
+        node = self.parent.get(user_id)
+        steps = 0
+        while node is not None and steps < self.MAX_DEPTH:
+            yield node
+            node = self.parent.get(node)
+            steps += 1
+
+    def link(self, user_id: int, referred_by: int, now: Optional[float] = None) -> bool:
+        """user_id ni referred_by ostiga qo‘shadi; halqa hosil bo‘lsa False (belgilanadi, daraxtga qo‘shilmaydi)."""
+        if not self.add_edge(user_id, referred_by):
+            return False
+        self._check_burst(referred_by, time.monotonic() if now is None else now)
+        return True
+
+    def add_edge(self, user_id: int, referred_by: int) -> bool:
+        """link() kabi, lekin burst tekshiruvisiz (klasterda boshqa workerlardan kelgan bog‘lanishlar uchun)."""
+        if user_id == referred_by or user_id in self.parent:
+            return False
+        if any(node == user_id for node in itertools.chain((referred_by,), self.ancestors(referred_by))):
+            self.rings += 1
+            self._flag_ring(referred_by, user_id, f"{referred_by} orqali o‘z daraxtiga qaytmoqchi")
+            return False
+        self.parent[user_id] = referred_by
+        self.children.setdefault(referred_by, array("q")).append(user_id)
+        # user_id ning o‘z daraxti (ilgari taklifsiz kelgan bo‘lsa) ham yuqoriga qo‘shiladi
+        added = 1 + self.downline.get(user_id, 0)
+        profile = [1]
+        own = self.level_counts.get(user_id)
+        if own is not None:
+            profile.extend(own[:self.levels - 1])
+        for depth, node in enumerate(itertools.chain((referred_by,), self.ancestors(referred_by))):
+            self.downline[node] = self.downline.get(node, 0) + added
+            if depth < self.levels:
+                counts = self.level_counts.get(node)
+                if counts is None:
+                    counts = self.level_counts[node] = array("q", [0]) * self.levels
+                for offset, count in enumerate(profile[:self.levels - depth]):
+                    counts[depth + offset] += count
+        return True
+
+    def _check_burst(self, referred_by: int, now: float):
+        recent = self._recent.get(referred_by)
+        if recent is None:
+            if len(self._recent) >= 10000:
+                self._recent = {uid: q for uid, q in self._recent.items() if now - q[-1] < REFERRAL_BURST_WINDOW}
+                self._burst_flagged = {
+                    uid: ts for uid, ts in self._burst_flagged.items() if now - ts <= REFERRAL_BURST_WINDOW
+                }
+            recent = self._recent[referred_by] = collections.deque()
+        recent.append(now)
+        while now - recent[0] > REFERRAL_BURST_WINDOW:
+            recent.popleft()
+        flagged = self._burst_flagged.get(referred_by)
+        if len(recent) >= REFERRAL_BURST_COUNT and (flagged is None or now - flagged > REFERRAL_BURST_WINDOW):
+            self._burst_flagged[referred_by] = now
+            self.bursts += 1
+            self._flag("burst", referred_by, f"{len(recent)} ta taklif {REFERRAL_BURST_WINDOW:g} s ichida")
+
+    def _flag_ring(self, referred_by: int, user_id: int, detail: str):
+        if (referred_by, user_id) not in self._ring_pairs:
+            self._ring_pairs.add((referred_by, user_id))
+            self._flag("ring", user_id, detail)
+
+    def _flag(self, kind: str, user_id: int, detail: str):
+        self.flags.append((time.time(), kind, user_id, detail))
+        logger.warning(f"Shubhali taklif ({kind}): {user_id} – {detail}")
+
+    def subtree(self, user_id: int, limit: int = REFERRAL_SUBTREE_LIMIT) -> List[Tuple[int, int]]:
+        """(chuqurlik, user_id) – daraxt preorder tartibida, eng ko‘pi limit ta (O(javob))."""
+        nodes = []
+        stack = [(0, user_id)]
+        while stack and len(nodes) < limit:
+            depth, node = stack.pop()
+            nodes.append((depth, node))
+            kids = self.children.get(node)
+            if kids is not None:
+                stack.extend((depth + 1, child) for child in reversed(kids[:limit]))
+        return nodes
+
+referral_graph = ReferralGraph()
+
+referral_sync_seq = 0  # referral_log dan qo‘llangan oxirgi o‘zgarish
+
+def load_referral_indexes():
+    """Reyting va taklif daraxtini store'dagi maʼlumotdan quradi (ishga tushishda bir marta)."""
+    global referral_sync_seq
+    # Kursor skanerlashdan oldin olinadi: oradagi o‘zgarishlar ikki marta kelsa ham update() ularni bir marta hisoblaydi
+    referral_sync_seq = store.referral_seq()
+    referral_leaderboard.load(store.iter_referrers())
+    referral_graph.load(store.iter_referral_edges())
+
+def apply_referral_changes() -> int:
+    """Boshqa jarayonlarda qo‘shilgan takliflarni referral_log dan reyting va daraxtga qo‘llaydi."""
+    global referral_sync_seq
+    applied = 0
+    while True:
+        changes = store.referral_changes(referral_sync_seq, REFERRAL_SYNC_BATCH)
+        for seq, user_id, referred_by, referrals in changes:
+            referral_leaderboard.update(referred_by, referrals)
+            # O‘z workerimizda bog‘langan bo‘lsa add_edge hech narsa qilmaydi
+            referral_graph.add_edge(user_id, referred_by)
+            referral_sync_seq = seq
+        applied += len(changes)
+        if len(changes) < REFERRAL_SYNC_BATCH:
+            return applied
+
+async def refresh_referral_indexes(interval: float):
+    """Klaster workerlarida: boshqa jarayonlardagi takliflarni davriy ravishda olish."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            apply_referral_changes()
+        except Exception:
+            logger.error(f"Taklif indekslarini yangilashda xatolik: {traceback.format_exc()}")
+
+# ------------------- CALLBACK ROUTER -------------------
+CallbackRoute = Callable[..., Awaitable[Any]]
+
+class CallbackRouter:
+    """Barcha oddiy callbacklarni bitta handler orqali yo‘naltiradi.
+
+    callback_data bir marta tahlil qilinadi: avval to‘liq mos kelish ("admin_back"),
+    so‘ng "<amal>_<argument>" ko‘rinishi (argument — oxirgi "_" dan keyingi qism,
+    masalan "game_1a"). Handler lug‘atdan O(1) da topiladi va argument bilan chaqiriladi.
+    Boshqa handlerlarga tegishli amallar (reserve) hech qachon qisqaroq amalga tushmaydi:
+    "edit_text_5" "edit" ga "text_5" argumenti bilan yo‘naltirilmaydi.
+    """
+
+    def __init__(self):
+        self._exact: Dict[str, Tuple[CallbackRoute, bool]] = {}
+        self._actions: Dict[str, Optional[Tuple[CallbackRoute, bool]]] = {}
+
+    def exact(self, data: str, handler: CallbackRoute, admin: bool = False):
+        self._exact[data] = (timed(handler), admin)
+
+    def action(self, action: str, handler: CallbackRoute, admin: bool = False):
+        self._actions[action] = (timed(handler), admin)
+
+    def reserve(self, action: str):
+        """"<action>_..." boshqa handlerga (konversatsiyaga) tegishli: router uni o‘tkazib yuboradi."""
+        self._actions[action] = None
+
+    def resolve(self, data: str):
+        """(handler, admin, argument) yoki None."""
+        route = self._exact.get(data)
+        if route is not None:
+            return route[0], route[1], None
+        # Eski tugmalarda argument (o‘yin nomi) ichida "_" bo‘lishi mumkin:
+        # o‘ngdan boshlab eng uzun ro‘yxatdagi amal qidiriladi
+        pos = data.rfind("_")
+        while pos != -1 and data[:pos] not in self._actions:
+            pos = data.rfind("_", 0, pos)
+        if pos == -1:
+            return None
+        route = self._actions[data[:pos]]
+        if route is None:
+            return None
+        return route[0], route[1], data[pos + 1:]
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        resolved = self.resolve(query.data or "")
+        if resolved is None:
+            await query.answer()
+            return
+        handler, admin, arg = resolved
+        if admin:
+            await query.answer()
+            if not is_admin(query.from_user.id):
+                await query.edit_message_text("Siz admin emassiz.")
+                return
+        if arg is None:
+            await handler(update, context)
+        else:
+            await handler(update, context, arg)
+
 # ------------------- START HANDLER -------------------
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start komandasi – bitta xabar va barcha tugmalar."""
@@ -159,34 +3335,34 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_data = await ensure_user(user_id)
 
     # Referralni tekshirish va bonus berish
+    ref_user_id = None
     if args and args[0].startswith("ref_"):
         try:
             ref_user_id = int(args[0].replace("ref_", ""))
-            # O‘zini o‘zi taklif qilmasligi va taklif qiluvchi mavjud bo‘lishi kerak
-            if ref_user_id != user_id and str(ref_user_id) in users_data:
-                # Agar bu foydalanuvchi hali hech kim tomonidan taklif qilinmagan bo‘lsa
-                if user_data.get("referred_by") is None:
-                    # Referralni belgilash
-                    user_data["referred_by"] = ref_user_id
-                    # Taklif qiluvchiga bonus
-                    referer_data = users_data[str(ref_user_id)]
-                    referer_data["balance"] += REFERRAL_BONUS
-                    referer_data["referrals"] = referer_data.get("referrals", 0) + 1
-                    save_users(users_data)
-                    # Bildirishnoma yuborish
-                    try:
-                        await context.bot.send_message(
-                            chat_id=ref_user_id,
-                            text=f"🎉 Sizning taklifingiz orqali yangi foydalanuvchi (@{user.username or user.first_name}) qo‘shildi! Balansingizga {REFERRAL_BONUS} so‘m qo‘shildi. Hozirgi balans: {referer_data['balance']} so‘m."
-                        )
-                    except Exception as e:
-                        logger.error(f"Refererga xabar yuborishda xatolik: {e}")
-        except:
+        except ValueError:
             pass
+    # O‘zini o‘zi taklif qilmasligi va taklif qiluvchi mavjud bo‘lishi kerak;
+    # foydalanuvchi hali hech kim tomonidan taklif qilinmagan bo‘lishi kerak
+    if (ref_user_id is not None and ref_user_id != user_id and user_data.get("referred_by") is None
+            and store.get_user(ref_user_id) is not None):
+        try:
+            # Referralni belgilash va taklif qiluvchining hisoblagichi
+            referrer = await store.add_referral(user_id, ref_user_id)
+            # Taklif qiluvchiga bonus
+            await store.credit(ref_user_id, REFERRAL_BONUS, "referral")
+        except Exception:
+            logger.error(f"Taklifni saqlashda xatolik ({ref_user_id} -> {user_id}): {traceback.format_exc()}")
+        else:
+            # Indekslar store yozilgandan keyin yangilanadi; halqa rad etilmaydi, faqat belgilanadi
+            referral_leaderboard.update(ref_user_id, referrer["referrals"])
+            referral_graph.link(user_id, ref_user_id)
+            track("referrals")
+            # Bildirishnoma fonda yuboriladi (yangi foydalanuvchi javobni kutmaydi)
+            referral_notifier.push(ref_user_id, user.username or user.first_name)
 
     # Start bonusini rejalashtirish (agar hali berilmagan bo‘lsa)
     if not user_data.get("start_bonus_given", False):
-        asyncio.create_task(give_start_bonus(user_id, context))
+        await bonus_scheduler.schedule(user_id)
 
     # Bitta xabar – barcha tugmalar bilan
     text = (
@@ -225,64 +3401,47 @@ async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 # ------------------- O‘YINLAR -------------------
-async def show_games(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def show_games(update: Update, context: ContextTypes.DEFAULT_TYPE, page: str = "0"):
     query = update.callback_query
     await query.answer()
     if not games_data:
         await query.edit_message_text(
             "Hozircha hech qanday o‘yin mavjud emas.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Bosh menyu", callback_data="main_menu")]])
+            reply_markup=BACK_TO_MAIN_MARKUP
         )
         return
     text = "🎮 Quyidagi oyinlardan birini tanlang va pul ishlashni boshlang:"
-    await query.edit_message_text(text, reply_markup=get_game_keyboard())
+    await query.edit_message_text(text, reply_markup=get_game_keyboard(int(page) if page.isdigit() else 0))
 
-async def game_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def game_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, game_id: str):
     query = update.callback_query
     await query.answer()
-    game_name = query.data.replace("game_", "")
-    game = games_data.get(game_name)
-    if not game:
+    game_name = resolve_game_name(game_id)
+    payload = get_game_payload(game_name) if game_name else None
+    if payload is None:
         await query.message.reply_text("Bu o‘yin topilmadi.")
         return
 
-    game["views"] = game.get("views", 0) + 1
-    save_games(games_data)
-
-    text = game.get("text", "Maʼlumot hozircha kiritilmagan.")
-    photo_id = game.get("photo_id")
-    file_id = game.get("file_id")
-    button_text = game.get("button_text")
-    button_url = game.get("button_url")
-
-    # Bosh menyuga qaytish tugmasi
-    back_button = [[InlineKeyboardButton("◀️ Bosh menyu", callback_data="main_menu")]]
-
-    # Agar tashqi havola tugmasi bo‘lsa, uni ham qo‘shamiz (faqat rasm/matn xabariga)
-    reply_markup = None
-    if button_text and button_url:
-        keyboard = [[InlineKeyboardButton(button_text, url=button_url)], back_button[0]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-    else:
-        reply_markup = InlineKeyboardMarkup(back_button)
+    views_counter.incr(game_name)
+    track("game_views")
 
     # 1. APK faylini yuborish (agar mavjud bo‘lsa)
-    if file_id:
-        await query.message.reply_document(document=file_id)
+    if payload.file_id:
+        await query.message.reply_document(document=payload.file_id)
 
     # 2. Rasm yoki matnni yuborish (bosh menyu tugmasi bilan)
-    if photo_id:
+    if payload.photo_id:
         await query.message.reply_photo(
-            photo=photo_id,
-            caption=text,
+            photo=payload.photo_id,
+            caption=payload.text,
             parse_mode="HTML",
-            reply_markup=reply_markup
+            reply_markup=payload.reply_markup
         )
     else:
         await query.message.reply_text(
-            text,
+            payload.text,
             parse_mode="HTML",
-            reply_markup=reply_markup
+            reply_markup=payload.reply_markup
         )
 
 # ------------------- PUL ISHLASH VA BALANS -------------------
@@ -343,11 +3502,12 @@ async def withdraw_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = query.from_user.id
     user_data = await ensure_user(user_id)
     balance = user_data.get("balance", 0)
+    track("withdraw_attempts")
 
     if balance < MIN_WITHDRAW:
         await query.edit_message_text(
             f"❌ Pul chiqarish uchun minimal balans {MIN_WITHDRAW} so‘m. Sizda {balance} so‘m bor.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Bosh menyu", callback_data="main_menu")]])
+            reply_markup=BACK_TO_MAIN_MARKUP
         )
         return
 
@@ -359,14 +3519,45 @@ async def withdraw_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"Saytda kodni kiritib, pul yechishni tasdiqlang."
     )
     keyboard = [
-        [InlineKeyboardButton("💳 Saytga o‘tish", url=WITHDRAW_SITE_URL)],
+        [InlineKeyboardButton("💳 Saytga o‘tish", url=WITHDRAW_SITE_URL)],
+        [InlineKeyboardButton("◀️ Bosh menyu", callback_data="main_menu")]
+    ]
+    await query.edit_message_text(
+        text,
+        parse_mode="Markdown",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+def mask_user_id(user_id: int) -> str:
+    """Reytingda boshqalarning id si to‘liq ko‘rsatilmaydi: 6935090105 -> 69******05."""
+    text = str(user_id)
+    return text[:2] + "*" * max(len(text) - 4, 0) + text[-2:] if len(text) > 4 else text
+
+async def leaderboard_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    user_id = query.from_user.id
+    user_data = await ensure_user(user_id)
+    referrals = user_data.get("referrals", 0)
+    admin = is_admin(user_id)
+    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+    lines = ["🏆 *Top taklifchilar*\n"]
+    top = referral_leaderboard.top()
+    for place, (top_id, count) in enumerate(top, start=1):
+        name = str(top_id) if admin or top_id == user_id else mask_user_id(top_id)
+        lines.append(f"{medals.get(place, f'{place}.')} `{name}` — *{count}* ta")
+    if not top:
+        lines.append("Hozircha hech kim do‘st taklif qilmagan.")
+    if referrals:
+        lines.append(f"\nSizning o‘rningiz: *{referral_leaderboard.rank(referrals)}* "
+                     f"({referral_leaderboard.referrers} taklifchidan), {referrals} ta taklif")
+    else:
+        lines.append("\nSiz hali do‘st taklif qilmagansiz – «💰 Pul ishlash» orqali havolangizni oling.")
+    keyboard = [
+        [InlineKeyboardButton("💰 Pul ishlash", callback_data="earn")],
         [InlineKeyboardButton("◀️ Bosh menyu", callback_data="main_menu")]
     ]
-    await query.edit_message_text(
-        text,
-        parse_mode="Markdown",
-        reply_markup=InlineKeyboardMarkup(keyboard)
-    )
+    await query.edit_message_text("\n".join(lines), parse_mode="Markdown", reply_markup=InlineKeyboardMarkup(keyboard))
 
 # ------------------- ADMIN PANEL (umumiy callbacklar) -------------------
 async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -375,94 +3566,193 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     await update.message.reply_text("👨‍💻 Admin paneli:", reply_markup=get_admin_keyboard())
 
-async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Admin panelidagi callbacklarni boshqaradi (add va edit opsiyalaridan tashqari)."""
-    query = update.callback_query
-    await query.answer()
-    if not is_admin(query.from_user.id):
-        await query.edit_message_text("Siz admin emassiz.")
+def _fmt_ms(seconds: float) -> str:
+    return f"{seconds * 1000:.1f}" if seconds < 10 else f"{seconds:.0f}s"
+
+def render_perf(limit: int = 20) -> str:
+    """Handlerlar, Bot API va saqlash kechikishlari (p50/p95/p99, ms) jadvali."""
+    header = f"{'n':>5} {'p50':>5} {'p95':>5} {'p99':>5}"
+    lines = ["⏱ Kechikishlar (ms)", "", f"{'Handler':16s} {header} api% db%"]
+    for name, h in perf.by_kind("handler")[:limit]:
+        api, store_time = perf.breakdown.get(name, (0.0, 0.0))
+        lines.append(
+            f"{name[:16]:16s} {h.count:>5} {_fmt_ms(h.percentile(0.5)):>5} {_fmt_ms(h.percentile(0.95)):>5} "
+            f"{_fmt_ms(h.percentile(0.99)):>5} {100 * api / h.total if h.total else 0:>4.0f} "
+            f"{100 * store_time / h.total if h.total else 0:>3.0f}"
+        )
+    for kind, title in (("api", "Bot API"), ("store", "Ombor"), ("persist", "Diskka yozish")):
+        items = perf.by_kind(kind)[:8]
+        if items:
+            lines += ["", f"{title:16s} {header}"]
+            for name, h in items:
+                lines.append(
+                    f"{name[:16]:16s} {h.count:>5} {_fmt_ms(h.percentile(0.5)):>5} "
+                    f"{_fmt_ms(h.percentile(0.95)):>5} {_fmt_ms(h.percentile(0.99)):>5}"
+                )
+    if len(lines) == 3:
+        lines.append("Hozircha maʼlumot yo‘q.")
+    return "\n".join(lines)
+
+async def perf_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/perf – handler kechikishlari hisobotini ko‘rsatadi (faqat admin)."""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("Siz admin emassiz.")
         return
+    await update.message.reply_text(f"<pre>{html.escape(render_perf())}</pre>", parse_mode="HTML")
 
-    data = query.data
+def render_subtree(user_id: int) -> str:
+    """/subtree matni: yuqoridagi zanjir, darajalar bo‘yicha sonlar va daraxtning boshi."""
+    graph = referral_graph
+    upline = list(itertools.islice(graph.ancestors(user_id), 5))
+    lines = [f"{user_id} taklif daraxti"]
+    if upline:
+        lines.append("Yuqorisi: " + " → ".join(map(str, upline)) + (" → …" if len(upline) == 5 else ""))
+    counts = graph.level_counts.get(user_id)
+    lines.append(f"Jami downline: {graph.downline.get(user_id, 0)}")
+    if counts is not None:
+        lines.append("Darajalar: " + ", ".join(f"{depth + 1}-daraja {count}" for depth, count in enumerate(counts)))
+    lines.append("")
+    nodes = graph.subtree(user_id)
+    for depth, node in nodes:
+        below = graph.downline.get(node, 0)
+        lines.append(f"{'  ' * depth}{node}" + (f" (+{below})" if below else ""))
+    shown = len(nodes) - 1
+    hidden = graph.downline.get(user_id, 0) - shown
+    if hidden > 0:
+        lines.append(f"… yana {hidden} ta")
+    return "\n".join(lines)
 
-    if data == "admin_remove_list":
-        if not games_data:
-            await query.edit_message_text("Hech qanday o‘yin mavjud emas.")
-            return
-        await query.edit_message_text(
-            "O‘chiriladigan o‘yinni tanlang:",
-            reply_markup=get_games_list_keyboard("remove_")
-        )
+async def subtree_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/subtree <user_id> – foydalanuvchining taklif daraxti (faqat admin)."""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("Siz admin emassiz.")
+        return
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text("Foydalanish: /subtree <user_id>")
+        return
+    text = render_subtree(int(context.args[0]))
+    await update.message.reply_text(f"<pre>{html.escape(text)}</pre>", parse_mode="HTML")
 
-    elif data == "admin_edit_list":
-        if not games_data:
-            await query.edit_message_text("Hech qanday o‘yin mavjud emas.")
-            return
-        await query.edit_message_text(
-            "Tahrirlanadigan o‘yinni tanlang:",
-            reply_markup=get_games_list_keyboard("edit_")
-        )
+async def admin_ref_flags_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    graph = referral_graph
+    lines = [
+        "🚩 Shubhali takliflar",
+        f"Halqalar: {graph.rings}, tez-tez takliflar: {graph.bursts}",
+        "",
+    ]
+    for ts, kind, user_id, detail in list(graph.flags)[-20:][::-1]:
+        title = {"ring": "halqa", "burst": "to‘lqin"}.get(kind, kind)
+        lines.append(f"{time.strftime('%m-%d %H:%M:%S', time.localtime(ts))} {title} {user_id}: {detail}")
+    if not graph.flags:
+        lines.append("Hozircha shubhali holat yo‘q.")
+    lines.append("\nBatafsil: /subtree <user_id>")
+    await update.callback_query.edit_message_text("\n".join(lines), reply_markup=get_admin_keyboard())
 
-    elif data == "admin_stats":
-        if not games_data:
-            await query.edit_message_text("Statistika uchun maʼlumot yo‘q.")
-            return
-        lines = ["📊 Statistika:"]
+# Quyidagi callbacklar CallbackRouter orqali admin=True bilan chaqiriladi:
+# so‘rovga javob berish va admin tekshiruvi routerda bajariladi.
+async def admin_remove_list_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, page: str = "0"):
+    query = update.callback_query
+    if not games_data:
+        await query.edit_message_text("Hech qanday o‘yin mavjud emas.")
+        return
+    await query.edit_message_text(
+        "O‘chiriladigan o‘yinni tanlang:",
+        reply_markup=get_games_list_keyboard("remove_", int(page) if page.isdigit() else 0)
+    )
+
+async def admin_edit_list_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, page: str = "0"):
+    query = update.callback_query
+    if not games_data:
+        await query.edit_message_text("Hech qanday o‘yin mavjud emas.")
+        return
+    await query.edit_message_text(
+        "Tahrirlanadigan o‘yinni tanlang:",
+        reply_markup=get_games_list_keyboard("edit_", int(page) if page.isdigit() else 0)
+    )
+
+async def admin_stats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    lines = ["📊 Statistika:"]
+    if games_data:
         total = 0
         for name, game in games_data.items():
-            views = game.get("views", 0)
+            views = views_counter.live(name)
             lines.append(f"• {name}: {views} marta ko‘rilgan")
             total += views
         lines.append(f"\nJami: {total} marta")
-        await query.edit_message_text("\n".join(lines), reply_markup=get_admin_keyboard())
+    else:
+        lines.append("Hozircha o‘yinlar yo‘q.")
+    lines.append("\n" + render_analytics())
+    outbox = rate_limiter.stats()
+    lines.append(
+        f"\n📤 Chiquvchi navbat: {outbox['depth']} kutmoqda, {outbox['sent']} yuborildi, "
+        f"{outbox['retried']} qayta urinish, {outbox['dropped']} tashlab yuborildi"
+    )
+    flood = flood_guard.stats()
+    lines.append(f"🛡 Flood himoyasi: {flood['duplicates']} takroriy, {flood['throttled']} cheklangan so‘rov o‘tkazib yuborildi")
+    await query.edit_message_text("\n".join(lines), reply_markup=get_admin_keyboard())
 
-    elif data == "admin_close":
-        await query.edit_message_text("Panel yopildi.")
+async def broadcast_stop_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    broadcaster.stop()
 
-    elif data == "admin_back":
-        await query.edit_message_text("Admin paneli:", reply_markup=get_admin_keyboard())
+async def admin_close_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.edit_message_text("Panel yopildi.")
 
-    elif data.startswith("remove_"):
-        game_name = data.replace("remove_", "")
-        context.user_data["remove_game"] = game_name
-        keyboard = [
-            [InlineKeyboardButton("✅ Ha", callback_data="confirm_remove")],
-            [InlineKeyboardButton("❌ Yo‘q", callback_data="admin_back")]
-        ]
-        await query.edit_message_text(
-            f"'{game_name}' o‘yinini o‘chirishni tasdiqlaysizmi?",
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
+async def admin_back_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.edit_message_text("Admin paneli:", reply_markup=get_admin_keyboard())
 
-    elif data == "confirm_remove":
-        game_name = context.user_data.get("remove_game")
-        if game_name and game_name in games_data:
-            del games_data[game_name]
-            save_games(games_data)
-            await query.edit_message_text(
-                f"✅ '{game_name}' o‘chirildi.",
-                reply_markup=get_admin_keyboard()
-            )
-        else:
-            await query.edit_message_text("Xatolik yuz berdi.", reply_markup=get_admin_keyboard())
+async def remove_game_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, game_id: str):
+    query = update.callback_query
+    game_name = resolve_game_name(game_id)
+    if game_name is None:
+        await query.edit_message_text("Bu o‘yin topilmadi.", reply_markup=get_admin_keyboard())
+        return
+    context.user_data["remove_game"] = game_name
+    keyboard = [
+        [InlineKeyboardButton("✅ Ha", callback_data="confirm_remove")],
+        [InlineKeyboardButton("❌ Yo‘q", callback_data="admin_back")]
+    ]
+    await query.edit_message_text(
+        f"'{game_name}' o‘yinini o‘chirishni tasdiqlaysizmi?",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
 
-    elif data.startswith("edit_"):
-        game_name = data.replace("edit_", "")
-        # O‘yin nomini saqlash (keyingi conversation uchun)
-        context.user_data["edit_game"] = game_name
-        keyboard = [
-            [InlineKeyboardButton("✏️ Matn", callback_data=f"edit_text_{game_name}")],
-            [InlineKeyboardButton("🖼 Rasm", callback_data=f"edit_photo_{game_name}")],
-            [InlineKeyboardButton("📁 Fayl (APK)", callback_data=f"edit_file_{game_name}")],
-            [InlineKeyboardButton("🔗 Tugma", callback_data=f"edit_button_{game_name}")],
-            [InlineKeyboardButton("◀️ Back", callback_data="admin_back")]
-        ]
+async def confirm_remove_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    game_name = context.user_data.get("remove_game")
+    if game_name and game_name in games_data:
+        unregister_game(game_name)
+        del games_data[game_name]
+        views_counter.discard(game_name)
+        await store.delete_game(game_name)
+        invalidate_catalog_cache(game_name)
         await query.edit_message_text(
-            f"'{game_name}' – nimani tahrirlaysiz?",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            f"✅ '{game_name}' o‘chirildi.",
+            reply_markup=get_admin_keyboard()
         )
+    else:
+        await query.edit_message_text("Xatolik yuz berdi.", reply_markup=get_admin_keyboard())
 
-    return
+async def edit_game_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, game_id: str):
+    query = update.callback_query
+    game_name = resolve_game_name(game_id)
+    if game_name is None:
+        await query.edit_message_text("Bu o‘yin topilmadi.", reply_markup=get_admin_keyboard())
+        return
+    game_id = games_data[game_name]["id"]
+    # O‘yin nomini saqlash (keyingi conversation uchun)
+    context.user_data["edit_game"] = game_name
+    keyboard = [
+        [InlineKeyboardButton("✏️ Matn", callback_data=f"edit_text_{game_id}")],
+        [InlineKeyboardButton("🖼 Rasm", callback_data=f"edit_photo_{game_id}")],
+        [InlineKeyboardButton("📁 Fayl (APK)", callback_data=f"edit_file_{game_id}")],
+        [InlineKeyboardButton("🔗 Tugma", callback_data=f"edit_button_{game_id}")],
+        [InlineKeyboardButton("◀️ Back", callback_data="admin_back")]
+    ]
+    await query.edit_message_text(
+        f"'{game_name}' – nimani tahrirlaysiz?",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
 
 # ------------------- ADD GAME KONVERSATSIYASI -------------------
 ADD_NAME, ADD_TEXT, ADD_PHOTO, ADD_FILE, ADD_BUTTON_TEXT, ADD_BUTTON_URL = range(6)
@@ -487,7 +3777,7 @@ async def add_game_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not name:
             await update.message.reply_text("Nom bo‘sh bo‘lishi mumkin emas. Qayta kiriting:")
             return ADD_NAME
-        if name in games_data:
+        if name in games_data or name == GAMES_SEQ_KEY:
             await update.message.reply_text("Bu nom allaqachon mavjud. Boshqa nom kiriting:")
             return ADD_NAME
         context.user_data["add_game"]["name"] = name
@@ -606,7 +3896,9 @@ async def add_game_button_url(update: Update, context: ContextTypes.DEFAULT_TYPE
             "button_url": game_data.get("button_url"),
             "views": 0
         }
-        save_games(games_data)
+        await register_game(game_data["name"], games_data[game_data["name"]])
+        await store.save_game(game_data["name"], games_data[game_data["name"]])
+        invalidate_catalog_cache(game_data["name"])
         await update.message.reply_text(
             f"✅ '{game_data['name']}' o‘yini qo‘shildi!",
             reply_markup=get_admin_keyboard()
@@ -630,7 +3922,9 @@ async def add_game_button_url_skip(update: Update, context: ContextTypes.DEFAULT
             "button_url": None,
             "views": 0
         }
-        save_games(games_data)
+        await register_game(game_data["name"], games_data[game_data["name"]])
+        await store.save_game(game_data["name"], games_data[game_data["name"]])
+        invalidate_catalog_cache(game_data["name"])
         await update.message.reply_text(
             f"✅ '{game_data['name']}' o‘yini qo‘shildi!",
             reply_markup=get_admin_keyboard()
@@ -654,10 +3948,10 @@ EDIT_ACTION, EDIT_TEXT, EDIT_PHOTO, EDIT_FILE, EDIT_BUTTON_TEXT, EDIT_BUTTON_URL
 async def edit_text_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    # callback_data dan o'yin nomini olish (format: edit_text_GameName)
+    # callback_data dan o'yin nomini olish (format: edit_text_<id>)
     data = query.data
     if data.startswith("edit_text_"):
-        game_name = data.replace("edit_text_", "")
+        game_name = resolve_game_name(data.replace("edit_text_", ""))
     else:
         # fallback
         game_name = context.user_data.get("edit_game")
@@ -676,7 +3970,7 @@ async def edit_photo_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
     data = query.data
     if data.startswith("edit_photo_"):
-        game_name = data.replace("edit_photo_", "")
+        game_name = resolve_game_name(data.replace("edit_photo_", ""))
     else:
         game_name = context.user_data.get("edit_game")
         if not game_name:
@@ -693,7 +3987,7 @@ async def edit_file_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
     data = query.data
     if data.startswith("edit_file_"):
-        game_name = data.replace("edit_file_", "")
+        game_name = resolve_game_name(data.replace("edit_file_", ""))
     else:
         game_name = context.user_data.get("edit_game")
         if not game_name:
@@ -710,7 +4004,7 @@ async def edit_button_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     data = query.data
     if data.startswith("edit_button_"):
-        game_name = data.replace("edit_button_", "")
+        game_name = resolve_game_name(data.replace("edit_button_", ""))
     else:
         game_name = context.user_data.get("edit_game")
         if not game_name:
@@ -727,7 +4021,8 @@ async def edit_game_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         game_name = context.user_data["edit_game"]
         new_text = update.message.text
         games_data[game_name]["text"] = new_text
-        save_games(games_data)
+        await store.save_game(game_name, games_data[game_name])
+        invalidate_catalog_cache(game_name)
         await update.message.reply_text(f"✅ Matn yangilandi.", reply_markup=get_admin_keyboard())
         context.user_data.clear()
         return ConversationHandler.END
@@ -742,7 +4037,8 @@ async def edit_game_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
             photo_id = update.message.photo[-1].file_id
             game_name = context.user_data["edit_game"]
             games_data[game_name]["photo_id"] = photo_id
-            save_games(games_data)
+            await store.save_game(game_name, games_data[game_name])
+            invalidate_catalog_cache(game_name)
             await update.message.reply_text(f"✅ Rasm yangilandi.", reply_markup=get_admin_keyboard())
             context.user_data.clear()
             return ConversationHandler.END
@@ -760,7 +4056,8 @@ async def edit_game_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
             file_id = update.message.document.file_id
             game_name = context.user_data["edit_game"]
             games_data[game_name]["file_id"] = file_id
-            save_games(games_data)
+            await store.save_game(game_name, games_data[game_name])
+            invalidate_catalog_cache(game_name)
             await update.message.reply_text(f"✅ Fayl yangilandi.", reply_markup=get_admin_keyboard())
             context.user_data.clear()
             return ConversationHandler.END
@@ -803,7 +4100,8 @@ async def edit_button_url(update: Update, context: ContextTypes.DEFAULT_TYPE):
         button_text = context.user_data.get("edit_button_text")
         games_data[game_name]["button_text"] = button_text
         games_data[game_name]["button_url"] = button_url
-        save_games(games_data)
+        await store.save_game(game_name, games_data[game_name])
+        invalidate_catalog_cache(game_name)
         await update.message.reply_text(f"✅ Tugma maʼlumotlari yangilandi.", reply_markup=get_admin_keyboard())
         context.user_data.clear()
         return ConversationHandler.END
@@ -818,7 +4116,8 @@ async def edit_button_url_skip(update: Update, context: ContextTypes.DEFAULT_TYP
         button_text = context.user_data.get("edit_button_text")
         games_data[game_name]["button_text"] = button_text
         games_data[game_name]["button_url"] = None
-        save_games(games_data)
+        await store.save_game(game_name, games_data[game_name])
+        invalidate_catalog_cache(game_name)
         await update.message.reply_text(f"✅ Tugma maʼlumotlari yangilandi (faqat matn, havolasiz).", reply_markup=get_admin_keyboard())
         context.user_data.clear()
         return ConversationHandler.END
@@ -832,25 +4131,759 @@ async def edit_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Tahrirlash bekor qilindi.", reply_markup=get_admin_keyboard())
     return ConversationHandler.END
 
+# ------------------- OMMAVIY XABAR (BROADCAST) -------------------
+BROADCAST_TEXT, BROADCAST_CONFIRM = range(12, 14)
+
+class Broadcaster:
+    """Barcha foydalanuvchilarga xabar yuborish.
+
+    Qabul qiluvchilar store'dan id tartibida BROADCAST_CHUNK tadan olinadi va
+    BROADCAST_WORKERS ta yuboruvchiga tarqatiladi (tezlikni OutboundRateLimiter
+    cheklaydi). Har bir partiyadan keyin holat broadcast.json ga yoziladi, shuning
+    uchun qayta ishga tushganda jarayon oxirgi partiyadan davom etadi (eng ko‘pi
+    bilan bitta partiya qayta yuborilishi mumkin). Botni bloklaganlar belgilanadi
+    va keyingi xabarlarda o‘tkazib yuboriladi (botga qaytsa, ensure_user belgini olib tashlaydi).
+    """
+
+    def __init__(self, path: str = BROADCAST_FILE):
+        self.path = path
+        self.state: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self._session_started = 0.0
+        self._session_done = 0
+        self._stop_requested = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _checkpoint(self):
+        atomic_write_json(self.path, self.state)
+
+    def start(self, bot: Bot, text: str, admin_chat_id: int, status_message_id: int):
+        self.state = {
+            "text": text,
+            "admin_chat_id": admin_chat_id,
+            "status_message_id": status_message_id,
+            "cursor": 0,
+            "sent": 0,
+            "failed": 0,
+            "blocked": 0,
+            "total": store.user_count(),
+            "started": time.time(),
+            "status": "running",
+        }
+        self._checkpoint()
+        self._task = asyncio.create_task(self._run(bot))
+
+    def resume(self, bot: Bot):
+        """Oldingi ishga tushishda tugamay qolgan broadcastni davom ettiradi."""
+        if not Path(self.path).exists():
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            self.state = json.load(f)
+        if self.state.get("status") == "running" and not self.running:
+            logger.info(f"Broadcast {self.state['cursor']} id dan davom ettirilmoqda.")
+            self._task = asyncio.create_task(self._run(bot))
+
+    def stop(self):
+        """Admin so‘rovi bilan to‘xtatish (qayta ishga tushganda davom ettirilmaydi)."""
+        if self.running:
+            self._stop_requested = True
+            self._task.cancel()
+
+    async def close(self):
+        """Bot to‘xtaganda: jarayon "running" holatida qoladi va keyingi safar davom etadi."""
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _send_one(self, bot: Bot, user_id: int):
+        try:
+            await bot.send_message(chat_id=user_id, text=self.state["text"], parse_mode="HTML", rate_limit_args=BULK)
+            self.state["sent"] += 1
+        except Forbidden:
+            await store.update_user(user_id, blocked=True)
+            self.state["blocked"] += 1
+        except BadRequest as e:
+            if "chat not found" in str(e).lower():
+                await store.update_user(user_id, blocked=True)
+                self.state["blocked"] += 1
+            else:
+                self.state["failed"] += 1
+        except Exception as e:
+            logger.error(f"Broadcast xabarini yuborishda xatolik ({user_id}): {e}")
+            self.state["failed"] += 1
+        self._session_done += 1
+
+    async def _send_chunk(self, bot: Bot, user_ids):
+        queue: asyncio.Queue = asyncio.Queue()
+        for user_id in user_ids:
+            queue.put_nowait(user_id)
+
+        async def worker():
+            while not queue.empty():
+                await self._send_one(bot, queue.get_nowait())
+
+        await asyncio.gather(*(worker() for _ in range(min(BROADCAST_WORKERS, len(user_ids)))))
+
+    async def _run(self, bot: Bot):
+        self._session_started = time.monotonic()
+        self._session_done = 0
+        self._stop_requested = False
+        last_report = 0.0
+        try:
+            await store.prepare_user_scan()
+            while True:
+                user_ids = store.iter_user_ids(self.state["cursor"], BROADCAST_CHUNK)
+                if not user_ids:
+                    break
+                await self._send_chunk(bot, user_ids)
+                self.state["cursor"] = user_ids[-1]
+                await asyncio.to_thread(self._checkpoint)
+                if time.monotonic() - last_report >= BROADCAST_PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    await self._report(bot)
+        except asyncio.CancelledError:
+            if not self._stop_requested:
+                # Bot to‘xtamoqda: cursor saqlangan, keyingi ishga tushishda davom etadi
+                raise
+            self.state["status"] = "stopped"
+        else:
+            self.state["status"] = "done"
+        self._checkpoint()
+        await self._report(bot)
+
+    def progress_text(self) -> str:
+        st = self.state
+        done = st["sent"] + st["failed"] + st["blocked"]
+        elapsed = max(time.monotonic() - self._session_started, 1e-6)
+        rate = self._session_done / elapsed
+        remaining = max(st["total"] - done, 0)
+        eta = f"{int(remaining / rate)} s" if rate > 0 and st["status"] == "running" else "—"
+        titles = {"running": "⏳ Yuborilmoqda", "done": "✅ Yakunlandi", "stopped": "⏹ To‘xtatildi"}
+        return (
+            f"📢 Broadcast: {titles.get(st['status'], st['status'])}\n\n"
+            f"Yuborildi: {st['sent']} / {st['total']}\n"
+            f"Xatolar: {st['failed']}\n"
+            f"Bloklaganlar: {st['blocked']}\n"
+            f"Tezlik: {rate:.1f} xabar/s\n"
+            f"Taxminiy qolgan vaqt: {eta}"
+        )
+
+    async def _report(self, bot: Bot):
+        st = self.state
+        markup = None
+        if st["status"] == "running":
+            markup = InlineKeyboardMarkup([[InlineKeyboardButton("⏹ To‘xtatish", callback_data="broadcast_stop")]])
+        try:
+            await bot.edit_message_text(
+                self.progress_text(),
+                chat_id=st["admin_chat_id"],
+                message_id=st["status_message_id"],
+                reply_markup=markup,
+            )
+        except BadRequest:
+            # Matn o‘zgarmagan yoki xabar o‘chirilgan
+            pass
+        except Exception as e:
+            logger.error(f"Broadcast holatini yangilashda xatolik: {e}")
+
+broadcaster = Broadcaster()
+
+async def admin_broadcast_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Broadcast tugmasi bosilganda ishga tushadi."""
+    query = update.callback_query
+    await query.answer()
+    if not is_admin(query.from_user.id):
+        await query.edit_message_text("Siz admin emassiz.")
+        return ConversationHandler.END
+    if broadcaster.running:
+        await query.edit_message_text(broadcaster.progress_text(), reply_markup=InlineKeyboardMarkup(
+            [[InlineKeyboardButton("⏹ To‘xtatish", callback_data="broadcast_stop")],
+             [InlineKeyboardButton("◀️ Back", callback_data="admin_back")]]
+        ))
+        return ConversationHandler.END
+    context.user_data.clear()
+    await query.edit_message_text("Barcha foydalanuvchilarga yuboriladigan xabarni kiriting (HTML teglar bilan):")
+    return BROADCAST_TEXT
+
+async def broadcast_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        text = update.message.text
+        # Oldindan ko‘rish: HTML xato bo‘lsa, shu yerda aniqlanadi
+        try:
+            await update.message.reply_text(text, parse_mode="HTML")
+        except BadRequest:
+            await update.message.reply_text("HTML formatida xatolik bor. Xabarni qayta kiriting:")
+            return BROADCAST_TEXT
+        context.user_data["broadcast_text"] = text
+        keyboard = [
+            [InlineKeyboardButton("✅ Yuborish", callback_data="broadcast_confirm")],
+            [InlineKeyboardButton("❌ Bekor qilish", callback_data="broadcast_cancel")]
+        ]
+        await update.message.reply_text(
+            f"Yuqoridagi xabar {store.user_count()} ta foydalanuvchiga yuboriladi. Tasdiqlaysizmi?",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return BROADCAST_CONFIRM
+    except Exception as e:
+        logger.error(f"broadcast_text xatosi: {traceback.format_exc()}")
+        await update.message.reply_text("Xatolik yuz berdi.")
+        return ConversationHandler.END
+
+async def broadcast_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    text = context.user_data.pop("broadcast_text", None)
+    if query.data != "broadcast_confirm" or not text:
+        await query.edit_message_text("Broadcast bekor qilindi.", reply_markup=get_admin_keyboard())
+        return ConversationHandler.END
+    if broadcaster.running:
+        await query.edit_message_text("Boshqa broadcast allaqachon ishlamoqda.", reply_markup=get_admin_keyboard())
+        return ConversationHandler.END
+    await query.edit_message_text("📢 Broadcast boshlanmoqda...")
+    broadcaster.start(context.bot, text, query.message.chat_id, query.message.message_id)
+    return ConversationHandler.END
+
+async def broadcast_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.user_data.clear()
+    await update.message.reply_text("Broadcast bekor qilindi.", reply_markup=get_admin_keyboard())
+    return ConversationHandler.END
+
+# ------------------- FOYDALANUVCHILAR EKSPORTI -------------------
+EXPORT_FIELDS = ("id", "balance", "referrals", "referred_by", "start_bonus_given", "withdraw_code", "blocked")
+EXPORT_FORMATS = ("csv", "jsonl")
+
+def export_header(fmt: str) -> str:
+    return ",".join(EXPORT_FIELDS) + "\r\n" if fmt == "csv" else ""
+
+def export_chunks(fmt: str, chunk_size: int = EXPORT_CHUNK) -> Iterator[str]:
+    """Foydalanuvchilarni id tartibida chunk_size tadan olib, CSV/JSONL matn bo‘laklarini qaytaradi."""
+    after = 0
+    while True:
+        batch = store.iter_user_records(after, chunk_size)
+        if not batch:
+            return
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == "csv" else None
+        for user_id, user in batch:
+            row = (
+                user_id,
+                user.get("balance", 0),
+                user.get("referrals", 0),
+                user.get("referred_by"),
+                bool(user.get("start_bonus_given")),
+                user.get("withdraw_code"),
+                bool(user.get("blocked")),
+            )
+            if writer is not None:
+                writer.writerow(int(v) if isinstance(v, bool) else v for v in row)
+            else:
+                buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + "\n")
+        yield buffer.getvalue()
+        after = batch[-1][0]
+
+class UserExporter:
+    """Admin uchun foydalanuvchilar eksporti (gzip CSV yoki JSONL), fon vazifasida.
+
+    Bo‘laklar export_chunks() dan event loopda olinadi (store'ga murojaat qisqa),
+    siqish va vaqtinchalik faylga yozish thread'da bajariladi – xotirada bir vaqtda
+    faqat bitta bo‘lak turadi. Fayl EXPORT_PART_BYTES dan oshsa, qism yuborilib
+    keyingisi boshlanadi.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, bot: Bot, chat_id: int, fmt: str) -> bool:
+        if self.running:
+            return False
+        self._task = asyncio.create_task(self._run(bot, chat_id, fmt))
+        return True
+
+    async def close(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    @staticmethod
+    def _open_part(fmt: str):
+        fd, path = tempfile.mkstemp(prefix="winwin-export-", suffix=f".{fmt}.gz")
+        raw = os.fdopen(fd, "wb")
+        text = io.TextIOWrapper(gzip.GzipFile(fileobj=raw, mode="wb"), encoding="utf-8", newline="")
+        text.write(export_header(fmt))
+        return path, raw, text
+
+    @staticmethod
+    def _close_part(raw, text):
+        text.close()
+        raw.close()
+
+    async def _send_part(self, bot: Bot, chat_id: int, raw, text, path: str, filename: str, caption: str):
+        await asyncio.to_thread(self._close_part, raw, text)
+        try:
+            with open(path, "rb") as f:
+                await bot.send_document(chat_id=chat_id, document=f, filename=filename, caption=caption,
+                                        write_timeout=EXPORT_UPLOAD_TIMEOUT)
+        finally:
+            os.remove(path)
+
+    async def _run(self, bot: Bot, chat_id: int, fmt: str):
+        started = time.monotonic()
+        stamp = time.strftime("%Y%m%d_%H%M")
+        await store.prepare_user_scan()
+        total = store.user_count()
+        caption = f"📥 Foydalanuvchilar ({total} ta), {fmt.upper()}"
+        part = 0
+        path = raw = text = None
+        try:
+            for chunk in export_chunks(fmt):
+                if path is None:
+                    part += 1
+                    path, raw, text = await asyncio.to_thread(self._open_part, fmt)
+                await asyncio.to_thread(text.write, chunk)
+                if raw.tell() >= EXPORT_PART_BYTES:
+                    current, path = path, None
+                    await self._send_part(bot, chat_id, raw, text, current, f"users_{stamp}_{part}.{fmt}.gz",
+                                          f"{caption} – {part}-qism")
+            if path is None and part == 0:
+                # Foydalanuvchilar yo‘q – faqat sarlavhali fayl
+                part = 1
+                path, raw, text = await asyncio.to_thread(self._open_part, fmt)
+            if path is not None:
+                current, path = path, None
+                suffix = "" if part == 1 else f"_{part}"
+                await self._send_part(bot, chat_id, raw, text, current, f"users_{stamp}{suffix}.{fmt}.gz",
+                                      f"{caption} • {time.monotonic() - started:.1f} s")
+            logger.info(f"Eksport tayyor: {total} ta foydalanuvchi, {part} ta fayl, {time.monotonic() - started:.1f} s.")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.error(f"Eksportda xatolik: {traceback.format_exc()}")
+            with contextlib.suppress(TelegramError):
+                await bot.send_message(chat_id=chat_id, text="❌ Eksportda xatolik yuz berdi.")
+        finally:
+            if path is not None:
+                with contextlib.suppress(OSError, ValueError):
+                    self._close_part(raw, text)
+                    os.remove(path)
+
+user_exporter = UserExporter()
+
+async def admin_export_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    keyboard = [
+        [
+            InlineKeyboardButton("CSV (.gz)", callback_data="admin_export_csv"),
+            InlineKeyboardButton("JSONL (.gz)", callback_data="admin_export_jsonl"),
+        ],
+        [InlineKeyboardButton("◀️ Back", callback_data="admin_back")],
+    ]
+    await update.callback_query.edit_message_text(
+        f"📥 {store.user_count()} ta foydalanuvchini qaysi formatda yuklab olasiz?",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+    )
+
+async def admin_export_format_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, fmt: str):
+    query = update.callback_query
+    if fmt not in EXPORT_FORMATS:
+        return
+    if not user_exporter.start(context.bot, query.message.chat_id, fmt):
+        await query.edit_message_text("Eksport allaqachon tayyorlanmoqda.", reply_markup=get_admin_keyboard())
+        return
+    await query.edit_message_text("⏳ Eksport tayyorlanmoqda – fayl shu chatga yuboriladi.", reply_markup=get_admin_keyboard())
+
+# ------------------- HTTP SERVER -------------------
+class HttpRequest(NamedTuple):
+    method: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]
+    body: bytes
+
+# Handler (status, javob, qo‘shimcha sarlavhalar) qaytaradi; javob dict bo‘lsa JSON yuboriladi
+HttpHandler = Callable[[HttpRequest], Awaitable[Tuple[int, object, Dict[str, str]]]]
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+                405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+class HttpServer:
+    """Bot bilan bitta event loopda ishlaydigan kichik HTTP/1.1 server (aiohttp talab qilinmaydi).
+
+    Har bir javobga X-Response-Time-Ms sarlavhasi qo‘shiladi.
+    """
+
+    def __init__(self, host: str, port: int, max_body: int = 1024 * 1024):
+        self.host = host
+        self.port = port
+        self.max_body = max_body
+        self._routes: Dict[Tuple[str, str], HttpHandler] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def route(self, method: str, prefix: str, handler: HttpHandler):
+        self._routes[(method, prefix)] = handler
+
+    def _find(self, method: str, path: str) -> Tuple[int, Optional[HttpHandler]]:
+        best, status = None, 404
+        for (route_method, prefix), handler in self._routes.items():
+            if path == prefix or (prefix.endswith("/") and path.startswith(prefix)):
+                if route_method != method:
+                    status = 405
+                    continue
+                if best is None or len(prefix) > len(best[0]):
+                    best = (prefix, handler)
+        return (200, best[1]) if best else (status, None)
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"HTTP server {self.host}:{self.port} da ishga tushdi.")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[HttpRequest]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", "0"))
+        if length > self.max_body:
+            raise OverflowError("payload too large")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        return HttpRequest(method.upper(), url.path, dict(parse_qsl(url.query)), headers, body)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), timeout=30)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except OverflowError:
+                    await self._respond(writer, 413, {"error": "payload too large"}, {}, 0.0, close=True)
+                    return
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "bad request"}, {}, 0.0, close=True)
+                    return
+                if request is None:
+                    return
+                started = time.perf_counter()
+                status, handler = self._find(request.method, request.path)
+                headers: Dict[str, str] = {}
+                if handler is None:
+                    payload = {"error": HTTP_REASONS[status].lower()}
+                else:
+                    try:
+                        status, payload, headers = await handler(request)
+                    except Exception:
+                        logger.error(f"HTTP handler xatosi: {traceback.format_exc()}")
+                        status, payload = 500, {"error": "internal error"}
+                close = request.headers.get("connection", "").lower() == "close"
+                await self._respond(writer, status, payload, headers, time.perf_counter() - started, close)
+                if close:
+                    return
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status: int, payload, headers: Dict[str, str], elapsed: float, close: bool):
+        if isinstance(payload, (bytes, str)):
+            body = payload.encode("utf-8") if isinstance(payload, str) else payload
+            headers.setdefault("Content-Type", "text/plain; charset=utf-8")
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            headers.setdefault("Content-Type", "application/json")
+        headers["Content-Length"] = str(len(body))
+        headers["X-Response-Time-Ms"] = f"{elapsed * 1000:.3f}"
+        headers["Connection"] = "close" if close else "keep-alive"
+        head = f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'OK')}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        await writer.drain()
+
+# ------------------- KOD TEKSHIRISH API -------------------
+def lookup_withdraw_code(code: str) -> dict:
+    """Kod bo‘yicha foydalanuvchi, balans va yechish huquqini qaytaradi (indeks orqali O(1))."""
+    user_id = store.find_user_by_code(code)
+    if user_id is None:
+        return {"code": code, "found": False}
+    balance = store.get_user(user_id).get("balance", 0)
+    return {
+        "code": code,
+        "found": True,
+        "user_id": user_id,
+        "balance": balance,
+        "eligible": balance >= MIN_WITHDRAW,
+    }
+
+def _verify_authorized(request: HttpRequest) -> bool:
+    return not VERIFY_API_TOKEN or request.headers.get("authorization") == f"Bearer {VERIFY_API_TOKEN}"
+
+async def verify_code_handler(request: HttpRequest):
+    """GET /codes/<kod> – bitta kodni tekshirish."""
+    if not _verify_authorized(request):
+        return 401, {"error": "unauthorized"}, {}
+    code = request.path[len("/codes/"):]
+    result = lookup_withdraw_code(code)
+    return (200 if result["found"] else 404), result, {}
+
+async def verify_codes_batch_handler(request: HttpRequest):
+    """POST /codes {"codes": [...]} – bir nechta kodni bitta so‘rovda tekshirish."""
+    if not _verify_authorized(request):
+        return 401, {"error": "unauthorized"}, {}
+    try:
+        codes = json.loads(request.body)["codes"]
+        if not isinstance(codes, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return 400, {"error": "expected {\"codes\": [...]}"}, {}
+    if len(codes) > VERIFY_BATCH_LIMIT:
+        return 413, {"error": f"at most {VERIFY_BATCH_LIMIT} codes per request"}, {}
+    started = time.perf_counter()
+    results = [lookup_withdraw_code(str(code)) for code in codes]
+    lookup_ms = (time.perf_counter() - started) * 1000
+    return 200, {"results": results}, {"Server-Timing": f"lookup;dur={lookup_ms:.3f}"}
+
+def create_verify_api() -> HttpServer:
+    server = HttpServer(VERIFY_API_HOST, VERIFY_API_PORT)
+    server.route("GET", "/codes/", verify_code_handler)
+    server.route("POST", "/codes", verify_codes_batch_handler)
+    return server
+
+verify_api: Optional[HttpServer] = None
+
+# ------------------- METRIKALAR (PROMETHEUS) -------------------
+def _prom_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_prometheus() -> str:
+    """perf gistogrammalari va navbat hisoblagichlari Prometheus matn formatida."""
+    out = [
+        "# HELP winwin_latency_seconds Handler, Bot API va saqlash kechikishlari",
+        "# TYPE winwin_latency_seconds histogram",
+    ]
+    for (kind, name), h in sorted(perf.histograms.items()):
+        labels = f'kind="{kind}",name="{_prom_label(name)}"'
+        cumulative = 0
+        for bound, n in zip(PERF_BOUNDS, h.counts):
+            cumulative += n
+            out.append(f'winwin_latency_seconds_bucket{{{labels},le="{bound:.6g}"}} {cumulative}')
+        out.append(f'winwin_latency_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+        out.append(f"winwin_latency_seconds_sum{{{labels}}} {h.total:.6f}")
+        out.append(f"winwin_latency_seconds_count{{{labels}}} {h.count}")
+    outbox = rate_limiter.stats()
+    out += [
+        "# TYPE winwin_outbox_depth gauge",
+        f"winwin_outbox_depth {outbox['depth']}",
+        "# TYPE winwin_outbox_requests_total counter",
+    ]
+    for state in ("sent", "retried", "dropped"):
+        out.append(f'winwin_outbox_requests_total{{state="{state}"}} {outbox[state]}')
+    out.append("# TYPE winwin_flood_suppressed_total counter")
+    for reason, n in flood_guard.stats().items():
+        out.append(f'winwin_flood_suppressed_total{{reason="{reason}"}} {n}')
+    return "\n".join(out) + "\n"
+
+async def metrics_handler(request: HttpRequest):
+    return 200, render_prometheus(), {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+metrics_api: Optional[HttpServer] = None
+referral_refresh_task: Optional[asyncio.Task] = None
+
 # ------------------- ASOSIY -------------------
-def main():
-    app = Application.builder().token(TOKEN).build()
+async def post_init(application: Application):
+    """Bot ishga tushgach fon vazifalarini boshlaydi."""
+    global verify_api, metrics_api, referral_refresh_task
+    await open_store()
+    store.start()
+    in_cluster = CLUSTER_WORKER_INDEX >= 0
+    if not in_cluster:
+        # Klasterda bonuslarni faqat lider beradi (ClusterCoordinator)
+        bonus_scheduler.start(application.bot)
+    referral_notifier.start(application.bot)
+    started = time.perf_counter()
+    load_referral_indexes()
+    logger.info(f"Taklif reytingi va daraxti qurildi: {referral_leaderboard.referrers} ta taklifchi, "
+                f"{time.perf_counter() - started:.2f} s.")
+    if in_cluster:
+        referral_refresh_task = asyncio.create_task(refresh_referral_indexes(LEADERBOARD_REFRESH))
+    await views_counter.start()
+    if not in_cluster or cluster_shard(ADMIN_ID) == CLUSTER_WORKER_INDEX:
+        # Broadcast admin yangilanishlarini oladigan workerda boshlanadi va davom ettiriladi
+        broadcaster.resume(application.bot)
+    if VERIFY_API_PORT and not in_cluster:
+        verify_api = create_verify_api()
+        await verify_api.start()
+    if METRICS_PORT:
+        # Klasterda har bir worker o‘z portida: METRICS_PORT + 1 + raqam
+        metrics_api = HttpServer(METRICS_HOST, METRICS_PORT + 1 + CLUSTER_WORKER_INDEX if in_cluster else METRICS_PORT)
+        metrics_api.route("GET", "/metrics", metrics_handler)
+        await metrics_api.start()
+
+async def post_stop(application: Application):
+    """Bot API hali ochiq paytda to‘xtatilishi kerak bo‘lgan vazifalar."""
+    await broadcaster.close()
+    await user_exporter.close()
+    await referral_notifier.close()
+    if referral_refresh_task is not None:
+        referral_refresh_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await referral_refresh_task
+
+async def post_shutdown(application: Application):
+    """Bot to‘xtaganda yozilmagan maʼlumotlarni diskka yozadi."""
+    if verify_api is not None:
+        await verify_api.stop()
+    if metrics_api is not None:
+        await metrics_api.stop()
+    await bonus_scheduler.close()
+    await views_counter.close()
+    await store.close()
+
+def make_webhook_handler(application: Application) -> HttpHandler:
+    """Telegram yuborgan update JSON ni to‘g‘ridan-to‘g‘ri Application navbatiga qo‘yadi."""
+
+    async def handler(request: HttpRequest):
+        if WEBHOOK_SECRET and request.headers.get("x-telegram-bot-api-secret-token") != WEBHOOK_SECRET:
+            return 401, {"error": "unauthorized"}, {}
+        try:
+            update = Update.de_json(json.loads(request.body), application.bot)
+        except (ValueError, TypeError, KeyError):
+            return 400, {"error": "invalid update"}, {}
+        await application.update_queue.put(update)
+        return 200, b"", {}
+
+    return handler
+
+async def run_webhook(application: Application):
+    """Webhook rejimi: run_polling o‘rniga ichki HTTP server orqali update qabul qilish.
+
+    WEBHOOK_URL berilmasa setWebhook chaqirilmaydi – bu holda lokal serverga
+    yozib olingan update larni POST qilib, botni oflayn sinash mumkin.
+    """
+    server = HttpServer(WEBHOOK_LISTEN, WEBHOOK_PORT)
+    server.route("POST", WEBHOOK_PATH, make_webhook_handler(application))
+    if not WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET berilmagan – webhook so‘rovlari tekshirilmaydi.")
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    if WEBHOOK_URL:
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    await application.start()
+    await server.start()
+    logger.info(f"Webhook rejimi: {WEBHOOK_LISTEN}:{server.port}{WEBHOOK_PATH}")
+    try:
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+def instrument_handlers(application: Application):
+    """Ro‘yxatdan o‘tgan barcha handlerlar (konversatsiya bosqichlari bilan) callbackini timed() bilan o‘raydi."""
+    def walk(handlers):
+        for handler in handlers:
+            if isinstance(handler, ConversationHandler):
+                walk(handler.entry_points)
+                for state_handlers in handler.states.values():
+                    walk(state_handlers)
+                walk(handler.fallbacks)
+            else:
+                handler.callback = timed(handler.callback)
+
+    for group_handlers in application.handlers.values():
+        walk(group_handlers)
+
+def build_callback_router() -> CallbackRouter:
+    router = CallbackRouter()
+    # Foydalanuvchi menyusi
+    router.exact("show_games", show_games)
+    router.action("games_page", show_games)
+    router.action("game", game_callback)
+    router.exact("earn", earn_callback)
+    router.exact("balance", balance_callback)
+    router.exact("leaderboard", leaderboard_callback)
+    router.exact("withdraw", withdraw_callback)
+    router.exact("main_menu", back_to_main)
+    # Admin panel (add, edit va broadcast konversatsiyalaridan tashqari)
+    router.exact("admin_remove_list", admin_remove_list_callback, admin=True)
+    router.action("admin_page_remove", admin_remove_list_callback, admin=True)
+    router.exact("admin_edit_list", admin_edit_list_callback, admin=True)
+    router.action("admin_page_edit", admin_edit_list_callback, admin=True)
+    router.exact("admin_stats", admin_stats_callback, admin=True)
+    router.exact("admin_close", admin_close_callback, admin=True)
+    router.exact("admin_back", admin_back_callback, admin=True)
+    router.exact("broadcast_stop", broadcast_stop_callback, admin=True)
+    router.exact("admin_export", admin_export_callback, admin=True)
+    router.exact("admin_ref_flags", admin_ref_flags_callback, admin=True)
+    router.action("admin_export", admin_export_format_callback, admin=True)
+    router.exact("confirm_remove", confirm_remove_callback, admin=True)
+    router.action("remove", remove_game_callback, admin=True)
+    router.action("edit", edit_game_menu_callback, admin=True)
+    # Tahrirlash konversatsiyalarining kirish tugmalari (konversatsiya ushlamasa ham "edit" ga tushmasin)
+    for action in ("edit_text", "edit_photo", "edit_file", "edit_button"):
+        router.reserve(action)
+    return router
+
+def build_application() -> Application:
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+        .rate_limiter(rate_limiter)
+    )
+    if BOT_API_URL:
+        builder = builder.base_url(BOT_API_URL).base_file_url(BOT_API_URL.replace("/bot", "/file/bot", 1))
+    app = builder.build()
+
+    # Flood himoyasi – barcha handlerlardan oldin
+    app.add_handler(TypeHandler(Update, flood_guard.check), group=-1)
 
     # Asosiy handlerlar
     app.add_handler(CommandHandler("start", start))
-    app.add_handler(CallbackQueryHandler(show_games, pattern="^show_games$"))
-    app.add_handler(CallbackQueryHandler(game_callback, pattern="^game_"))
-    app.add_handler(CallbackQueryHandler(earn_callback, pattern="^earn$"))
-    app.add_handler(CallbackQueryHandler(balance_callback, pattern="^balance$"))
-    app.add_handler(CallbackQueryHandler(withdraw_callback, pattern="^withdraw$"))
-    app.add_handler(CallbackQueryHandler(back_to_main, pattern="^main_menu$"))
-
-    # Admin panel (umumiy callbacklar)
-    app.add_handler(CallbackQueryHandler(
-        admin_callback_handler,
-        pattern="^(admin_remove_list|admin_edit_list|admin_stats|admin_close|admin_back|remove_|confirm_remove)$"
-    ))
     app.add_handler(CommandHandler("admin", admin_panel))
+    app.add_handler(CommandHandler("perf", perf_command))
+    app.add_handler(CommandHandler("subtree", subtree_command))
 
     # ADD GAME conversation
     add_conv = ConversationHandler(
@@ -927,8 +4960,289 @@ def main():
     )
     app.add_handler(edit_button_conv)
 
+    # BROADCAST conversation
+    broadcast_conv = ConversationHandler(
+        entry_points=[CallbackQueryHandler(admin_broadcast_callback, pattern="^admin_broadcast$")],
+        states={
+            BROADCAST_TEXT: [MessageHandler(filters.TEXT & ~filters.COMMAND, broadcast_text)],
+            BROADCAST_CONFIRM: [CallbackQueryHandler(broadcast_confirm, pattern="^broadcast_(confirm|cancel)$")],
+        },
+        fallbacks=[CommandHandler("cancel", broadcast_cancel)],
+    )
+    app.add_handler(broadcast_conv)
+
+    # Vaqt o‘lchovi; router marshrutlari o‘zi timed() bilan o‘ralgan, shuning uchun u keyin qo‘shiladi
+    instrument_handlers(app)
+
+    # Qolgan barcha callbacklar — konversatsiyalardan keyin, bitta router orqali
+    app.add_handler(CallbackQueryHandler(build_callback_router().dispatch))
+    return app
+
+# ------------------- KLASTER REJIMI -------------------
+def update_user_id(raw: dict) -> int:
+    """Xom update JSON dan foydalanuvchi (bo‘lmasa chat) id si."""
+    for value in raw.values():
+        if isinstance(value, dict):
+            for key in ("from", "user", "chat"):
+                sender = value.get(key)
+                if isinstance(sender, dict) and "id" in sender:
+                    return sender["id"]
+    return 0
+
+def cluster_shard(user_id: int) -> int:
+    return user_id % max(CLUSTER_WORKERS, 1)
+
+async def reload_catalog():
+    """Katalogni bazadan qayta o‘qiydi (boshqa worker o‘yinni qo‘shgan/tahrirlagan/o‘chirgan bo‘lsa)."""
+    fresh = store.load_games()
+    games_data.clear()
+    games_data.update(fresh)
+    games_by_id.clear()
+    await index_games()
+    invalidate_catalog_cache()
+
+class ClusterCoordinator:
+    """Workerlar orasidan bitta liderni SQLite lizingi orqali tanlaydi.
+
+    Lizing har CLUSTER_LEASE_TTL / 3 soniyada yangilanadi; lider jarayon o‘lsa,
+    TTL tugagach boshqa worker uni oladi. Lider start bonuslarini beradi va
+    katalog versiyasi o‘zgarganda barcha workerlarga "catalog" xabarini yuboradi.
+    """
+
+    LEASE = "leader"
+
+    def __init__(self, index: int, queues: list, ttl: float = CLUSTER_LEASE_TTL):
+        self.index = index
+        self.queues = queues
+        self.ttl = ttl
+        self.owner = f"{os.getpid()}:{index}"
+        self.is_leader = False
+        self._catalog_version = store.catalog_version()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, bot: Bot):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(bot))
+
+    async def _run(self, bot: Bot):
+        next_renew = 0.0
+        while True:
+            try:
+                now = time.monotonic()
+                if now >= next_renew:
+                    await self._set_leader(await store.acquire_lease(self.LEASE, self.owner, self.ttl), bot)
+                    next_renew = now + self.ttl / 3
+                if self.is_leader:
+                    self._broadcast_catalog()
+            except Exception:
+                logger.error(f"Klaster koordinatorida xatolik: {traceback.format_exc()}")
+            await asyncio.sleep(CLUSTER_SYNC_INTERVAL)
+
+    async def _set_leader(self, leader: bool, bot: Bot):
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        if leader:
+            logger.info(f"Worker {self.index} lider bo‘ldi.")
+            self._catalog_version = store.catalog_version()
+            bonus_scheduler.start(bot)
+        else:
+            logger.warning(f"Worker {self.index} liderlikni yo‘qotdi.")
+            await bonus_scheduler.close()
+
+    def _broadcast_catalog(self):
+        version = store.catalog_version()
+        if version == self._catalog_version:
+            return
+        self._catalog_version = version
+        for inbox in self.queues:
+            try:
+                inbox.put_nowait(("catalog", version))
+            except queue.Full:
+                logger.warning("Worker navbati to‘la – katalog yangilanishi keyingi o‘zgarishda yetkaziladi.")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            await bonus_scheduler.close()
+            await store.release_lease(self.LEASE, self.owner)
+            self.is_leader = False
+
+def _drain_inbox(inbox, limit: int = 256) -> list:
+    """Navbatdan xabarlarni oladi (thread'da, 0.5 s gacha bloklanadi)."""
+    try:
+        messages = [inbox.get(timeout=0.5)]
+    except queue.Empty:
+        return []
+    while len(messages) < limit:
+        try:
+            messages.append(inbox.get_nowait())
+        except queue.Empty:
+            break
+    return messages
+
+async def run_cluster_worker(index: int, queues: list):
+    """Worker: front jarayondan kelgan update larni oddiy Application orqali ishlaydi."""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, stop_event.set)
+    loop.add_signal_handler(signal.SIGINT, lambda: None)  # Ctrl+C ni front boshqaradi
+
+    bonus_scheduler.persist_only = True
+    bonus_scheduler.poll_interval = BONUS_POLL_INTERVAL
+    application = build_application()
+    await application.initialize()
+    await post_init(application)
+    await application.start()
+    coordinator = ClusterCoordinator(index, queues)
+    coordinator.start(application.bot)
+    logger.info(f"Klaster worker {index} ishga tushdi (pid {os.getpid()}).")
+    inbox = queues[index]
+    try:
+        while not stop_event.is_set():
+            for kind, payload in await asyncio.to_thread(_drain_inbox, inbox):
+                if kind == "update":
+                    await application.update_queue.put(Update.de_json(payload, application.bot))
+                elif kind == "catalog":
+                    await reload_catalog()
+                elif kind == "stop":
+                    stop_event.set()
+    finally:
+        await coordinator.close()
+        await application.stop()
+        await post_stop(application)
+        await application.shutdown()
+        await post_shutdown(application)
+
+def cluster_worker_main(index: int, queues: list):
+    """multiprocessing (spawn) uchun kirish nuqtasi."""
+    asyncio.run(run_cluster_worker(index, queues))
+
+async def run_cluster_front(queues: list):
+    """Front: Telegramdan update larni oladi va user_id % N bo‘yicha workerlarga yo‘naltiradi."""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    async def dispatch(raw: dict):
+        inbox = queues[cluster_shard(update_user_id(raw))]
+        try:
+            inbox.put_nowait(("update", raw))
+        except queue.Full:
+            # Worker ulgurmayapti – front ham sekinlashadi (backpressure)
+            await asyncio.to_thread(inbox.put, ("update", raw))
+
+    bot = Bot(TOKEN, **({"base_url": BOT_API_URL} if BOT_API_URL else {}))
+    await bot.initialize()
+    server = None
+    poller = None
+    global verify_api
+    if VERIFY_API_PORT:
+        # Front faqat kod tekshirish API si uchun bazani o‘qiydi
+        await open_store()
+        verify_api = create_verify_api()
+        await verify_api.start()
+    if RUN_MODE == "webhook":
+        async def webhook(request: HttpRequest):
+            if WEBHOOK_SECRET and request.headers.get("x-telegram-bot-api-secret-token") != WEBHOOK_SECRET:
+                return 401, {"error": "unauthorized"}, {}
+            try:
+                raw = json.loads(request.body)
+            except ValueError:
+                return 400, {"error": "invalid update"}, {}
+            await dispatch(raw)
+            return 200, b"", {}
+
+        server = HttpServer(WEBHOOK_LISTEN, WEBHOOK_PORT)
+        server.route("POST", WEBHOOK_PATH, webhook)
+        if WEBHOOK_URL:
+            await bot.set_webhook(url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                                  allowed_updates=Update.ALL_TYPES)
+        await server.start()
+        logger.info(f"Klaster front (webhook): {WEBHOOK_LISTEN}:{server.port}{WEBHOOK_PATH}")
+    else:
+        async def poll():
+            await bot.delete_webhook()
+            offset = 0
+            while True:
+                try:
+                    updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=Update.ALL_TYPES)
+                except TelegramError as e:
+                    logger.warning(f"getUpdates xatosi: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                for update in updates:
+                    offset = update.update_id + 1
+                    await dispatch(update.to_dict())
+
+        poller = asyncio.create_task(poll())
+        logger.info("Klaster front (polling) ishga tushdi.")
+    try:
+        await stop_event.wait()
+    finally:
+        if poller is not None:
+            poller.cancel()
+            await asyncio.gather(poller, return_exceptions=True)
+        if server is not None:
+            await server.stop()
+        if verify_api is not None:
+            await verify_api.stop()
+            await store.close()
+        await bot.shutdown()
+
+def run_cluster():
+    """CLUSTER_WORKERS ta worker jarayonini ishga tushiradi; joriy jarayon front bo‘ladi."""
+    if STORAGE_BACKEND != "sqlite":
+        raise SystemExit("Klaster rejimi umumiy ombor talab qiladi: STORAGE_BACKEND=sqlite qo‘ying.")
+    ctx = multiprocessing.get_context("spawn")
+    queues = [ctx.Queue(maxsize=CLUSTER_QUEUE_SIZE) for _ in range(CLUSTER_WORKERS)]
+    workers = []
+    for index in range(CLUSTER_WORKERS):
+        # spawn qilingan jarayon os.environ nusxasini oladi – worker raqami modul darajasida o‘qiladi
+        os.environ["CLUSTER_WORKER_INDEX"] = str(index)
+        process = ctx.Process(target=cluster_worker_main, args=(index, queues), name=f"winwin-worker-{index}")
+        process.start()
+        workers.append(process)
+    os.environ.pop("CLUSTER_WORKER_INDEX", None)
+    logger.info(f"Klaster: {CLUSTER_WORKERS} ta worker ishga tushirildi.")
+    try:
+        asyncio.run(run_cluster_front(queues))
+    finally:
+        for inbox in queues:
+            inbox.put(("stop", None))
+        for process in workers:
+            process.join(timeout=30)
+            if process.is_alive():
+                logger.warning(f"{process.name} to‘xtamadi – majburan tugatiladi.")
+                process.terminate()
+
+def main():
+    if CLUSTER_WORKERS > 1:
+        run_cluster()
+        return
+    app = build_application()
     logger.info("Bot ishga tushdi...")
-    app.run_polling()
+    if RUN_MODE == "webhook":
+        asyncio.run(run_webhook(app))
+    else:
+        app.run_polling()
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == "import-json":
+        # Foydalanish: python bot.py import-json
+        n_users, n_games = import_json_to_sqlite()
+        logger.info(f"{n_users} ta foydalanuvchi va {n_games} ta o‘yin {SQLITE_FILE} ga ko‘chirildi.")
+    elif len(sys.argv) > 1 and sys.argv[1] == "convert-users":
+        # Foydalanish: python bot.py convert-users [binary|json]
+        target = sys.argv[2] if len(sys.argv) > 2 else "binary"
+        n_users = convert_users(target)
+        logger.info(f"{n_users} ta foydalanuvchi {USERS_BIN_FILE if target == 'binary' else USERS_FILE} ga yozildi.")
+    else:
+        main()
@@ -0,0 +1,129 @@
+import asyncio
+import time
+
+import pytest
+
+import bot
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(chat_id)
+
+
+@pytest.fixture
+def json_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def open_store():
+        store = bot.JsonStore(users_format="json")
+        monkeypatch.setattr(bot, "store", store)
+        return store
+
+    return open_store
+
+
+async def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "kutilgan holat yuz bermadi"
+        await asyncio.sleep(0.01)
+
+
+async def new_user(store, user_id, **fields):
+    await store.create_user(user_id, {"balance": 0, "start_bonus_given": False, **fields})
+
+
+def test_schedule_dedupes_and_pays_once(json_store):
+    async def scenario():
+        store = json_store()
+        await new_user(store, 1)
+        scheduler = bot.BonusScheduler(delay=0.05)
+        fake = FakeBot()
+        scheduler.start(fake)
+        assert await scheduler.schedule(1) is True
+        assert await scheduler.schedule(1) is False
+        assert list(store.load_pending_bonuses()) == [1]
+        await wait_until(lambda: not store.load_pending_bonuses())
+        await scheduler.close()
+        assert store.get_user(1)["balance"] == bot.START_BONUS
+        assert store.get_user(1)["start_bonus_given"] is True
+        assert fake.sent == [1]
+        # Berilganidan keyin yana navbatga qo‘yish mumkin, lekin bonus ikkinchi marta berilmaydi
+        scheduler.start(fake)
+        assert await scheduler.schedule(1) is True
+        await wait_until(lambda: not store.load_pending_bonuses())
+        await scheduler.close()
+        assert store.get_user(1)["balance"] == bot.START_BONUS
+        await store.close()
+
+    asyncio.run(scenario())
+
+
+def test_pending_bonuses_survive_restart(json_store):
+    async def scenario():
+        store = json_store()
+        await new_user(store, 1)
+        await new_user(store, 2)
+        # Bonus berilgan, lekin navbatdan o‘chirilishi saqlanmay qolgan foydalanuvchi
+        await new_user(store, 3, start_bonus_given=True, balance=bot.START_BONUS)
+        scheduler = bot.BonusScheduler(delay=0.2)
+        for user_id in (1, 2, 3):
+            await scheduler.schedule(user_id)
+        await store.close()
+
+        store = json_store()
+        assert sorted(store.load_pending_bonuses()) == [1, 2, 3]
+        scheduler = bot.BonusScheduler(delay=0.2)
+        fake = FakeBot()
+        scheduler.start(fake)
+        # Tiklangan muddat saqlanadi: qayta ishga tushish muddatni uzaytirmaydi
+        assert await scheduler.schedule(1) is False
+        await wait_until(lambda: not store.load_pending_bonuses())
+        await scheduler.close()
+        assert [store.get_user(user_id)["balance"] for user_id in (1, 2, 3)] == [bot.START_BONUS] * 3
+        assert sorted(fake.sent) == [1, 2]
+        await store.close()
+
+    asyncio.run(scenario())
+
+
+def test_failed_bonus_is_retried_with_backoff(json_store, monkeypatch):
+    monkeypatch.setattr(bot, "BONUS_RETRY_DELAY", 0.05)
+
+    async def scenario():
+        store = json_store()
+        await new_user(store, 1)
+        await new_user(store, 2)
+        credit = store.credit
+        failures = []
+
+        async def flaky_credit(user_id, amount, reason, **fields):
+            if user_id == 1 and len(failures) < 2:
+                failures.append(time.monotonic())
+                raise OSError("disk to‘la")
+            return await credit(user_id, amount, reason, **fields)
+
+        monkeypatch.setattr(store, "credit", flaky_credit)
+        scheduler = bot.BonusScheduler(delay=0.01)
+        scheduler.start(FakeBot())
+        await scheduler.schedule(1)
+        await scheduler.schedule(2)
+        await wait_until(lambda: len(failures) == 1)
+        first_due = store.load_pending_bonuses()[1]
+        # Muvaffaqiyatsiz bonus navbatda qoladi, muddati omborda ham yangilanadi
+        await wait_until(lambda: len(failures) == 2)
+        assert store.load_pending_bonuses()[1] > first_due
+        await wait_until(lambda: not store.load_pending_bonuses())
+        await scheduler.close()
+        assert store.get_user(1)["balance"] == bot.START_BONUS
+        assert store.get_user(2)["balance"] == bot.START_BONUS
+        # Ikkinchi kechikish birinchisidan uzunroq (0.05 s, keyin 0.1 s)
+        assert failures[1] - failures[0] >= 0.05
+        assert scheduler._attempts == {}
+        await store.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,57 @@
+import pytest
+
+import bot
+
+
+@pytest.fixture(scope="module")
+def router():
+    return bot.build_callback_router()
+
+
+def resolved(router, data):
+    result = router.resolve(data)
+    if result is None:
+        return None
+    handler, admin, arg = result
+    return handler.__wrapped__, admin, arg
+
+
+def test_every_registered_shape_resolves_to_itself(router):
+    for data, (handler, admin) in router._exact.items():
+        assert resolved(router, data) == (handler.__wrapped__, admin, None)
+    for action, route in router._actions.items():
+        if route is None:
+            assert router.resolve(f"{action}_1a") is None
+        else:
+            handler, admin = route
+            assert resolved(router, f"{action}_1a") == (handler.__wrapped__, admin, "1a")
+
+
+@pytest.mark.parametrize("data, handler, arg", [
+    ("game_1a", bot.game_callback, "1a"),
+    ("games_page_2", bot.show_games, "2"),
+    ("admin_page_remove_3", bot.admin_remove_list_callback, "3"),
+    ("admin_page_edit_0", bot.admin_edit_list_callback, "0"),
+    ("admin_export", bot.admin_export_callback, None),
+    ("admin_export_csv", bot.admin_export_format_callback, "csv"),
+    ("admin_export_jsonl", bot.admin_export_format_callback, "jsonl"),
+    ("remove_z", bot.remove_game_callback, "z"),
+    ("edit_z", bot.edit_game_menu_callback, "z"),
+    # Eski tugmalar: argument – "_" li o‘yin nomi
+    ("game_Super_Mario", bot.game_callback, "Super_Mario"),
+    ("edit_My_game", bot.edit_game_menu_callback, "My_game"),
+    ("remove_text_5", bot.remove_game_callback, "text_5"),
+])
+def test_callback_data_shapes(router, data, handler, arg):
+    assert resolved(router, data)[0] is handler
+    assert resolved(router, data)[2] == arg
+
+
+@pytest.mark.parametrize("data", [
+    # Tahrirlash konversatsiyalariga tegishli – "edit" ga tushmaydi
+    "edit_text_5", "edit_photo_5", "edit_file_a", "edit_button_Super_Mario",
+    # Konversatsiyalarning boshqa tugmalari va notanish ma'lumot
+    "admin_add", "broadcast_confirm", "broadcast_cancel", "", "_", "unknown", "unknown_5",
+])
+def test_unrouted_callback_data(router, data):
+    assert router.resolve(data) is None
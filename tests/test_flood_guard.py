@@ -0,0 +1,74 @@
+import asyncio
+from types import SimpleNamespace
+
+from telegram.ext import ApplicationHandlerStop
+
+import bot
+
+
+class FakeQuery:
+    def __init__(self, data):
+        self.data = data
+        self.answers = []
+
+    async def answer(self, text=None):
+        self.answers.append(text)
+
+
+def callback(user_id, data):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), callback_query=FakeQuery(data))
+
+
+def message(user_id):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), callback_query=None)
+
+
+def passes(guard, update) -> bool:
+    try:
+        asyncio.run(guard.check(update, None))
+    except ApplicationHandlerStop:
+        return False
+    return True
+
+
+def test_repeated_callback_is_dropped_within_window(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(bot.time, "monotonic", lambda: now[0])
+    guard = bot.FloodGuard(rate=100, burst=100, dedup_window=1.0)
+    assert passes(guard, callback(1, "game_1"))
+    duplicate = callback(1, "game_1")
+    assert not passes(guard, duplicate)
+    # Faqat spinner o‘chiriladi, matnsiz
+    assert duplicate.callback_query.answers == [None]
+    # Boshqa tugma va boshqa foydalanuvchining shu tugmasi o‘tadi
+    assert passes(guard, callback(1, "game_2"))
+    assert passes(guard, callback(2, "game_2"))
+    # Oxirgi o‘tgan tugma bilan solishtiriladi
+    assert passes(guard, callback(1, "game_1"))
+    now[0] += 1.0
+    assert passes(guard, callback(1, "game_1"))
+    assert guard.duplicates == 1
+
+
+def test_burst_is_throttled(monkeypatch):
+    monkeypatch.setattr(bot.time, "monotonic", lambda: 100.0)
+    guard = bot.FloodGuard(rate=1, burst=3, dedup_window=1.0)
+    assert passes(guard, callback(1, "earn"))
+    # Dedupe qilingan tugma tokenni sarflamaydi
+    assert not passes(guard, callback(1, "earn"))
+    assert [passes(guard, message(1)) for _ in range(3)] == [True, True, False]
+    throttled = callback(1, "balance")
+    assert not passes(guard, throttled)
+    assert throttled.callback_query.answers == ["⏳ Juda tez! Biroz kuting."]
+    assert (guard.duplicates, guard.throttled) == (1, 2)
+    # Boshqa foydalanuvchining o‘z bucketi bor, admin esa umuman cheklanmaydi
+    assert passes(guard, message(2))
+    assert all(passes(guard, message(bot.ADMIN_ID)) for _ in range(10))
+
+
+def test_zero_window_disables_dedupe(monkeypatch):
+    monkeypatch.setattr(bot.time, "monotonic", lambda: 100.0)
+    guard = bot.FloodGuard(rate=100, burst=100, dedup_window=0)
+    assert passes(guard, callback(1, "earn"))
+    assert passes(guard, callback(1, "earn"))
+    assert guard.duplicates == 0
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(bot, "games_by_id", {})
+    monkeypatch.setattr(bot, "_max_game_id", 0)
+
+    async def reopen(make_store):
+        """open_store() kabi: omborni ochadi va katalogni qayta indekslaydi."""
+        store = make_store()
+        monkeypatch.setattr(bot, "store", store)
+        monkeypatch.setattr(bot, "games_data", store.load_games())
+        bot.games_by_id.clear()
+        await bot.index_games()
+        return store
+
+    return reopen
+
+
+async def add_game(name: str) -> str:
+    bot.games_data[name] = {"text": name, "views": 0}
+    game_id = await bot.register_game(name, bot.games_data[name])
+    await bot.store.save_game(name, bot.games_data[name])
+    return game_id
+
+
+@pytest.mark.parametrize("make_store", [
+    lambda: bot.JsonStore(users_format="json"),
+    lambda: bot.SqliteStore("bot.db"),
+], ids=["json", "sqlite"])
+def test_deleted_game_id_is_not_reused(catalog, make_store):
+    async def scenario():
+        store = await catalog(make_store)
+        ids = [await add_game(f"Game {i}") for i in range(3)]
+        assert ids == ["1", "2", "3"]
+        bot.unregister_game("Game 2")
+        del bot.games_data["Game 2"]
+        await store.delete_game("Game 2")
+        await store.close()
+
+        # Qayta ishga tushgandan keyin ham o‘chirilgan eng katta id qayta berilmaydi
+        store = await catalog(make_store)
+        assert await add_game("Game 3") == "4"
+        assert bot.resolve_game_name("3") is None
+        assert bot.resolve_game_name("4") == "Game 3"
+        await store.close()
+
+    asyncio.run(scenario())
+
+
+def test_legacy_games_get_ids_above_existing(catalog):
+    bot.save_games({"old": {"text": "x"}, "new": {"text": "y", "id": "z"}})
+
+    async def scenario():
+        store = await catalog(lambda: bot.JsonStore(users_format="json"))
+        assert bot.games_data["old"]["id"] == "10"
+        assert store.game_seq == 36
+        await store.close()
+
+    asyncio.run(scenario())
+    assert bot.load_games()[bot.GAMES_SEQ_KEY] == 36
+
+
+def test_id_shaped_token_is_not_resolved_as_name(monkeypatch):
+    monkeypatch.setattr(bot, "games_data", {"5": {"id": "a"}, "Tetris": {"id": "b"}})
+    monkeypatch.setattr(bot, "games_by_id", {"a": "5", "b": "Tetris"})
+    assert bot.resolve_game_name("a") == "5"
+    # "5" – o‘chirilgan o‘yinning id si bo‘lishi mumkin, "5" nomli o‘yin ochilmaydi
+    assert bot.resolve_game_name("5") is None
+    # Eski, nom yozilgan tugmalar
+    assert bot.resolve_game_name("Tetris") == "Tetris"
@@ -0,0 +1,63 @@
+import random
+
+from bot import FenwickTree, ReferralLeaderboard
+
+
+def test_fenwick_prefix_sums_with_growth():
+    rng = random.Random(0)
+    tree, values = FenwickTree(size=4), []
+    for _ in range(3000):
+        i = rng.randrange(300)
+        delta = rng.randrange(-5, 10)
+        tree.add(i, delta)
+        if i >= len(values):
+            values.extend([0] * (i + 1 - len(values)))
+        values[i] += delta
+        j = rng.randrange(400)
+        assert tree.prefix(j) == sum(values[:j + 1])
+    assert tree.total == sum(values)
+    assert tree.prefix(10 ** 6) == tree.total
+
+
+def expected_top(counts: dict, size: int):
+    return sorted(((user_id, refs) for user_id, refs in counts.items()), key=lambda item: (-item[1], item[0]))[:size]
+
+
+def expected_rank(counts: dict, referrals: int) -> int:
+    return 1 + sum(refs > referrals for refs in counts.values())
+
+
+def test_leaderboard_matches_brute_force():
+    rng = random.Random(1)
+    board, counts = ReferralLeaderboard(size=10), {}
+    for step in range(5000):
+        user_id = rng.randrange(1, 400)
+        if rng.random() < 0.2 and user_id in counts:
+            # Eski yoki takroriy qiymat (referral_log dan qayta kelgan) – eʼtiborsiz
+            board.update(user_id, rng.randrange(1, counts[user_id] + 1))
+        else:
+            counts[user_id] = counts.get(user_id, 0) + 1
+            board.update(user_id, counts[user_id])
+        if step % 100 == 0:
+            assert board.top() == expected_top(counts, 10)
+            assert board.referrers == len(counts)
+            for referrals in range(0, max(counts.values()) + 2):
+                assert board.rank(referrals) == expected_rank(counts, referrals)
+
+    loaded = ReferralLeaderboard(size=10)
+    loaded.load(counts.items())
+    assert loaded.top() == board.top()
+    assert [loaded.rank(r) for r in range(30)] == [board.rank(r) for r in range(30)]
+
+
+def test_ties_are_ordered_by_user_id():
+    board = ReferralLeaderboard(size=3)
+    board.load([(5, 2), (3, 2), (9, 1)])
+    board.update(1, 2)
+    assert board.top() == [(1, 2), (3, 2), (5, 2)]
+    # Teng natijalar bir o‘rinda
+    assert board.rank(2) == 1
+    assert board.rank(1) == 4
+    board.update(9, 3)
+    assert board.top() == [(9, 3), (1, 2), (3, 2)]
+    assert board.rank(2) == 2
@@ -0,0 +1,132 @@
+import asyncio
+import os
+
+import pytest
+
+import bot
+from bot import UserTable
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def crash(store):
+    """Jarayon o‘ldi: jurnal diskda, write-behind fayllar esa yozilmay qoldi."""
+    store.ledger._file.flush()
+    store.ledger._file.close()
+
+
+def balances(store, *user_ids):
+    return [store.get_user(user_id)["balance"] for user_id in user_ids]
+
+
+async def new_users(store, *user_ids):
+    for user_id in user_ids:
+        await store.create_user(user_id, {"balance": 0, "withdraw_code": f"{user_id:07d}"})
+    await store.users_saver.flush()
+
+
+def test_replay_after_crash():
+    async def scenario():
+        store = bot.JsonStore(users_format="json")
+        await new_users(store, 1, 2)
+        await store.credit(1, 2500, "referral")
+        await store.credit(2, 15000, "start_bonus", start_bonus_given=True)
+        await store.credit(1, -1000, "withdraw")
+        # users.json ga umuman tushmagan foydalanuvchi – jurnaldan tiklanadi
+        await store.create_user(3, {"balance": 0})
+        await store.credit(3, 2500, "referral")
+        crash(store)
+
+        store = bot.JsonStore(users_format="json")
+        assert store.ledger.seq == 4
+        assert balances(store, 1, 2, 3) == [1500, 15000, 2500]
+        assert store.get_user(2)["start_bonus_given"] is True
+        assert store.get_user(1)["withdraw_code"] == "0000001"
+        await store.close()
+
+    asyncio.run(scenario())
+
+
+def test_rotation_and_interrupted_compaction():
+    async def scenario():
+        store = bot.JsonStore(users_format="json")
+        await new_users(store, 1, 2)
+        for _ in range(3):
+            await store.credit(1, 100, "referral")
+        await store.ledger.compact()
+        assert store.ledger.snapshot_seq == 3
+        assert store.ledger._segments() == []
+        await store.credit(2, 200, "referral")
+        # Aylantirildi, lekin snapshot yozilmay turib to‘xtadi
+        store.ledger._rotate()
+        await store.credit(1, 50, "referral")
+        crash(store)
+
+        store = bot.JsonStore(users_format="json")
+        assert store.ledger.seq == 5
+        assert balances(store, 1, 2) == [350, 200]
+        await store.ledger.compact()
+        assert store.ledger._segments() == []
+        await store.credit(2, 1, "referral")
+        crash(store)
+
+        store = bot.JsonStore(users_format="json")
+        assert store.ledger.seq == 6
+        assert balances(store, 1, 2) == [350, 201]
+        await store.close()
+
+    asyncio.run(scenario())
+
+
+def test_binary_checkpoint_via_ledger_seq():
+    async def scenario():
+        store = bot.JsonStore(users_format="binary")
+        await new_users(store, 1, 2)
+        await store.credit(1, 1000, "referral")
+        await store.credit(2, 2000, "referral", start_bonus_given=True)
+        await store.ledger.compact()
+        # Balanslar users.bin da: alohida snapshot fayli yo‘q
+        assert UserTable.from_snapshot(bot.USERS_BIN_FILE).ledger_seq == 2
+        assert not os.path.exists(bot.BALANCE_SNAPSHOT_FILE)
+        await store.credit(1, 10, "referral")
+        # Checkpoint yozildi, lekin segment o‘chirilmay qoldi – uning yozuvlari ikki marta qo‘llanmaydi
+        store.ledger._rotate()
+        await store._checkpoint_users()
+        await store.credit(2, 20, "referral")
+        crash(store)
+
+        store = bot.JsonStore(users_format="binary")
+        assert store.users.ledger_seq == 3
+        assert store.ledger.seq == 4
+        assert balances(store, 1, 2) == [1010, 2020]
+        assert store.get_user(2)["start_bonus_given"] is True
+        await store.close()
+
+    asyncio.run(scenario())
+
+
+def test_torn_final_line_is_dropped():
+    async def scenario():
+        store = bot.JsonStore(users_format="json")
+        await new_users(store, 1)
+        await store.credit(1, 100, "referral")
+        crash(store)
+        with open(bot.LEDGER_FILE, "a", encoding="utf-8") as f:
+            f.write('[2,1,9999,"refer')
+
+        store = bot.JsonStore(users_format="json")
+        assert store.ledger.seq == 1
+        assert balances(store, 1) == [100]
+        # Keyingi yozuv yarim qatorga yopishib qolmaydi
+        await store.credit(1, 5, "referral")
+        crash(store)
+
+        store = bot.JsonStore(users_format="json")
+        assert store.ledger.seq == 2
+        assert balances(store, 1) == [105]
+        await store.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,34 @@
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+import bot
+
+
+def test_retry_after_pauses_all_chats():
+    async def scenario():
+        limiter = bot.OutboundRateLimiter()
+        await limiter.initialize()
+        sent = []
+        failed = []
+
+        async def send(chat_id):
+            if chat_id == 1 and not failed:
+                failed.append(time.monotonic())
+                raise RetryAfter(1)
+            sent.append((chat_id, time.monotonic()))
+
+        first = asyncio.create_task(limiter.process_request(send, (1,), {}, "sendMessage", {"chat_id": 1}, None))
+        while not failed:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.05)
+        # Boshqa chatga yuborish ham RetryAfter tugashini kutadi
+        await limiter.process_request(send, (2,), {}, "sendMessage", {"chat_id": 2}, None)
+        await first
+        await limiter.shutdown()
+        assert {chat_id for chat_id, _ in sent} == {1, 2}
+        assert all(at - failed[0] >= 0.9 for _, at in sent)
+        assert limiter.retried == 1
+
+    asyncio.run(scenario())
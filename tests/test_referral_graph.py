@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+import bot
+from bot import ReferralGraph
+
+
+def brute_force(parent: dict, levels: int):
+    """Har bir taklifchi uchun (downline, darajalar bo‘yicha sonlar) – to‘g‘ridan-to‘g‘ri sanash."""
+    children = {}
+    for user_id, referred_by in parent.items():
+        children.setdefault(referred_by, []).append(user_id)
+    result = {}
+    for node in children:
+        total, counts = 0, [0] * levels
+        stack = [(child, 1) for child in children[node]]
+        while stack:
+            child, depth = stack.pop()
+            total += 1
+            if depth <= levels:
+                counts[depth - 1] += 1
+            stack.extend((grandchild, depth + 1) for grandchild in children.get(child, ()))
+        result[node] = (total, counts)
+    return result
+
+
+def random_forest(n: int, seed: int):
+    rng = random.Random(seed)
+    ids = rng.sample(range(1, 10 * n), n)
+    # Har bir foydalanuvchi o‘zidan oldingi kimdir tomonidan taklif qilingan (yoki taklifsiz kelgan)
+    return [(user_id, ids[rng.randrange(i)]) for i, user_id in enumerate(ids) if i and rng.random() < 0.8]
+
+
+def assert_matches(graph: ReferralGraph, edges):
+    expected = brute_force(dict(edges), graph.levels)
+    assert set(graph.children) == set(expected)
+    for node, (total, counts) in expected.items():
+        assert graph.downline[node] == total
+        assert list(graph.level_counts[node]) == counts
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_incremental_links_match_brute_force(seed):
+    edges = random_forest(2000, seed)
+    graph = ReferralGraph(levels=3)
+    # Tasodifiy tartib: avval taklif qilganlar o‘z daraxtini yig‘adi, keyin o‘zlari boshqaga bog‘lanadi
+    shuffled = edges[:]
+    random.Random(seed).shuffle(shuffled)
+    for user_id, referred_by in shuffled:
+        assert graph.link(user_id, referred_by, now=0.0)
+    assert_matches(graph, edges)
+    assert graph.rings == 0
+
+    loaded = ReferralGraph(levels=3)
+    loaded.load(edges)
+    assert_matches(loaded, edges)
+
+
+def test_subtree_preorder_and_limit():
+    graph = ReferralGraph()
+    for user_id, referred_by in [(2, 1), (3, 1), (4, 2), (5, 4), (6, 3)]:
+        graph.link(user_id, referred_by, now=0.0)
+    assert graph.subtree(1) == [(0, 1), (1, 2), (2, 4), (3, 5), (1, 3), (2, 6)]
+    assert graph.subtree(3) == [(0, 3), (1, 6)]
+    assert graph.subtree(1, limit=3) == [(0, 1), (1, 2), (2, 4)]
+    assert graph.subtree(99) == [(0, 99)]
+
+
+def test_ring_is_flagged_once_and_not_linked():
+    graph = ReferralGraph()
+    for user_id, referred_by in [(2, 1), (3, 2)]:
+        graph.link(user_id, referred_by, now=0.0)
+    # 1 taklifsiz kelgan edi; endi o‘z daraxtidagi 3 orqali kelmoqchi
+    assert not graph.link(1, 3, now=0.0)
+    assert not graph.link(1, 3, now=1.0)
+    assert graph.rings == 2
+    assert [(kind, user_id) for _, kind, user_id, _ in graph.flags] == [("ring", 1)]
+    assert 1 not in graph.parent
+    assert graph.downline[1] == 2
+    # O‘zini o‘zi va takroriy taklif – halqa emas, shunchaki qo‘shilmaydi
+    assert not graph.link(4, 4, now=0.0)
+    assert not graph.link(3, 1, now=0.0)
+    assert graph.rings == 2
+
+
+def test_existing_ring_in_data_is_flagged_on_load():
+    graph = ReferralGraph()
+    graph.load([(2, 1), (1, 3), (3, 2), (5, 4)])
+    assert graph.downline[4] == 1
+    assert sorted((kind, user_id) for _, kind, user_id, _ in graph.flags) == [("ring", 1), ("ring", 2), ("ring", 3)]
+    # Qayta yuklash (klaster resync) bir xil halqani qayta belgilamaydi
+    graph.load([(2, 1), (1, 3), (3, 2), (5, 4)])
+    assert len(graph.flags) == 3
+
+
+def test_burst_flag(monkeypatch):
+    monkeypatch.setattr(bot, "REFERRAL_BURST_COUNT", 5)
+    monkeypatch.setattr(bot, "REFERRAL_BURST_WINDOW", 10.0)
+    graph = ReferralGraph()
+    for i in range(4):
+        graph.link(100 + i, 1, now=float(i))
+    assert graph.bursts == 0
+    graph.link(104, 1, now=4.0)
+    assert graph.bursts == 1
+    assert [(kind, user_id) for _, kind, user_id, _ in graph.flags] == [("burst", 1)]
+    # Shu oynada qayta belgilanmaydi
+    for i in range(5, 10):
+        graph.link(100 + i, 1, now=float(i))
+    assert graph.bursts == 1
+    # Sekin takliflar belgilanmaydi
+    for i in range(5):
+        graph.link(200 + i, 2, now=i * 5.0)
+    assert graph.bursts == 1
+    # Oyna o‘tgach yangi to‘lqin yana belgilanadi
+    for i in range(5):
+        graph.link(300 + i, 1, now=30.0 + i)
+    assert graph.bursts == 2
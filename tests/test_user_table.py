@@ -0,0 +1,127 @@
+import json
+import random
+
+import pytest
+
+import bot
+from bot import IntIndex, UserTable
+
+
+def colliding_keys(index: IntIndex, count: int, start: int = 1):
+    """index da bir xil boshlang‘ich slotga tushadigan kalitlar."""
+    def home(key):
+        return ((key * IntIndex._MIX) & 0xFFFFFFFFFFFFFFFF) >> (64 - index._bits)
+
+    target = home(start)
+    keys = [start]
+    key = start
+    while len(keys) < count:
+        key += 1
+        if home(key) == target:
+            keys.append(key)
+    return keys
+
+
+def test_int_index_matches_dict():
+    rng = random.Random(0)
+    index, reference = IntIndex(8), {}
+    # Kichik kalit oralig‘i: ko‘p to‘qnashuv, o‘chirish va qayta qo‘shish, bir necha marta resize
+    for _ in range(20000):
+        key = rng.randrange(3000)
+        if rng.random() < 0.4:
+            assert index.pop(key) == reference.pop(key, None)
+        else:
+            value = rng.randrange(-2**40, 2**40)
+            index[key] = value
+            reference[key] = value
+    assert len(index) == len(reference)
+    for key in range(3000):
+        assert index.get(key) == reference.get(key)
+        assert (key in index) == (key in reference)
+
+
+def test_int_index_lookup_passes_tombstone():
+    index = IntIndex()
+    a, b, c = colliding_keys(index, 3)
+    index[a], index[b], index[c] = 1, 2, 3
+    assert index.pop(b) == 2
+    # b o‘rnidagi "o‘chirilgan" belgi zanjirni uzmaydi
+    assert index[c] == 3
+    assert b not in index
+    assert index.pop(b, "yo‘q") == "yo‘q"
+    with pytest.raises(KeyError):
+        index[b]
+
+
+def test_int_index_reuses_tombstone():
+    index = IntIndex()
+    a, b, c, d = colliding_keys(index, 4)
+    index[a], index[b], index[c] = 1, 2, 3
+    slot_b = index._slot(b)
+    used = index._used
+    index.pop(b)
+    index[d] = 4
+    # Yangi kalit birinchi o‘chirilgan slotni egallaydi, band slotlar soni o‘smaydi
+    assert index._keys[slot_b] == d
+    assert index._used == used
+    assert [index[k] for k in (a, c, d)] == [1, 3, 4]
+    assert len(index) == 3
+
+
+def test_int_index_churn_does_not_grow():
+    index = IntIndex()
+    capacity = len(index._keys)
+    for key in range(50000):
+        index[key] = key
+        assert index.pop(key) == key
+    # O‘chirilgan slotlar resize da tozalanadi – jadval kattalashmaydi
+    assert len(index) == 0
+    assert len(index._keys) == capacity
+
+
+def make_users(n: int, seed: int = 1) -> dict:
+    rng = random.Random(seed)
+    ids = rng.sample(range(100_000_000, 7_000_000_000), n)
+    users = {}
+    for i, uid in enumerate(ids):
+        code = rng.choice((f"{rng.randrange(bot.CODE_SPACE):07d}", None, f"OLD-{i}"))
+        users[str(uid)] = {
+            "balance": rng.choice((0, 1000, 3000, 15000)),
+            "referred_by": ids[rng.randrange(i)] if i and rng.random() < 0.3 else None,
+            "referrals": rng.randrange(5),
+            "start_bonus_given": rng.random() < 0.8,
+            "withdraw_code": code,
+            "blocked": rng.random() < 0.1,
+        }
+        if rng.random() < 0.1:
+            users[str(uid)]["lang"] = "ru"
+    return users
+
+
+def test_user_table_json_round_trip():
+    users = make_users(500)
+    table = UserTable.from_dict(users)
+    assert len(table) == len(users)
+    assert json.loads("".join(table.iter_json(batch=64))) == users
+    for uid, record in users.items():
+        assert dict(table[uid]) == record
+        if record["withdraw_code"]:
+            assert table.find_code(record["withdraw_code"]) == int(uid)
+
+
+def test_user_table_code_change_and_overwrite():
+    table = UserTable.from_dict({
+        "1": {"balance": 5, "withdraw_code": "0000001", "lang": "uz"},
+        "2": {"balance": 7, "withdraw_code": "OLD"},
+    })
+    table["1"]["withdraw_code"] = "XYZ"
+    table["2"]["withdraw_code"] = "0000001"
+    assert table.find_code("0000001") == 2
+    assert table.find_code("XYZ") == 1
+    assert table.find_code("OLD") is None
+    # Yozuv to‘liq almashtirilsa noma'lum maydonlar ham tushib qoladi
+    table["1"] = {"balance": 9}
+    assert "lang" not in table["1"]
+    assert table["1"]["withdraw_code"] is None
+    assert table.find_code("XYZ") is None
+    assert table.get("3") is None
@@ -0,0 +1,101 @@
+import json
+
+import bot
+from bot import UserTable
+from test_user_table import make_users
+
+
+def write_bin(table: UserTable, path) -> UserTable:
+    bot.atomic_write_chunks(str(path), table.iter_binary(), binary=True)
+    return UserTable.from_snapshot(str(path))
+
+
+def as_dict(table: UserTable) -> dict:
+    return json.loads("".join(table.iter_json()))
+
+
+def test_binary_round_trip(tmp_path):
+    users = make_users(500)
+    table = UserTable.from_dict(users)
+    table.ledger_seq = 42
+    loaded = write_bin(table, tmp_path / "users.bin")
+    assert loaded.ledger_seq == 42
+    assert len(loaded) == len(users)
+    assert as_dict(loaded) == users
+    for uid, record in users.items():
+        if record["withdraw_code"]:
+            assert loaded.find_code(record["withdraw_code"]) == int(uid)
+        assert loaded.record(int(uid)) == record
+    # Qidiruvlar yozuvlarni ustunlarga ko‘chirmaydi
+    assert len(loaded.ids) == 0
+    assert loaded.find_code("NO-SUCH") is None
+
+
+def test_binary_resave_after_changes(tmp_path):
+    users = make_users(300)
+    loaded = write_bin(UserTable.from_dict(users), tmp_path / "a.bin")
+    uids = list(users)
+    changed, recoded, oddified, untouched = uids[:4]
+    loaded[changed]["balance"] += 2500
+    loaded[changed]["lang"] = "en"
+    old_code = users[recoded]["withdraw_code"]
+    loaded[recoded]["withdraw_code"] = "9999999"
+    loaded[oddified]["withdraw_code"] = "EDITED"
+    loaded["5"] = {"balance": 1, "withdraw_code": "1234567", "start_bonus_given": True}
+    # Faqat o‘qilgan yozuv ham ustunlarga ko‘chadi – qayta yozishda o‘zgarmasligi kerak
+    assert loaded[untouched]["balance"] == users[untouched]["balance"]
+
+    users[changed]["balance"] += 2500
+    users[changed]["lang"] = "en"
+    users[recoded]["withdraw_code"] = "9999999"
+    users[oddified]["withdraw_code"] = "EDITED"
+    users["5"] = {"balance": 1, "referred_by": None, "referrals": 0, "start_bonus_given": True,
+                  "withdraw_code": "1234567", "blocked": False}
+    assert as_dict(loaded) == users
+
+    # Ikkinchi avlod: eski snapshot ustiga yoziladi (kodlar indeksida eskirgan yozuvlar qoladi)
+    again = write_bin(loaded.snapshot(), tmp_path / "b.bin")
+    assert as_dict(again) == users
+    assert again.find_code("9999999") == int(recoded)
+    assert again.find_code("1234567") == 5
+    assert again.find_code("EDITED") == int(oddified)
+    if old_code:
+        assert again.find_code(old_code) is None
+
+
+def test_convert_users_between_formats(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    users = make_users(200)
+    uids = list(users)
+    bot.save_users(users)
+    bot.atomic_write_json(bot.BALANCE_SNAPSHOT_FILE, {
+        "seq": 10, "balances": {uid: record["balance"] for uid, record in users.items()},
+    })
+    # Snapshotdan keyingi jurnal dumi (maydonli yozuv bilan) natijaga kirishi kerak
+    with open(bot.LEDGER_FILE, "w", encoding="utf-8") as f:
+        f.write(f'[11,{uids[0]},2500,"referral",0]\n')
+        f.write(f'[12,{uids[1]},3000,"start_bonus",0,{{"start_bonus_given":true}}]\n')
+        f.write(f'[13,{uids[0]},-1000,"withdraw",0]\n')
+    users[uids[0]]["balance"] += 1500
+    users[uids[1]]["balance"] += 3000
+    users[uids[1]]["start_bonus_given"] = True
+
+    assert bot.convert_users("binary") == len(users)
+    table = UserTable.from_snapshot(bot.USERS_BIN_FILE)
+    assert table.ledger_seq == 13
+    assert as_dict(table) == users
+
+    binary = bot.JsonStore(users_format="binary")
+    assert binary.ledger.seq == 13
+    assert binary.get_user(int(uids[0]))["balance"] == users[uids[0]]["balance"]
+    binary.ledger._file.close()
+
+    (tmp_path / bot.USERS_FILE).unlink()
+    assert bot.convert_users("json") == len(users)
+    assert bot.load_users() == users
+    with open(bot.BALANCE_SNAPSHOT_FILE, encoding="utf-8") as f:
+        assert json.load(f)["seq"] == 13
+    reopened = bot.JsonStore(users_format="json")
+    assert reopened.ledger.seq == 13
+    assert as_dict(reopened.users) == users
+    reopened.ledger._file.close()
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+import bot
+
+
+def test_code_permute_is_injective_in_range():
+    codes = [bot.code_permute(n) for n in range(50000)]
+    assert len(set(codes)) == len(codes)
+    assert all(0 <= code < bot.CODE_SPACE for code in codes)
+    # Ketma-ket hisoblagich ketma-ket kod bermaydi
+    assert sum(b - a == 1 for a, b in zip(codes, codes[1:])) < 10
+
+
+@pytest.mark.parametrize("make_store", [
+    lambda: bot.JsonStore(users_format="json"),
+    lambda: bot.SqliteStore("bot.db"),
+], ids=["json", "sqlite"])
+def test_codes_come_from_persisted_counter(tmp_path, monkeypatch, make_store):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(bot, "_code_block", [0, 0])
+
+    async def scenario():
+        store = make_store()
+        monkeypatch.setattr(bot, "store", store)
+        # Eski (tasodifiy) kod hisoblagichning birinchi qiymatini egallagan – o‘tkazib yuboriladi
+        taken = f"{bot.code_permute(0):07d}"
+        await store.create_user(1, {"balance": 0, "withdraw_code": taken})
+        codes = [await bot.generate_unique_code() for _ in range(bot.CODE_SEQ_BLOCK + 1)]
+        assert taken not in codes
+        assert codes[0] == f"{bot.code_permute(1):07d}"
+        assert len(set(codes)) == len(codes)
+        await store.close()
+
+        # Qayta ishga tushgandan keyin yangi blok oldingilaridan keyin band qilinadi
+        monkeypatch.setattr(bot, "_code_block", [0, 0])
+        store = make_store()
+        monkeypatch.setattr(bot, "store", store)
+        assert await bot.generate_unique_code() == f"{bot.code_permute(2 * bot.CODE_SEQ_BLOCK):07d}"
+        await store.close()
+
+    asyncio.run(scenario())